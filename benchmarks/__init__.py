@@ -0,0 +1 @@
+"""Homie Discovery benchmarks"""
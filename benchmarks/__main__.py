@@ -0,0 +1,101 @@
+"""
+Benchmarks of Homie discovery on a synthetic fleet
+
+Run with `python -m benchmarks [--devices N] [--nodes N] [--properties N] [--single-subscription]
+[--retained-cache] [--scenario NAME] [--save FILE] [--compare FILE] [--threshold PERCENT]`
+
+With `--compare`, metrics are compared to a baseline saved with `--save` and the exit status is 1 if any regressed
+by more than the threshold.
+"""
+
+import argparse
+import json
+import sys
+
+from .fleet import Fleet
+from .scenarios import (SCENARIOS, run_scenario)
+
+DEFAULT_THRESHOLD = 10  # percent
+
+# Metrics where a higher value is better, the others are better lower
+_HIGHER_IS_BETTER = ('messages_per_second',)
+_COMPARED = ('discovery_seconds', 'seconds', 'messages_per_second', 'latency_p50_us', 'latency_p90_us', 'latency_p99_us',
+             'peak_memory_bytes', 'subscribe_packets')
+
+
+def _regression(metric: str, baseline: float, value: float) -> float:
+    """Return how much worse `value` is than `baseline`, in percent."""
+    if not baseline:
+        return 0.0
+    change = (value - baseline) / baseline * 100
+    return -change if metric in _HIGHER_IS_BETTER else change
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Print the results against a baseline and return the regressed `(scenario, metric)`."""
+
+    regressions = []
+    for name, metrics in results.items():
+        baseline_metrics = baseline.get('results', {}).get(name)
+        if baseline_metrics is None:
+            print(f'{name}: not in baseline')
+            continue
+        print(name)
+        for metric in _COMPARED:
+            value, base = metrics.get(metric), baseline_metrics.get(metric)
+            if value is None or base is None:
+                continue
+            regression = _regression(metric, base, value)
+            flag = ' REGRESSION' if regression > threshold else ''
+            change = (value - base) / base * 100 if base else 0.0
+            print(f'  {metric}: {value:.6g} (baseline {base:.6g}, {change:+.1f}%){flag}')
+            if flag:
+                regressions.append((name, metric))
+    return regressions
+
+
+def main(argv) -> int:
+    """Run the benchmarks, print or save the results and compare them to a baseline."""
+
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__.split('\n\n')[0])
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--properties', type=int, default=5)
+    parser.add_argument('--single-subscription', action='store_true')
+    parser.add_argument('--retained-cache', action='store_true')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS))
+    parser.add_argument('--save', metavar='FILE')
+    parser.add_argument('--compare', metavar='FILE')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, metavar='PERCENT')
+    args = parser.parse_args(argv[1:])
+
+    fleet = Fleet(args.devices, args.nodes, args.properties)
+    configuration = {
+        'devices': args.devices,
+        'nodes': args.nodes,
+        'properties': args.properties,
+        'single_subscription': args.single_subscription,
+        'retained_cache': args.retained_cache,
+    }
+    results = {name: run_scenario(name, fleet, args.single_subscription, args.retained_cache) for name in args.scenario or SCENARIOS}
+
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump({'configuration': configuration, 'results': results}, baseline_file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get('configuration') != configuration:
+            print(f"Baseline configuration differs: {baseline.get('configuration')}")
+        return 1 if compare(results, baseline, args.threshold) else 0
+
+    for name, metrics in results.items():
+        print(name)
+        for metric, value in metrics.items():
+            print(f'  {metric}: {value:.6g}' if isinstance(value, float) else f'  {metric}: {value}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
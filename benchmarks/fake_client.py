@@ -0,0 +1,72 @@
+"""Fake paho MQTT client for benchmarks"""
+
+from collections import deque
+import threading
+import time
+
+from homie.local_broker import (LocalBroker, LocalClient, LocalMessage)
+
+
+class FakeClient(LocalClient):
+    """
+    Stand-in for `paho.mqtt.client.Client` connected to a `LocalBroker`, that feeds `MQTTWrapper._mqtt_on_message` directly
+
+    Messages are queued like on a network connection and delivered by `run`, which times every delivery.
+    Subscribing queues the matching retained messages of the broker.
+    """
+
+    def __init__(self, broker: LocalBroker=None):
+        super().__init__(LocalBroker() if broker is None else broker, 'benchmark')
+        self.subscribe_packets = 0
+        self.published = 0
+        self.latencies = list()
+        self.reconnected = threading.Event()
+        self._inbox = deque()
+
+    def reconnect(self) -> int:
+        """Reconnect, the broker forgot the subscriptions."""
+        result = super().reconnect()
+        self.reconnected.set()
+        return result
+
+    def drop_connection(self):
+        """Simulate a lost connection, the wrapper reconnects on a timer thread and sets `reconnected`."""
+        self.reconnected.clear()
+        self.broker._disconnect(self)
+        self._on_broker_disconnect(1)
+
+    def subscribe(self, topic, qos: int=0):
+        """Subscribe to one topic or a list of `(topic, qos)`, in one SUBSCRIBE packet."""
+        self.subscribe_packets += 1
+        return super().subscribe(topic, qos)
+
+    def publish(self, topic: str, payload=None, qos: int=0, retain: bool=False):
+        """Count and publish a message through the broker."""
+        self.published += 1
+        return super().publish(topic, payload, qos, retain)
+
+    def retain(self, topic: str, payload: str):
+        """Store a retained message on the broker."""
+        self.broker.publish(topic, payload, 1, True)
+
+    def feed(self, topic: str, payload: str, retain: bool=False):
+        """Publish a message on the broker, queued if it matches a subscription."""
+        self.broker.publish(topic, payload, 1, retain)
+
+    def run(self) -> int:
+        """Deliver the queued messages, including those queued while delivering, returns the count delivered."""
+        delivered = 0
+        inbox = self._inbox
+        latencies = self.latencies
+        on_message = self.on_message
+        clock = time.perf_counter
+        while inbox:
+            message = inbox.popleft()
+            start = clock()
+            on_message(self, None, message)
+            latencies.append(clock() - start)
+            delivered += 1
+        return delivered
+
+    def _deliver(self, message: LocalMessage):
+        self._inbox.append(message)
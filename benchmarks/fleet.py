@@ -0,0 +1,65 @@
+"""Synthetic Homie 2.0.1 fleet generator"""
+
+from homie.tools import constants
+
+NODE_TYPES = (constants.TYPE_SENSOR, constants.TYPE_SWITCH, constants.TYPE_LIGHT)
+
+
+class Fleet(object):
+    """A synthetic fleet of `devices` devices with `nodes` nodes of `properties` properties each"""
+
+    def __init__(self, devices: int, nodes: int, properties: int, prefix: str=constants.DEFAULT_DISCOVERY_PREFIX):
+        self.devices = devices
+        self.nodes = nodes
+        self.properties = properties
+        self.prefix = prefix
+
+    @property
+    def property_count(self) -> int:
+        """Return the number of properties of the fleet."""
+        return self.devices * self.nodes * self.properties
+
+    def device_ids(self):
+        """Yield the device IDs of the fleet."""
+        for device in range(self.devices):
+            yield f'device{device:05d}'
+
+    def device_messages(self, device_id: str):
+        """Yield the retained `(topic, payload)` messages of one device."""
+
+        base = f'{self.prefix}/{device_id}'
+        yield f'{base}/$homie', constants.HOMIE_SUPPORTED_VERSION
+        yield f'{base}/$name', f'Device {device_id}'
+        yield f'{base}/$localip', '192.168.1.10'
+        yield f'{base}/$mac', 'DE:AD:BE:EF:FE:ED'
+        yield f'{base}/$stats/uptime', '120'
+        yield f'{base}/$stats/signal', '80'
+        yield f'{base}/$stats/interval', '60'
+        yield f'{base}/$fw/name', 'synthetic-firmware'
+        yield f'{base}/$fw/version', '1.0.0'
+        yield f'{base}/$fw/checksum', '0123456789abcdef'
+        yield f'{base}/$implementation', 'benchmark'
+        yield f'{base}/$nodes', ','.join(f'node{node}' for node in range(self.nodes))
+        for node in range(self.nodes):
+            node_base = f'{base}/node{node}'
+            yield f'{node_base}/$type', NODE_TYPES[node % len(NODE_TYPES)]
+            yield f'{node_base}/$properties', ','.join(
+                f'property{prop}:settable' if prop % 2 else f'property{prop}' for prop in range(self.properties))
+            for prop in range(self.properties):
+                yield f'{node_base}/property{prop}', str(prop)
+        yield f'{base}/$online', 'true'
+
+    def retained_messages(self):
+        """Yield the retained `(topic, payload)` messages of the whole fleet."""
+        for device_id in self.device_ids():
+            yield from self.device_messages(device_id)
+
+    def telemetry(self, count: int):
+        """Yield `count` property state `(topic, payload)` messages spread over the fleet."""
+
+        device_ids = list(self.device_ids())
+        for index in range(count):
+            device_id = device_ids[index % self.devices]
+            node = (index // self.devices) % self.nodes
+            prop = (index // (self.devices * self.nodes)) % self.properties
+            yield f'{self.prefix}/{device_id}/node{node}/property{prop}', str(index % 100)
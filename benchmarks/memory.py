@@ -0,0 +1,59 @@
+"""
+Memory benchmark of the discovered Homie tree
+
+Run with `python -m benchmarks.memory [devices] [nodes per device] [properties per node]`
+"""
+
+import gc
+import sys
+import tracemalloc
+
+from homie import Homie
+from homie.paho_mqtt_client_manager import MQTTWrapper
+
+from .fake_client import FakeClient
+from .fleet import Fleet
+
+
+def measure(devices: int=100, nodes: int=4, properties: int=8) -> dict:
+    """Discover a synthetic fleet and return the memory held by the tree."""
+
+    fleet = Fleet(devices, nodes, properties)
+    client = FakeClient()
+    mqtt = MQTTWrapper(client)
+    client.connect()
+    homie = Homie(mqtt, single_subscription=True)
+    homie.start()
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+
+    for topic, payload in fleet.retained_messages():
+        client.feed(topic, payload)
+        client.run()
+    client.latencies.clear()
+
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    total = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    return {
+        'devices': devices,
+        'properties': fleet.property_count,
+        'discovered': sum(1 for device in homie.devices if device.is_setup),
+        'total_bytes': total,
+        'bytes_per_property': total / fleet.property_count,
+    }
+
+
+def main(argv):
+    """Print the memory benchmark results."""
+    result = measure(*(int(arg) for arg in argv[1:4]))
+    for key, value in result.items():
+        print(f'{key}: {value:.0f}' if isinstance(value, float) else f'{key}: {value}')
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,126 @@
+"""Benchmark scenarios of a synthetic fleet"""
+
+import gc
+import time
+import tracemalloc
+
+from homie import Homie
+from homie.paho_mqtt_client_manager import MQTTWrapper
+from homie.tools import STAGE_2
+
+from .fake_client import FakeClient
+from .fleet import Fleet
+
+RECONNECT_TIMEOUT = 10  # seconds
+
+
+class _Setup(object):
+    """A fake client, its wrapper and a Homie controller, recording when each device completes discovery."""
+
+    def __init__(self, fleet: Fleet, single_subscription: bool, retained_cache: bool):
+        self.fleet = fleet
+        self.client = FakeClient()
+        for topic, payload in fleet.retained_messages():
+            self.client.retain(topic, payload)
+        self.mqtt = MQTTWrapper(self.client, retained_cache=retained_cache)
+        self.homie = Homie(self.mqtt, single_subscription=single_subscription)
+        self.homie.set_on_device_discovery(self._on_device_discovery)
+        self.discovered_at = list()
+
+    def _on_device_discovery(self, homie_device, stage):
+        if stage == STAGE_2:
+            self.discovered_at.append(time.perf_counter())
+
+    def discover(self):
+        self.client.connect()
+        self.homie.start()
+        self.client.run()
+
+
+def _cold_setup(fleet: Fleet, single_subscription: bool, retained_cache: bool) -> _Setup:
+    return _Setup(fleet, single_subscription, retained_cache)
+
+
+def _cold_run(setup: _Setup, start: float) -> dict:
+    setup.discover()
+    return {
+        'discovered': len(setup.discovered_at),
+        'discovery_seconds': max(setup.discovered_at) - start if setup.discovered_at else None,
+    }
+
+
+def _discovered_setup(fleet: Fleet, single_subscription: bool, retained_cache: bool) -> _Setup:
+    setup = _Setup(fleet, single_subscription, retained_cache)
+    setup.discover()
+    return setup
+
+
+def _telemetry_run(setup: _Setup, start: float) -> dict:
+    for topic, payload in setup.fleet.telemetry(setup.fleet.property_count * 4):
+        setup.client.feed(topic, payload)
+    setup.client.run()
+    return {}
+
+
+def _reconnect_run(setup: _Setup, start: float) -> dict:
+    packets = setup.client.subscribe_packets
+    setup.client.drop_connection()
+    if not setup.client.reconnected.wait(RECONNECT_TIMEOUT):
+        raise Exception("Fake client did not reconnect")
+    setup.client.run()
+    return {'subscribe_packets': setup.client.subscribe_packets - packets}
+
+
+SCENARIOS = {
+    # Every device already retained on the broker when the controller starts
+    'cold_retained_storm': (_cold_setup, _cold_run),
+    # Property updates on a discovered fleet
+    'steady_telemetry': (_discovered_setup, _telemetry_run),
+    # Connection lost, resubscribe and redelivery of the retained messages
+    'reconnect_resubscribe': (_discovered_setup, _reconnect_run),
+}
+
+
+def _percentile(ordered: list, percent: float) -> float:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def run_scenario(name: str, fleet: Fleet, single_subscription: bool=False, retained_cache: bool=False) -> dict:
+    """
+    Run a scenario and return its metrics
+
+    The scenario runs twice, timed then under `tracemalloc` for the peak memory allocated while it runs
+    """
+
+    scenario_setup, scenario_run = SCENARIOS[name]
+
+    setup = scenario_setup(fleet, single_subscription, retained_cache)
+    setup.client.latencies.clear()
+    gc.collect()
+    start = time.perf_counter()
+    result = scenario_run(setup, start)
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(setup.client.latencies)
+    result.update({
+        'messages': len(latencies),
+        'seconds': elapsed,
+        'messages_per_second': len(latencies) / elapsed if elapsed else None,
+        'latency_p50_us': _percentile(latencies, 50) * 1e6 if latencies else None,
+        'latency_p90_us': _percentile(latencies, 90) * 1e6 if latencies else None,
+        'latency_p99_us': _percentile(latencies, 99) * 1e6 if latencies else None,
+        'latency_max_us': latencies[-1] * 1e6 if latencies else None,
+    })
+
+    setup = scenario_setup(fleet, single_subscription, retained_cache)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        scenario_run(setup, time.perf_counter())
+        result['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return result
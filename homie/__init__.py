@@ -1,3 +1,5 @@
 """Homie module"""
 
 from .homie import Homie
+from .async_homie import AsyncHomie
+from .sharding import (ShardCoordinator, ShardHomie)
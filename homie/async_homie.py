@@ -0,0 +1,140 @@
+""" Homie Discovery asyncio module """
+
+import asyncio
+import logging
+import attr
+
+from .homie import (Homie, DiscoveryStatus, DEFAULT_QUIET_PERIOD, DEFAULT_DISCOVERY_DEADLINE)
+from .paho_mqtt_client_manager import AsyncMQTTWrapper
+from .tools import STAGE_2
+
+
+DEFAULT_STREAM_SIZE = 100
+_POLL_INTERVAL = 0.05  # seconds
+_LOGGER = logging.getLogger(__name__)
+
+
+@attr.s(slots=True, frozen=True)
+class PropertyChange(object):
+    """Class to hold a change of state of a property."""
+
+    homie_property = attr.ib()
+    previous_state = attr.ib(type=str)
+    state = attr.ib(type=str)
+
+
+class PropertyChangeStream(object):
+    """
+    Async iterator of property state changes
+
+    Changes are kept in a bounded queue, when the consumer falls behind the oldest changes are dropped and counted in `dropped`
+    """
+
+    def __init__(self, homie, maxsize: int):
+        self._homie = homie
+        self._queue = asyncio.Queue(maxsize)
+        self._closed = False
+        self.dropped = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> PropertyChange:
+        if self._closed and self._queue.empty():
+            raise StopAsyncIteration
+        change = await self._queue.get()
+        if change is None:
+            raise StopAsyncIteration
+        return change
+
+    def close(self):
+        """Stop receiving changes, iteration ends once the queued changes are consumed."""
+        if not self._closed:
+            self._closed = True
+            self._homie._property_streams.remove(self)
+            self._put(None)
+
+    def _put(self, change):
+        if self._queue.full():
+            self._queue.get_nowait()
+            if not self.dropped:
+                _LOGGER.warning(f"Property change stream is full ({self._queue.maxsize}), dropping the oldest changes")
+            self.dropped += 1
+        self._queue.put_nowait(change)
+
+
+class AsyncHomie(Homie):
+    """
+    Homie Discovery controller for asyncio
+
+    Same discovery as `Homie`, with all callbacks running on the event loop of the `AsyncMQTTWrapper`.
+    Use `wait_for_device` to await the discovery of a device and `property_changes` to iterate property state changes.
+    Other keyword arguments are those of `Homie`.
+    """
+
+    def __init__(self, mqtt: AsyncMQTTWrapper, discovery_prefix: str=None, qos: int=None, STATE_UNKNOWN=None, single_subscription: bool=False,
+                 **kwargs):
+        super().__init__(mqtt, discovery_prefix, qos, STATE_UNKNOWN, single_subscription, **kwargs)
+        self._device_waiters = dict()
+        self._property_streams = list()
+
+    def _watch_property(self, homie_property):
+        homie_property._add_attribute_listener(self._on_property_state_change, '_state')
+        super()._watch_property(homie_property)
+
+    def _on_device_stage_change(self, homie_device, stage):
+        super()._on_device_stage_change(homie_device, stage)
+
+        waiters = self._device_waiters.get(homie_device.device_id)
+        if waiters:
+            for waiter in list(waiters):
+                wait_stage, future = waiter
+                if wait_stage <= stage:
+                    waiters.remove(waiter)
+                    if not future.done():
+                        future.set_result(homie_device)
+
+    def _on_property_state_change(self, homie_property, attribute_name, previous_state, state):
+        if self._property_streams:
+            change = PropertyChange(homie_property, previous_state, state)
+            for stream in self._property_streams:
+                stream._put(change)
+
+    async def wait_for_device(self, device_id: str, stage: int=STAGE_2, timeout: float=None):
+        """Wait for a device to reach a stage of discovery and return it, raises `asyncio.TimeoutError` after timeout."""
+
+        homie_device = self._homie_devices.get(device_id)
+        if homie_device is not None and homie_device.stage_of_discovery >= stage:
+            return homie_device
+
+        waiter = (stage, self.mqtt.loop.create_future())
+        self._device_waiters.setdefault(device_id, list()).append(waiter)
+        try:
+            return await asyncio.wait_for(waiter[1], timeout)
+        finally:
+            waiters = self._device_waiters.get(device_id)
+            if waiters is not None:
+                if waiter in waiters:
+                    waiters.remove(waiter)
+                if not waiters:
+                    del self._device_waiters[device_id]
+
+    async def wait_for_discovery(self, quiet_period: float=DEFAULT_QUIET_PERIOD, deadline: float=DEFAULT_DISCOVERY_DEADLINE) -> DiscoveryStatus:
+        """Wait until discovery has settled, see `discovery_status`, and return the status."""
+        while True:
+            status = self.discovery_status(quiet_period, deadline)
+            if status.settled:
+                return status
+            await asyncio.sleep(_POLL_INTERVAL)
+
+    def property_changes(self, maxsize: int=DEFAULT_STREAM_SIZE) -> PropertyChangeStream:
+        """
+        Return an async iterator of the state changes of all discovered properties
+
+        At most `maxsize` changes wait for the consumer, beyond that the oldest change is dropped
+        and counted in the `dropped` attribute of the iterator.
+        """
+
+        stream = PropertyChangeStream(self, maxsize)
+        self._property_streams.append(stream)
+        return stream
@@ -1,13 +1,46 @@
 """ Homie Discovery module """
 
 import logging
+import threading
+import time
+import attr
 
 from .paho_mqtt_client_manager import (MQTTWrapper, MessageCallbackType)
-from .tools import (constants, helpers, STAGE_1)
-from .models import (HomieDevice)
+from .tools import (constants, helpers, snapshot, CallbackExecutor, STAGE_0, STAGE_1, STAGE_2)
+from .tools.change_feed import (ChangeFeed, DEFAULT_WINDOW, DEFAULT_BATCH_SIZE)
+from .tools.state_store import NumericStateStore
+from .tools.converters import ConverterRegistry
+from .tools import entity_index
+from .tools.entity_index import EntityIndex
+from .tools import journal as journal_events
+from .tools.journal import Journal
+from .models import (HomieDevice, HomieNode)
 
 
+DEFAULT_MAX_UNROUTED = 10000  # messages
+DEFAULT_QUIET_PERIOD = 2.0  # seconds
+DEFAULT_DISCOVERY_DEADLINE = 60.0  # seconds
+SETTLED_COMPLETE = 'complete'
+SETTLED_QUIET = 'quiet'
+SETTLED_DEADLINE = 'deadline'
+_POLL_INTERVAL = 0.05  # seconds
+_SNAPSHOT_RETRIES = 5
+_COUNTERS = ('property_parse_failures', 'dropped_unrouted_messages')
+_DISCOVERY_TOPICS = ('/$nodes', '/$properties')
 _LOGGER = logging.getLogger(__name__)
+_DEVICE_ATTRIBUTES = [handler.attribute_name for handler in HomieDevice._ATTRIBUTE_HANDLERS.values()]
+
+
+@attr.s(slots=True, frozen=True)
+class DiscoveryStatus(object):
+    """Class to hold the progress of discovery."""
+
+    settled = attr.ib(type=bool)
+    reason = attr.ib(type=str)  # SETTLED_COMPLETE, SETTLED_QUIET, SETTLED_DEADLINE or None
+    devices = attr.ib(type=int)
+    ready_devices = attr.ib(type=int)
+    quiet_seconds = attr.ib(type=float)
+    stuck_devices = attr.ib(type=dict)  # device ID -> stage of discovery
 
 
 class Homie(object):
@@ -15,9 +48,42 @@ class Homie(object):
     Homie Discovery controller class
 
     Use `start` to start the discovery proccess
+
+    With `single_subscription` the whole discovery prefix is subscribed to once (`<discovery_prefix>/#`)
+    and messages are routed to devices, nodes and properties by dict lookups on the split topic,
+    instead of every device and node holding its own broker subscriptions.
+    Messages of entities not discovered yet are kept until they are, up to `max_unrouted` messages,
+    the devices buffered first are dropped beyond that. Devices with an unsupported `$homie` version aren't buffered.
+    A device announced again after its messages were dropped or it was evicted is subscribed to on its own
+    until it is discovered, for the broker to send its retained messages again.
+
+    With an `executor`, discovery listeners and attribute listeners added to entities run on the executor's threads,
+    in order for each device, instead of on the MQTT network thread.
+
+    With a `state_store`, every numeric property state received is recorded in it, see `NumericStateStore`.
+
+    Property states are converted to typed values once when received, by the converters chosen by `converters`,
+    see `ConverterRegistry`.
+
+    `find_devices`, `find_nodes`, `find_properties` and `get_entity` answer from indexes kept up to date as attributes change,
+    built on their first use.
+
+    Devices, nodes and properties by discovery stage are reported to the `Metrics` of the MQTT wrapper, if any.
+
+    A device is evicted when its `$homie` retained message is cleared and, with an `offline_ttl` (seconds),
+    once it stays offline longer than that. Offline devices are checked every `offline_ttl / 2` seconds on a timer thread.
+    Eviction removes its subscriptions and everything known about it, then calls the listener set with `set_on_device_removed`.
+
+    `discovery_status` and `wait_for_discovery` tell when discovery has settled after `start`, for startup barriers
+    and readiness probes.
+
+    With a `journal`, discovery stage changes, property state changes and evictions are appended to it,
+    consumers attached with `attach_journal` catch up on what they missed, see `Journal`.
     """
 
-    def __init__(self, mqtt: MQTTWrapper, discovery_prefix: str=None, qos: int=None, STATE_UNKNOWN=None):
+    def __init__(self, mqtt: MQTTWrapper, discovery_prefix: str=None, qos: int=None, STATE_UNKNOWN=None, single_subscription: bool=False,
+                 executor: CallbackExecutor=None, state_store: NumericStateStore=None, converters: ConverterRegistry=None,
+                 offline_ttl: float=None, journal: Journal=None, max_unrouted: int=DEFAULT_MAX_UNROUTED):
         super().__init__()
         self.mqtt = mqtt
         self.discovery_prefix = discovery_prefix or constants.DEFAULT_DISCOVERY_PREFIX
@@ -27,45 +93,399 @@ class Homie(object):
         self._on_device_discovery = None
         self._on_node_discovery = None
         self._on_property_discovery = None
+        self._on_device_removed = None
+        self._executor = executor
+        self.state_store = state_store
+        self.converters = converters or ConverterRegistry()
+        self._change_feeds = list()
+        self._watching_changes = False
+        self._index = None
+        self.journal = journal
+
+        self._single_subscription = single_subscription
+        self._routes = dict()
+        self._unrouted = dict()
+        self._unrouted_count = 0
+        self.max_unrouted = max_unrouted
+        self.dropped_unrouted = 0
+        self._unsupported_devices = set()
+        # Devices whose messages were dropped, and their subscriptions refreshing them
+        self._stale_devices = set()
+        self._refreshing = dict()  # type: Dict[str, Callable[[], None]]
+        self._device_subscriptions = dict()  # type: Dict[str, Dict[Callable[[], None], str]]
+
+        self.offline_ttl = offline_ttl
+        self._offline_since = dict()  # type: Dict[str, float]
+        self._eviction_timer = None
+        # Held while devices are added or evicted, eviction also runs on the timer thread
+        self._lock = threading.RLock()
+
+        self._ready_devices = 0
+        self._started_at = None
+        self._last_discovery_message = None
 
         if STATE_UNKNOWN is not None:
             constants.set_state_unknown(STATE_UNKNOWN)
 
+        self.mqtt.metrics.add_collector(self._collect_metrics, _COUNTERS)
+
     def _subscribe(self, topic: str, msg_callback: MessageCallbackType, qos: int=None):
-        self.mqtt.subscribe(topic, msg_callback, qos or self.qos)
+        remove, _ = self.mqtt.subscribe(topic, msg_callback, qos or self.qos)
+        return remove
+
+    def _device_subscribe(self, device_id: str, subscribe=None):
+        """Return the subscribe function of a device, keeping the remove handles of its subscriptions."""
+        removes = self._device_subscriptions.setdefault(device_id, dict())  # remove handle -> topic
+        if subscribe is None:
+            subscribe = self._add_route if self._single_subscription else self._subscribe
+
+        def subscribe_for_device(topic: str, msg_callback: MessageCallbackType, qos: int=None):
+            if topic.endswith(_DISCOVERY_TOPICS):
+                msg_callback = self._discovery_message_callback(msg_callback)
+            with self._lock:
+                remove = subscribe(topic, msg_callback, qos)
+                if self._device_subscriptions.get(device_id) is not removes:
+                    # The device was evicted meanwhile, nothing would remove the subscription later
+                    remove()
+                    return lambda: None
+                removes[remove] = topic
+
+            def remove_for_device():
+                # Either by the entity that subscribed or on eviction of the device, once
+                with self._lock:
+                    if removes.pop(remove, None) is None:
+                        return
+                remove()
+            return remove_for_device
+        return subscribe_for_device
+
+    def _discovery_message_callback(self, msg_callback: MessageCallbackType) -> MessageCallbackType:
+        def on_discovery_message(topic: str, payload: str, msg_qos: int):
+            self._last_discovery_message = time.monotonic()
+            msg_callback(topic, payload, msg_qos)
+        return on_discovery_message
 
     def _publish(self, topic: str, payload: str, retain: bool=True, qos: int=None):
         self.mqtt.publish(topic, payload, qos or self.qos, retain)
 
     def _discover_devices(self):
-        def _on_discovery_device(topic: str, payload: str, msg_qos: int):
-            supported, device_base_topic, device_id = helpers.proccess_device(topic, payload)
-            if supported and device_id not in self._homie_devices:
-                homie_device = HomieDevice(device_base_topic, device_id)
-                homie_device.add_on_discovery_stage_change(self._on_device_stage_change)
-                homie_device.setup(self._subscribe, self._publish)
-                self._homie_devices[device_id] = homie_device
+        if self._single_subscription:
+            self._subscribe(f'{self.discovery_prefix}/#', self._route_message, self.qos)
+        else:
+            self._subscribe(f'{self.discovery_prefix}/+/$homie', self._on_discovery_device, self.qos)
 
-        self._subscribe(f'{self.discovery_prefix}/+/$homie', _on_discovery_device, self.qos)
+    def _on_discovery_device(self, topic: str, payload: str, msg_qos: int):
+        self._last_discovery_message = time.monotonic()
+        with self._lock:
+            self._discover_device(topic, payload)
+
+    def _discover_device(self, topic: str, payload: str):
+        if payload == '':
+            # Retained message cleared, the device is gone
+            device_match = constants.DISCOVER_DEVICE_FROM_TOPIC.match(topic)
+            if device_match:
+                self.evict_device(device_match.group('device_id'))
+            return
+
+        supported, device_base_topic, device_id = helpers.proccess_device(topic, payload)
+        if not supported:
+            device_match = constants.DISCOVER_DEVICE_FROM_TOPIC.match(topic)
+            if device_match:
+                self._unsupported_devices.add(device_match.group('device_id'))
+                self._pop_unrouted(device_match.group('device_id'))
+        elif device_id not in self._homie_devices:
+            self._unsupported_devices.discard(device_id)
+            self._add_device(HomieDevice(device_base_topic, device_id))
+
+    def _attach_device(self, homie_device: HomieDevice):
+        # Set before anything is received or restored, so states get converted and recorded when received
+        homie_device._callback_executor = self._executor
+        homie_device._state_store = self.state_store
+        homie_device._converters = self.converters
+        homie_device._on_retire = self._on_entity_retired
+        homie_device._on_added = self._on_entity_added
+
+    def _add_device(self, homie_device: HomieDevice):
+        self._attach_device(homie_device)
+        if self._watching_changes:
+            homie_device._add_attribute_listener(self._on_entity_change, _DEVICE_ATTRIBUTES)
+        if self._index is not None:
+            self._index_device(homie_device)
+        homie_device.add_on_discovery_stage_change(self._on_device_stage_change)
+        if self.journal is not None:
+            self.journal.append(journal_events.EVENT_DEVICE_STAGE, homie_device, None, homie_device.stage_of_discovery)
+        if self.offline_ttl is not None:
+            homie_device._add_attribute_listener(self._on_device_online_change, '_online')
+            self._on_device_online_change(homie_device)
+        self._homie_devices[homie_device.device_id] = homie_device
+        homie_device.setup(self._device_subscribe(homie_device.device_id), self._publish)
+        if self._single_subscription:
+            self._replay_unrouted(homie_device.device_id)
+            if homie_device.device_id in self._stale_devices:
+                self._refresh_device(homie_device)
+
+    def _refresh_device(self, homie_device: HomieDevice):
+        # Messages of the device seen before are gone, subscribing again gets the retained ones, from the cache if any
+        device_id = homie_device.device_id
+        self._stale_devices.discard(device_id)
+        remove = self._device_subscribe(device_id, self._subscribe)(f'{self.discovery_prefix}/{device_id}/#', self._route_message)
+        if homie_device.stage_of_discovery == STAGE_2:
+            remove()
+        else:
+            # Removed once the device is discovered
+            self._refreshing[device_id] = remove
+
+    def _add_route(self, topic: str, msg_callback: MessageCallbackType, qos: int=None):
+        # Device wide subscriptions (`<device>/#`) are already served by the device lookup in `_route_message`
+        if topic.endswith('#'):
+            return lambda: None
+        self._routes[topic] = msg_callback
+
+        def remove():
+            if self._routes.get(topic) is msg_callback:
+                del self._routes[topic]
+        return remove
+
+    def _route_message(self, topic: str, payload: str, msg_qos: int):
+        levels = topic[len(self.discovery_prefix) + 1:].split('/')
+        if len(levels) < 2:
+            return None
+        device_id = levels[0]
+
+        if len(levels) == 2 and levels[1] == '$homie':
+            self._on_discovery_device(topic, payload, msg_qos)
+            if payload == '':
+                return None
+
+        route = self._routes.get(topic)
+        if route is not None:
+            route(topic, payload, msg_qos)
+
+        homie_device = self._homie_devices.get(device_id)
+        if homie_device is not None and homie_device._route(levels, 1, payload, msg_qos):
+            if route is not None:
+                # New nodes or properties may have been discovered
+                self._replay_unrouted(device_id)
+            return None
+
+        # Keep the latest message of entities not discovered yet, retained messages don't arrive in discovery order
+        if device_id in self._unsupported_devices or not constants.DEVICE_ID.fullmatch(device_id):
+            return None
+        with self._lock:
+            unrouted = self._unrouted.get(device_id)
+            if unrouted is None or topic not in unrouted:
+                if self._unrouted_count >= self.max_unrouted and self._unrouted:
+                    self._drop_unrouted()
+                    unrouted = self._unrouted.get(device_id)
+                if unrouted is None:
+                    unrouted = self._unrouted[device_id] = dict()
+                self._unrouted_count += 1
+            unrouted[topic] = (payload, msg_qos)
+
+    def _drop_unrouted(self):
+        # The device buffered first
+        oldest_device_id = next(iter(self._unrouted))
+        dropped = self._pop_unrouted(oldest_device_id)
+        self._stale_devices.add(oldest_device_id)
+        self.dropped_unrouted += len(dropped)
+        _LOGGER.debug(f"Too many messages of undiscovered entities, dropping the {len(dropped)} of {oldest_device_id}")
+
+    def _pop_unrouted(self, device_id: str) -> dict:
+        unrouted = self._unrouted.pop(device_id, None)
+        if unrouted:
+            self._unrouted_count -= len(unrouted)
+        return unrouted
+
+    def _replay_unrouted(self, device_id: str):
+        with self._lock:
+            unrouted = self._pop_unrouted(device_id)
+        if unrouted:
+            for topic, (payload, msg_qos) in unrouted.items():
+                self._route_message(topic, payload, msg_qos)
 
     def _on_device_stage_change(self, homie_device, state):
+        if self.journal is not None:
+            self.journal.append(journal_events.EVENT_DEVICE_STAGE, homie_device, None, state)
+        if state == STAGE_2:
+            with self._lock:
+                self._ready_devices += 1
+                refreshing = self._refreshing.pop(homie_device.device_id, None)
+            if refreshing is not None:
+                refreshing()
         if state == STAGE_1:
             for homie_node in homie_device.nodes:
-                def _on_node_ready(homie_node, stage):
-                    if self._on_node_discovery:
-                        self._on_node_discovery(homie_node, stage)
-                homie_node.add_on_discovery_stage_change(_on_node_ready)
-                _on_node_ready(homie_node, homie_node.stage_of_discovery)
-
+                self._watch_node(homie_node)
                 for homie_property in homie_node.properties:
-                    def _on_property_ready(homie_property, stage):
-                        if self._on_property_discovery:
-                            self._on_property_discovery(homie_property, stage)
-                    homie_property.add_on_discovery_stage_change(_on_property_ready)
-                    _on_property_ready(homie_property, homie_property.stage_of_discovery)
+                    self._watch_property(homie_property)
 
         if self._on_device_discovery:
-            self._on_device_discovery(homie_device, state)
+            self._call_listener(homie_device, self._on_device_discovery, homie_device, state)
+
+    def _watch_node(self, homie_node):
+        if self._index is not None:
+            self._index_node(homie_node)
+        homie_node.add_on_discovery_stage_change(self._on_node_stage_change)
+        self._on_node_stage_change(homie_node, homie_node.stage_of_discovery)
+
+    def _watch_property(self, homie_property):
+        if self._index is not None:
+            self._index_property(homie_property)
+        homie_property.add_on_discovery_stage_change(self._on_property_stage_change)
+        self._on_property_stage_change(homie_property, homie_property.stage_of_discovery)
+        if self._watching_changes:
+            homie_property._add_attribute_listener(self._on_entity_change, '_state')
+        if self.journal is not None:
+            homie_property._add_attribute_listener(self._on_journal_state_change, '_state')
+
+    def _on_node_stage_change(self, homie_node, stage):
+        if self.journal is not None:
+            self.journal.append(journal_events.EVENT_NODE_STAGE, homie_node, None, stage)
+        if self._on_node_discovery:
+            self._call_listener(homie_node.device, self._on_node_discovery, homie_node, stage)
+
+    def _on_property_stage_change(self, homie_property, stage):
+        if self.journal is not None:
+            self.journal.append(journal_events.EVENT_PROPERTY_STAGE, homie_property, None, stage)
+        if self._on_property_discovery:
+            self._call_listener(homie_property.node.device, self._on_property_discovery, homie_property, stage)
+
+    def _on_journal_state_change(self, homie_property, attribute_name, previous_value, value):
+        self.journal.append(journal_events.EVENT_PROPERTY_STATE, homie_property, previous_value, value)
+
+    def _on_entity_change(self, entity, attribute_name, previous_value, value):
+        attribute = attribute_name[1:]
+        for change_feed in self._change_feeds:
+            change_feed.add(entity, attribute, previous_value, value)
+
+    def _on_device_online_change(self, homie_device, attribute_name=None, previous_value=None, value=None):
+        with self._lock:
+            if homie_device.online:
+                self._offline_since.pop(homie_device.device_id, None)
+            else:
+                self._offline_since.setdefault(homie_device.device_id, time.monotonic())
+
+    def _schedule_eviction(self):
+        self._eviction_timer = threading.Timer(self.offline_ttl / 2, self._on_eviction_timer)
+        self._eviction_timer.daemon = True
+        self._eviction_timer.start()
+
+    def _on_eviction_timer(self):
+        try:
+            self.evict_offline_devices()
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Error evicting offline devices")
+        self._schedule_eviction()
+
+    def evict_offline_devices(self, ttl: float=None) -> list:
+        """Evict the devices offline for longer than `ttl` seconds, `offline_ttl` by default, and return their IDs."""
+        cutoff = time.monotonic() - (self.offline_ttl if ttl is None else ttl)
+        with self._lock:
+            device_ids = [device_id for device_id, since in self._offline_since.items() if since <= cutoff]
+        for device_id in device_ids:
+            self.evict_device(device_id)
+        return device_ids
+
+    def evict_device(self, device_id: str):
+        """Forget a device: remove its subscriptions, routes, indexes and stored states, then notify the removal listener."""
+        with self._lock:
+            homie_device = self._homie_devices.pop(device_id, None)
+            self._offline_since.pop(device_id, None)
+            self._pop_unrouted(device_id)
+            self._refreshing.pop(device_id, None)
+            if self._single_subscription and homie_device is not None:
+                self._stale_devices.add(device_id)
+            # Latest first and a `#` of the device last, after the subscriptions it covers
+            removes = reversed(list(self._device_subscriptions.pop(device_id, dict()).items()))
+            for remove, _ in sorted(removes, key=lambda remove_topic: remove_topic[1].endswith('#')):
+                remove()
+            if homie_device is None:
+                return
+
+            _LOGGER.info(f"Homie Device Evicted. ID: {device_id}")
+            if homie_device.stage_of_discovery == STAGE_2:
+                self._ready_devices -= 1
+            if self._index is not None:
+                self._index.remove_device(homie_device)
+            if self.state_store is not None:
+                self.state_store.remove([homie_property for homie_node in homie_device.nodes for homie_property in homie_node.properties])
+            if self.journal is not None:
+                self.journal.append(journal_events.EVENT_DEVICE_REMOVED, homie_device, None, None)
+        # Outside of the lock, the listener may take its time
+        if self._on_device_removed:
+            self._call_listener(homie_device, self._on_device_removed, homie_device)
+
+    def _on_entity_added(self, entity):
+        """A node or a property added to the `$nodes` or `$properties` of its parent after the device reached stage 1"""
+        if isinstance(entity, HomieNode):
+            self._watch_node(entity)
+        else:
+            self._watch_property(entity)
+
+    def _on_entity_retired(self, entity):
+        """A node or a property removed from the `$nodes` or `$properties` of its parent"""
+        if isinstance(entity, HomieNode):
+            homie_properties = list(entity.properties)
+            if self._index is not None:
+                self._index.remove_node(entity)
+        else:
+            homie_properties = [entity]
+            if self._index is not None:
+                self._index.remove_property(entity)
+        if self.state_store is not None:
+            self.state_store.remove(homie_properties)
+        if self.journal is not None:
+            kind = journal_events.EVENT_NODE_REMOVED if isinstance(entity, HomieNode) else journal_events.EVENT_PROPERTY_REMOVED
+            self.journal.append(kind, entity, None, None)
+
+    def _index_device(self, homie_device):
+        self._index.add_device(homie_device)
+        homie_device._add_attribute_listener(self._index.on_attribute_change, entity_index.DEVICE_ATTRIBUTES)
+
+    def _index_node(self, homie_node):
+        self._index.add_node(homie_node)
+        homie_node._add_attribute_listener(self._index.on_attribute_change, entity_index.NODE_ATTRIBUTES)
+
+    def _index_property(self, homie_property):
+        self._index.add_property(homie_property)
+        homie_property._add_attribute_listener(self._index.on_attribute_change, entity_index.PROPERTY_ATTRIBUTES)
+
+    def _index_nodes(self, homie_device):
+        for homie_node in homie_device.nodes:
+            self._index_node(homie_node)
+            for homie_property in homie_node.properties:
+                self._index_property(homie_property)
+
+    def _get_index(self) -> EntityIndex:
+        if self._index is None:
+            self._index = EntityIndex()
+            for homie_device in list(self._homie_devices.values()):
+                self._index_device(homie_device)
+                if homie_device.stage_of_discovery >= STAGE_1:
+                    self._index_nodes(homie_device)
+        return self._index
+
+    def _find(self, criteria: dict, entities):
+        criteria = {index: key for index, key in criteria.items() if key is not None}
+        if not criteria:
+            return list(entities)
+        return self._get_index().find(criteria)
+
+    def _collect_metrics(self) -> dict:
+        devices, nodes, properties = ({stage: 0 for stage in (STAGE_0, STAGE_1, STAGE_2)} for _ in range(3))
+        for homie_device in list(self._homie_devices.values()):
+            devices[homie_device.stage_of_discovery] += 1
+            for homie_node in list(homie_device.nodes):
+                nodes[homie_node.stage_of_discovery] += 1
+                for homie_property in list(homie_node.properties):
+                    properties[homie_property.stage_of_discovery] += 1
+        return {'devices': devices, 'nodes': nodes, 'properties': properties, 'property_parse_failures': self.converters.parse_failures,
+                'unrouted_messages': self._unrouted_count, 'dropped_unrouted_messages': self.dropped_unrouted}
+
+    def _call_listener(self, homie_device, listener, *args):
+        if self._executor is None:
+            listener(*args)
+        else:
+            self._executor.submit(homie_device, listener, *args)
 
     @property
     def devices(self):
@@ -80,10 +500,154 @@ class Homie(object):
         """Return True if specific Device exists in the Homie Network."""
         return device_id in self._homie_devices
 
+    def get_entity(self, entity_id: str):
+        """Return the discovered device, node or property of an entity ID, None if there is none."""
+        return self._get_index().get_entity(entity_id)
+
+    def find_devices(self, online: bool=None, firmware_name: str=None, firmware_version: str=None) -> list:
+        """Return the devices matching all the given criteria."""
+        return self._find({
+            entity_index.INDEX_ONLINE: online,
+            entity_index.INDEX_FIRMWARE_NAME: firmware_name,
+            entity_index.INDEX_FIRMWARE_VERSION: firmware_version,
+        }, self._homie_devices.values())
+
+    def find_nodes(self, node_type: str=None) -> list:
+        """Return the nodes of devices past discovery of their nodes, of a type if given."""
+        if node_type is None:
+            return [homie_node for homie_device in list(self._homie_devices.values())
+                    if homie_device.stage_of_discovery >= STAGE_1 for homie_node in homie_device.nodes]
+        return self._find({entity_index.INDEX_NODE_TYPE: node_type}, ())
+
+    def find_properties(self, property_id: str=None, settable: bool=None) -> list:
+        """Return the properties of devices past discovery of their nodes, matching all the given criteria."""
+        if property_id is None and settable is None:
+            return [homie_property for homie_node in self.find_nodes() for homie_property in homie_node.properties]
+        return self._find({entity_index.INDEX_PROPERTY_ID: property_id, entity_index.INDEX_SETTABLE: settable}, ())
+
     def start(self):
         """Start the discovery proccess of a homie network"""
         _LOGGER.info(f"Homie has started discovering devices at {self.discovery_prefix}")
+        self._started_at = self._last_discovery_message = time.monotonic()
         self._discover_devices()
+        if self.offline_ttl is not None and self._eviction_timer is None:
+            self._schedule_eviction()
+
+    def discovery_status(self, quiet_period: float=DEFAULT_QUIET_PERIOD, deadline: float=DEFAULT_DISCOVERY_DEADLINE) -> DiscoveryStatus:
+        """
+        Return whether discovery has settled since `start`
+
+        Discovery is settled once every device seen has reached STAGE_2, once no `$homie`, `$nodes` or `$properties`
+        message arrived for `quiet_period` seconds, or `deadline` seconds after `start`.
+        Devices below STAGE_2 are reported as stuck with their stage.
+        """
+        if self._started_at is None:
+            raise Exception("Homie discovery has not been started")
+
+        now = time.monotonic()
+        devices = len(self._homie_devices)
+        ready_devices = self._ready_devices
+        quiet_seconds = now - self._last_discovery_message
+        if devices and ready_devices >= devices:
+            reason = SETTLED_COMPLETE
+        elif quiet_seconds >= quiet_period:
+            reason = SETTLED_QUIET
+        elif now - self._started_at >= deadline:
+            reason = SETTLED_DEADLINE
+        else:
+            reason = None
+
+        stuck_devices = dict()
+        if reason is not None and reason != SETTLED_COMPLETE:
+            stuck_devices = {homie_device.device_id: homie_device.stage_of_discovery
+                             for homie_device in list(self._homie_devices.values()) if homie_device.stage_of_discovery < STAGE_2}
+        return DiscoveryStatus(reason is not None, reason, devices, ready_devices, quiet_seconds, stuck_devices)
+
+    def wait_for_discovery(self, quiet_period: float=DEFAULT_QUIET_PERIOD, deadline: float=DEFAULT_DISCOVERY_DEADLINE) -> DiscoveryStatus:
+        """Block until discovery has settled, see `discovery_status`, and return the status."""
+        while True:
+            status = self.discovery_status(quiet_period, deadline)
+            if status.settled:
+                return status
+            time.sleep(_POLL_INTERVAL)
+
+    def attach_journal(self, on_event, from_sequence: int=None, on_snapshot=None) -> bool:
+        """
+        Deliver the journal events from `from_sequence` on to `on_event`, then every new event
+
+        When those events are no longer in the journal, `on_snapshot(device_snapshots, sequence)` gets the devices
+        as saved by `save_snapshot` instead, followed by the events after `sequence`, and False is returned.
+        Events may be delivered once more if they happen while the snapshot is taken.
+        """
+        if self.journal is None:
+            raise Exception("Homie has no journal")
+
+        def on_gap(sequence: int):
+            on_snapshot(self._snapshot_devices(), sequence)
+        return self.journal.attach(on_event, from_sequence, None if on_snapshot is None else on_gap)
+
+    def detach_journal(self, on_event):
+        """Stop delivering journal events to `on_event`."""
+        self.journal.detach(on_event)
+
+    def save_snapshot(self, path: str):
+        """Save the discovered devices, nodes and properties with their attributes and states to a snapshot file."""
+        snapshot.save_snapshot(path, self._snapshot_devices())
+
+    def _snapshot_devices(self) -> list:
+        # Discovery keeps running on the MQTT thread, retry if a device changed while copying it
+        device_snapshots = []
+        for homie_device in list(self._homie_devices.values()):
+            for _ in range(_SNAPSHOT_RETRIES):
+                try:
+                    device_snapshots.append(homie_device._snapshot())
+                    break
+                except RuntimeError:
+                    continue
+            else:
+                raise Exception(f"Homie device {homie_device.device_id} kept changing while taking its snapshot")
+        return device_snapshots
+
+    def load_snapshot(self, path: str):
+        """
+        Load devices from a snapshot file saved by `save_snapshot`
+
+        Loaded devices are available straight away, live messages then update them.
+        Load the snapshot before `start` so discovery listeners see the loaded devices.
+        """
+        for device_snapshot in snapshot.load_snapshot(path):
+            with self._lock:
+                if device_snapshot['id'] not in self._homie_devices:
+                    homie_device = HomieDevice(device_snapshot['base_topic'], device_snapshot['id'])
+                    self._attach_device(homie_device)
+                    # Restored states are not recorded, they are not from now
+                    homie_device._state_store = None
+                    homie_device._restore(device_snapshot)
+                    self._add_device(homie_device)
+
+    def add_change_feed(self, on_batch, window: float=DEFAULT_WINDOW, batch_size: int=DEFAULT_BATCH_SIZE) -> ChangeFeed:
+        """
+        Deliver changes of property states and device attributes in batches to `on_batch`
+
+        Changes are coalesced per entity and attribute and flushed every `window` seconds or once a batch holds `batch_size` changes.
+        """
+        if not self._watching_changes:
+            self._watching_changes = True
+            for homie_device in self._homie_devices.values():
+                homie_device._add_attribute_listener(self._on_entity_change, _DEVICE_ATTRIBUTES)
+                if homie_device.stage_of_discovery >= STAGE_1:
+                    for homie_node in homie_device.nodes:
+                        for homie_property in homie_node.properties:
+                            homie_property._add_attribute_listener(self._on_entity_change, '_state')
+
+        change_feed = ChangeFeed(on_batch, window, batch_size)
+        self._change_feeds.append(change_feed)
+        return change_feed
+
+    def remove_change_feed(self, change_feed: ChangeFeed):
+        """Stop a change feed, pending changes are delivered first."""
+        self._change_feeds.remove(change_feed)
+        change_feed.flush()
 
     def set_on_device_discovery(self, on_device_discovery):
         """ Set Listner for when a device has been discovered"""
@@ -96,3 +660,7 @@ class Homie(object):
     def set_on_property_discovery(self, on_property_discovery):
         """ Set Listner for when a property has been discovered"""
         self._on_property_discovery = on_property_discovery
+
+    def set_on_device_removed(self, on_device_removed):
+        """ Set Listner for when a device has been evicted"""
+        self._on_device_removed = on_device_removed
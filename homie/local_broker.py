@@ -0,0 +1,230 @@
+"""In-process MQTT broker stand-in module"""
+
+# Imports
+import logging
+import threading
+from typing import Union
+import attr
+
+from .paho_mqtt_client_manager import (PublishPayloadType, RetainedCache, Subscription, SubscriptionTrie)
+
+
+# Consts
+MQTT_ERR_SUCCESS = 0
+MQTT_ERR_NO_CONN = 4
+_LOGGER = logging.getLogger(__name__)
+
+
+@attr.s(slots=True, frozen=True)
+class LocalMessage(object):
+    """Class to hold a message delivered by the local broker, like `paho.mqtt.client.MQTTMessage`."""
+
+    topic = attr.ib(type=str)
+    payload = attr.ib(type=bytes)
+    qos = attr.ib(type=int, default=0)
+    retain = attr.ib(type=bool, default=False)
+    mid = attr.ib(type=int, default=0)
+
+
+class LocalBroker(object):
+    """
+    In-process MQTT broker stand-in
+
+    Keeps retained messages and delivers published messages synchronously to the matching `LocalClient`s.
+    Subscriptions and retained messages are indexed by topic level, so it keeps up with large fleets.
+    Use `stop` and `start` to simulate a broker restart.
+    """
+
+    def __init__(self):
+        self.running = True
+        self._lock = threading.RLock()
+        self._clients = dict()  # type: Dict[LocalClient, Dict[str, int]]
+        self._tries = dict()  # type: Dict[LocalClient, SubscriptionTrie]
+        self._retained = dict()  # type: Dict[str, LocalMessage]
+        self._retained_index = RetainedCache()
+        # Retained messages are sent in the order their topics were first retained
+        self._retained_order = dict()  # type: Dict[str, int]
+        self._retained_count = 0
+
+    @property
+    def retained(self):
+        """Return the retained messages by topic."""
+        return self._retained
+
+    def stop(self):
+        """Stop the broker, all clients are disconnected."""
+        with self._lock:
+            self.running = False
+            clients = list(self._clients)
+            self._clients.clear()
+            self._tries.clear()
+        for client in clients:
+            client._on_broker_disconnect(1)
+
+    def start(self):
+        """Start the broker again, clients are free to reconnect."""
+        self.running = True
+
+    def publish(self, topic: str, payload: PublishPayloadType=None, qos: int=0, retain: bool=False):
+        """Publish a message to all matching clients."""
+        payload = _encode_payload(payload)
+        with self._lock:
+            if retain:
+                if payload:
+                    self._retained[topic] = self._retained_index.store(LocalMessage(topic, payload, qos, True)).message
+                    if topic not in self._retained_order:
+                        self._retained_order[topic] = self._retained_count
+                        self._retained_count += 1
+                elif self._retained.pop(topic, None) is not None:
+                    self._retained_index.remove(topic)
+                    del self._retained_order[topic]
+            targets = []
+            for client, trie in self._tries.items():
+                granted = [subscription.qos for subscription in trie.match(topic)]
+                if granted:
+                    targets.append((client, min(qos, max(granted))))
+
+        for client, client_qos in targets:
+            client._deliver(LocalMessage(topic, payload, client_qos, False))
+
+    def _connect(self, client) -> bool:
+        with self._lock:
+            if not self.running:
+                return False
+            self._clients[client] = dict()
+            self._tries[client] = SubscriptionTrie()
+            return True
+
+    def _disconnect(self, client):
+        with self._lock:
+            self._clients.pop(client, None)
+            self._tries.pop(client, None)
+
+    def _subscribe(self, client, topics: list):
+        with self._lock:
+            filters = self._clients.get(client)
+            if filters is None:
+                return False
+            trie = self._tries[client]
+            retained = []
+            for topic_filter, qos in topics:
+                previous_qos = filters.get(topic_filter)
+                if previous_qos is not None:
+                    trie.remove(Subscription(topic_filter, None, previous_qos))
+                filters[topic_filter] = qos
+                trie.add(Subscription(topic_filter, None, qos))
+                messages = sorted((entry.message for entry in self._retained_index.match(topic_filter)),
+                                  key=lambda message: self._retained_order[message.topic])
+                retained.extend(LocalMessage(message.topic, message.payload, min(qos, message.qos), True) for message in messages)
+
+        for message in retained:
+            client._deliver(message)
+        return True
+
+    def _unsubscribe(self, client, topics: list):
+        with self._lock:
+            filters = self._clients.get(client)
+            if filters is None:
+                return False
+            trie = self._tries[client]
+            for topic_filter in topics:
+                qos = filters.pop(topic_filter, None)
+                if qos is not None:
+                    trie.remove(Subscription(topic_filter, None, qos))
+            return True
+
+
+class LocalClient(object):
+    """
+    Stand-in for `paho.mqtt.client.Client` connected to a `LocalBroker`
+
+    Implements the parts of the paho client used by `MQTTWrapper`, messages are delivered on the publishing thread.
+    """
+
+    def __init__(self, broker: LocalBroker, client_id: str=''):
+        self.broker = broker
+        self.client_id = client_id
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self.on_publish = None
+        self._userdata = None
+        self._connected = False
+        self._last_mid = 0
+
+    def user_data_set(self, userdata):
+        """Set the user data passed to callbacks."""
+        self._userdata = userdata
+
+    def is_connected(self) -> bool:
+        """Return True if connected to the broker."""
+        return self._connected
+
+    def connect(self, host: str=None, port: int=None, keepalive: int=60) -> int:
+        """Connect to the local broker."""
+        if not self.broker._connect(self):
+            raise ConnectionRefusedError("Local broker is not running")
+        self._connected = True
+        if self.on_connect:
+            self.on_connect(self, self._userdata, dict(), MQTT_ERR_SUCCESS)
+        return MQTT_ERR_SUCCESS
+
+    def reconnect(self) -> int:
+        """Reconnect to the local broker."""
+        return self.connect()
+
+    def disconnect(self) -> int:
+        """Disconnect from the local broker."""
+        if self._connected:
+            self.broker._disconnect(self)
+            self._on_broker_disconnect(MQTT_ERR_SUCCESS)
+        return MQTT_ERR_SUCCESS
+
+    def subscribe(self, topic: Union[str, list], qos: int=0):
+        """Subscribe to one topic or to a list of `(topic, qos)`."""
+        topics = topic if isinstance(topic, list) else [(topic, qos)]
+        if not self._connected or not self.broker._subscribe(self, topics):
+            return (MQTT_ERR_NO_CONN, None)
+        return (MQTT_ERR_SUCCESS, self._next_mid())
+
+    def unsubscribe(self, topic: Union[str, list]):
+        """Unsubscribe from one topic or a list of topics."""
+        topics = topic if isinstance(topic, list) else [topic]
+        if not self._connected or not self.broker._unsubscribe(self, topics):
+            return (MQTT_ERR_NO_CONN, None)
+        return (MQTT_ERR_SUCCESS, self._next_mid())
+
+    def publish(self, topic: str, payload: PublishPayloadType=None, qos: int=0, retain: bool=False):
+        """Publish a message through the local broker."""
+        if not self._connected:
+            return (MQTT_ERR_NO_CONN, None)
+        message_id = self._next_mid()
+        self.broker.publish(topic, payload, qos, retain)
+        if self.on_publish:
+            self.on_publish(self, self._userdata, message_id)
+        return (MQTT_ERR_SUCCESS, message_id)
+
+    def _next_mid(self) -> int:
+        self._last_mid += 1
+        return self._last_mid
+
+    def _deliver(self, message: LocalMessage):
+        if self.on_message:
+            self.on_message(self, self._userdata, message)
+
+    def _on_broker_disconnect(self, result_code: int):
+        self._connected = False
+        if self.on_disconnect:
+            self.on_disconnect(self, self._userdata, result_code)
+
+
+def _encode_payload(payload: PublishPayloadType) -> bytes:
+    """Encode a payload the way paho does."""
+
+    if payload is None:
+        return b''
+    if isinstance(payload, str):
+        return payload.encode('utf-8')
+    if isinstance(payload, (int, float)):
+        return str(payload).encode('ascii')
+    return bytes(payload)
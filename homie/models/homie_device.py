@@ -11,6 +11,13 @@ _LOGGER = logging.getLogger(__name__)
 class HomieDevice(HomieDiscoveryBase):
     """A definition of a Homie Device"""
 
+    __slots__ = (
+        '_base_topic', '_device_id', '_prefix_topic', '_homie_nodes', '_subscribe', '_publish',
+        '_callback_executor', '_state_store', '_converters', '_on_retire', '_on_added', '_nodes_payload',
+        '_convention_version', '_online', '_name', '_ip', '_mac', '_uptime', '_signal', '_stats_interval',
+        '_fw_name', '_fw_version', '_fw_checksum', '_implementation', '__weakref__',
+    )
+
     def __init__(self, base_topic: str, device_id: str):
         super().__init__()
         _LOGGER.info(f"Homie Device Discovered. ID: {device_id}")
@@ -19,6 +26,14 @@ class HomieDevice(HomieDiscoveryBase):
         self._prefix_topic = f'{base_topic}/{device_id}'
 
         self._homie_nodes = dict()
+        self._subscribe = None
+        self._publish = None
+        self._callback_executor = None
+        self._state_store = None
+        self._converters = None
+        self._on_retire = None
+        self._on_added = None
+        self._nodes_payload = None
 
         self._convention_version = constants.STATE_UNKNOWN
         self._online = constants.STATE_UNKNOWN
@@ -42,73 +57,124 @@ class HomieDevice(HomieDiscoveryBase):
         Once dicovery proccess of children has compleeted (aka. device is `STAGE_1`),
         discovery of all attributes takes place
         """
-        self._discover_nodes(subscribe, publish)
+        self._subscribe = subscribe
+        self._publish = publish
         self.add_on_discovery_stage_change(lambda _, stage: subscribe(f'{self._prefix_topic}/#', self._update), STAGE_1)
 
-    def _discover_nodes(self, subscribe, publish):
-        def _on_discovery_nodes(topic: str, payload: str, msg_qos: int):
-            for node_id in helpers.proccess_nodes(payload):
-                if node_id not in self._homie_nodes:
-                    homie_node = HomieNode(self, self._prefix_topic, node_id)
-                    homie_node.add_on_discovery_stage_change(self._check_discovery_stage)
-                    homie_node.setup(subscribe, publish)
-                    self._homie_nodes[node_id] = homie_node
+        # Nodes restored from a snapshot
+        self._setup_nodes(list(self._homie_nodes.values()))
+        subscribe(f'{self._prefix_topic}/$nodes', self._on_discovery_nodes)
+
+    def _on_discovery_nodes(self, topic: str, payload: str, msg_qos: int):
+        # Republished unchanged, nothing to parse
+        if payload == self._nodes_payload:
+            return None
+        self._nodes_payload = payload
+
+        node_ids = helpers.proccess_nodes(payload)
+        retired_ids = self._homie_nodes.keys() - set(node_ids)
+        for node_id in retired_ids:
+            self._retire_node(node_id)
+        new_nodes = self._add_nodes(node_ids)
+        # Nodes known at stage 1 are watched by whoever follows the device's discovery, tell it about later ones
+        if self._on_added is not None and self._stage_of_discovery >= STAGE_1:
+            for homie_node in new_nodes:
+                self._on_added(homie_node)
+        self._setup_nodes(new_nodes)
+        if retired_ids:
+            self._check_discovery_stage()
 
-        subscribe(f'{self._prefix_topic}/$nodes', _on_discovery_nodes)
+    def _retire_node(self, node_id: str):
+        homie_node = self._homie_nodes.pop(node_id)
+        self._remove_discovery_child(homie_node)
+        homie_node._retire()
+        _LOGGER.info(f"Homie Node Removed. ID: {node_id}")
+
+    def _add_nodes(self, node_ids):
+        new_nodes = []
+        for node_id in node_ids:
+            if node_id not in self._homie_nodes:
+                homie_node = HomieNode(self, self._prefix_topic, node_id)
+                self._add_discovery_child(homie_node)
+                homie_node.add_on_discovery_stage_change(self._check_discovery_stage)
+                self._homie_nodes[node_id] = homie_node
+                new_nodes.append(homie_node)
+        return new_nodes
+
+    def _setup_nodes(self, homie_nodes):
+        # Setup once all nodes are known, so the device doesn't advance stage on a partial list of nodes
+        for homie_node in homie_nodes:
+            homie_node.setup(self._subscribe, self._publish)
+
+    def _snapshot(self):
+        return {
+            'id': self._device_id,
+            'base_topic': self._base_topic,
+            'attributes': helpers.snapshot_attributes(self),
+            'nodes': [homie_node._snapshot() for homie_node in self._homie_nodes.values()],
+        }
+
+    def _restore(self, snapshot):
+        helpers.restore_attributes(self, snapshot['attributes'])
+        self._add_nodes(node_snapshot['id'] for node_snapshot in snapshot['nodes'])
+        for node_snapshot in snapshot['nodes']:
+            self._homie_nodes[node_snapshot['id']]._restore(node_snapshot)
 
     def _check_discovery_stage(self, homie_node=None, stage=None):
-        current_stage = self._stage_of_discovery
-        if current_stage == STAGE_0:
-            if helpers.can_advance_stage(STAGE_1, self._homie_nodes):
+        if self._stage_of_discovery == STAGE_0:
+            if self._can_advance_stage(STAGE_1):
                 self._set_discovery_stage(STAGE_1)
-        if current_stage == STAGE_1:
-            if helpers.can_advance_stage(STAGE_2, self._homie_nodes) and self._online is not constants.STATE_UNKNOWN:
+        if self._stage_of_discovery == STAGE_1:
+            if self._can_advance_stage(STAGE_2) and self._online is not constants.STATE_UNKNOWN:
                 self._set_discovery_stage(STAGE_2)
 
     def _update(self, topic: str, payload: str, qos: int):
-        if self._prefix_topic not in topic:
+        prefix_length = len(self._prefix_topic)
+        if not topic.startswith(self._prefix_topic) or topic[prefix_length:prefix_length + 1] != '/':
             return None
 
-        for homie_node in self._homie_nodes.values():
-            homie_node._update(topic, payload, qos)
+        self._route(topic[prefix_length + 1:].split('/'), 0, payload, qos)
 
-        topic = topic.replace(self._prefix_topic, '')
+    def _route(self, levels: list, index: int, payload: str, qos: int):
+        """
+        Route a message already split into topic levels, `levels[index]` being the level below the device
 
+        Returns False if the message is for a node that is not known (yet)
+        """
+        level = levels[index]
+        if level[:1] == '$':
+            attribute = level if index + 1 == len(levels) else '/'.join(levels[index:])
+            handler = self._ATTRIBUTE_HANDLERS.get(attribute)
+            if handler is not None:
+                handler(self, payload)
+            return True
+
+        homie_node = self._homie_nodes.get(level)
+        if homie_node is None:
+            return False
+        return homie_node._route(levels, index + 1, payload, qos)
+
+    _ATTRIBUTE_HANDLERS = {
         # Load Device Properties
-        if topic == '/$homie':
-            self._convention_version = payload
-        if topic == '/$online':
-            self._online = payload
-        if topic == '/$name':
-            self._name = payload
-        if topic == '/$localip':
-            self._ip = payload
-        if topic == '/$mac':
-            self._mac = payload
+        '$homie': helpers.attribute_setter('_convention_version'),
+        '$online': helpers.attribute_setter('_online', '_check_discovery_stage'),  # Ready
+        '$name': helpers.attribute_setter('_name'),
+        '$localip': helpers.attribute_setter('_ip'),
+        '$mac': helpers.attribute_setter('_mac'),
 
         # Load Device Stats Properties
-        if topic == '/$stats/uptime':
-            self._uptime = payload
-        if topic == '/$stats/signal':
-            self._signal = payload
-        if topic == '/$stats/interval':
-            self._stats_interval = payload
+        '$stats/uptime': helpers.attribute_setter('_uptime'),
+        '$stats/signal': helpers.attribute_setter('_signal'),
+        '$stats/interval': helpers.attribute_setter('_stats_interval'),
 
         # Load Firmware Properties
-        if topic == '/$fw/name':
-            self._fw_name = payload
-        if topic == '/$fw/version':
-            self._fw_version = payload
-        if topic == '/$fw/checksum':
-            self._fw_checksum = payload
+        '$fw/name': helpers.attribute_setter('_fw_name'),
+        '$fw/version': helpers.attribute_setter('_fw_version'),
+        '$fw/checksum': helpers.attribute_setter('_fw_checksum'),
 
         # Load Implementation Properties
-        if topic == '/$implementation':
-            self._implementation = payload
-
-        # Ready
-        if topic == '/$online':
-            self._check_discovery_stage()
+        '$implementation': helpers.attribute_setter('_implementation'),
+    }
 
     @property
     def base_topic(self):
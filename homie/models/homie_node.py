@@ -1,6 +1,7 @@
 """Homie Node module"""
 
 import logging
+import sys
 
 from ..tools import (constants, helpers, HomieDiscoveryBase, STAGE_0, STAGE_1, STAGE_2)
 from .homie_property import HomieProperty
@@ -11,15 +12,25 @@ _LOGGER = logging.getLogger(__name__)
 class HomieNode(HomieDiscoveryBase):
     """A definition of a Homie Node"""
 
+    __slots__ = (
+        '_device', '_base_topic', '_node_id', '_prefix_topic', '_homie_properties', '_subscribe', '_publish',
+        '_properties_payload', '_unsubscribe_properties', '_type', '__weakref__',
+    )
+
     def __init__(self, device, base_topic: str, node_id: str):
         super().__init__()
         _LOGGER.info(f"Homie Node Discovered. ID: {node_id}")
         self._device = device
         self._base_topic = base_topic
-        self._node_id = node_id
+        # Node IDs repeat across devices, share them
+        self._node_id = sys.intern(node_id)
         self._prefix_topic = f'{base_topic}/{node_id}'
 
         self._homie_properties = dict()
+        self._subscribe = None
+        self._publish = None
+        self._properties_payload = None
+        self._unsubscribe_properties = None
 
         self._type = constants.STATE_UNKNOWN
 
@@ -29,43 +40,124 @@ class HomieNode(HomieDiscoveryBase):
 
         This start the discovery proccess of properties
         """
-        self._discover_properties(subscribe, publish)
-
-    def _discover_properties(self, subscribe, publish):
-        def _on_discovery_properties(topic: str, payload: str, msg_qos: int):
-            for property_id, property_settable, property_range in helpers.proccess_properties(payload):
-                if property_id not in self._homie_properties:
-                    homie_property = HomieProperty(self, self._prefix_topic, property_id, property_settable, property_range)
-                    homie_property.add_on_discovery_stage_change(self._check_discovery_stage)
-                    homie_property.setup(subscribe, publish)
-                    self._homie_properties[property_id] = homie_property
+        self._subscribe = subscribe
+        self._publish = publish
 
-        subscribe(f'{self._prefix_topic}/$properties', _on_discovery_properties)
+        # Properties restored from a snapshot
+        self._setup_properties(list(self._homie_properties.values()))
+        self._unsubscribe_properties = subscribe(f'{self._prefix_topic}/$properties', self._on_discovery_properties)
 
-    def _check_discovery_stage(self, homie_property=None, stage=None):
-        current_stage = self._stage_of_discovery
-        if current_stage == STAGE_0:
-            if helpers.can_advance_stage(STAGE_1, self._homie_properties):
-                self._set_discovery_stage(STAGE_1)
-        if current_stage == STAGE_1:
-            if helpers.can_advance_stage(STAGE_2, self._homie_properties) and self._type is not constants.STATE_UNKNOWN:
-                self._set_discovery_stage(STAGE_2)
-
-    def _update(self, topic: str, payload: str, qos: int):
-        if self._prefix_topic not in topic:
+    def _on_discovery_properties(self, topic: str, payload: str, msg_qos: int):
+        # Republished unchanged, nothing to parse
+        if payload == self._properties_payload:
             return None
+        self._properties_payload = payload
+
+        properties = helpers.proccess_properties(payload)
+        retired_ids = self._homie_properties.keys() - {property_id for property_id, _, _ in properties}
+        for property_id in retired_ids:
+            self._retire_property(property_id)
+        for property_id, property_settable, property_range in properties:
+            homie_property = self._homie_properties.get(property_id)
+            if homie_property is not None:
+                homie_property._settable = property_settable
+                homie_property._range = property_range
+        new_properties = self._add_properties(properties)
+        on_added = self._device._on_added
+        if on_added is not None and self._device._stage_of_discovery >= STAGE_1:
+            for homie_property in new_properties:
+                on_added(homie_property)
+        self._setup_properties(new_properties)
+        if retired_ids:
+            self._check_discovery_stage()
 
+    def _retire_property(self, property_id: str):
+        homie_property = self._homie_properties.pop(property_id)
+        self._remove_discovery_child(homie_property)
+        on_retire = self._device._on_retire
+        if on_retire is not None:
+            on_retire(homie_property)
+        _LOGGER.info(f"Homie Property Removed. ID: {property_id}")
+
+    def _retire(self):
+        """Stop discovery of the node once removed from its device"""
+        if self._unsubscribe_properties is not None:
+            self._unsubscribe_properties()
+            self._unsubscribe_properties = None
+        on_retire = self._device._on_retire
+        if on_retire is not None:
+            on_retire(self)
+
+    def _add_properties(self, properties):
+        new_properties = []
+        for property_id, property_settable, property_range in properties:
+            if property_id not in self._homie_properties:
+                homie_property = HomieProperty(self, self._prefix_topic, property_id, property_settable, property_range)
+                self._add_discovery_child(homie_property)
+                homie_property.add_on_discovery_stage_change(self._check_discovery_stage)
+                self._homie_properties[property_id] = homie_property
+                new_properties.append(homie_property)
+        return new_properties
+
+    def _setup_properties(self, homie_properties):
+        # Setup once all properties are known, so the node doesn't advance stage on a partial list of properties
+        for homie_property in homie_properties:
+            homie_property.setup(self._subscribe, self._publish)
+
+    def _snapshot(self):
+        return {
+            'id': self._node_id,
+            'attributes': helpers.snapshot_attributes(self),
+            'properties': [homie_property._snapshot() for homie_property in self._homie_properties.values()],
+        }
+
+    def _restore(self, snapshot):
+        helpers.restore_attributes(self, snapshot['attributes'])
+        self._add_properties(
+            (property_snapshot['id'], property_snapshot['settable'], tuple(property_snapshot['range']))
+            for property_snapshot in snapshot['properties'])
+        for property_snapshot in snapshot['properties']:
+            self._homie_properties[property_snapshot['id']]._restore(property_snapshot)
+
+    def _update_type(self):
+        # Converters depend on the node type
         for homie_property in self._homie_properties.values():
-            homie_property._update(topic, payload, qos)
+            homie_property._reparse_state()
+        self._check_discovery_stage()
 
-        topic = topic.replace(self._prefix_topic, '')
+    def _check_discovery_stage(self, homie_property=None, stage=None):
+        if self._stage_of_discovery == STAGE_0:
+            if self._can_advance_stage(STAGE_1):
+                self._set_discovery_stage(STAGE_1)
+        if self._stage_of_discovery == STAGE_1:
+            if self._can_advance_stage(STAGE_2) and self._type is not constants.STATE_UNKNOWN:
+                self._set_discovery_stage(STAGE_2)
 
-        if topic == '/$type':
-            self._type = payload
+    def _route(self, levels: list, index: int, payload: str, qos: int):
+        """
+        Route a message already split into topic levels, `levels[index]` being the level below the node
 
-        # Ready
-        if topic == '/$type':
-            self._check_discovery_stage()
+        Returns False if the message is for a property that is not known (yet)
+        """
+        if index == len(levels):
+            return True
+
+        level = levels[index]
+        if level[:1] == '$':
+            attribute = level if index + 1 == len(levels) else '/'.join(levels[index:])
+            handler = self._ATTRIBUTE_HANDLERS.get(attribute)
+            if handler is not None:
+                handler(self, payload)
+            return True
+
+        homie_property = self._homie_properties.get(level)
+        if homie_property is None:
+            return False
+        return homie_property._route(levels, index + 1, payload, qos)
+
+    _ATTRIBUTE_HANDLERS = {
+        '$type': helpers.attribute_setter('_type', '_update_type'),  # Ready
+    }
 
     @property
     def base_topic(self):
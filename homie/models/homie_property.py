@@ -1,8 +1,9 @@
 """Homie Property module"""
 
 import logging
+import sys
 
-from ..tools import (constants, HomieDiscoveryBase, STAGE_2)
+from ..tools import (constants, helpers, HomieDiscoveryBase, STAGE_2)
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -10,18 +11,24 @@ _LOGGER = logging.getLogger(__name__)
 class HomieProperty(HomieDiscoveryBase):
     """A definition of a Homie Property"""
 
+    __slots__ = ('_node', '_base_topic', '_property_id', '_settable', '_range', '_publish', '_state', '_value', '_datatype', '_format',
+                 '__weakref__')
+
     def __init__(self, node, base_topic: str, property_id: str, settable: bool, ranges: tuple):
         super().__init__()
         _LOGGER.info(f"Homie Property Discovered. ID: {property_id}")
         self._node = node
         self._base_topic = base_topic
-        self._property_id = property_id
+        # Property IDs repeat across nodes, share them
+        self._property_id = sys.intern(property_id)
         self._settable = settable
         self._range = ranges
-        self._prefix_topic = f'{base_topic}/{property_id}'
         self._publish = None
 
         self._state = constants.STATE_UNKNOWN
+        self._value = None
+        self._datatype = constants.STATE_UNKNOWN
+        self._format = constants.STATE_UNKNOWN
 
     def setup(self, subscribe, publish):
         """Setup the node property"""
@@ -29,14 +36,56 @@ class HomieProperty(HomieDiscoveryBase):
         self._publish = publish
         self._set_discovery_stage(STAGE_2)
 
-    def _update(self, topic: str, payload: str, qos: int):
-        if self._prefix_topic not in topic:
-            return None
-
-        topic = topic.replace(self._prefix_topic, '')
+    def _route(self, levels: list, index: int, payload: str, qos: int):
+        """Route a message already split into topic levels, `levels[index]` being the level below the property"""
+        attribute = '' if index == len(levels) else '/'.join(levels[index:])
+        handler = self._ATTRIBUTE_HANDLERS.get(attribute)
+        if handler is not None:
+            handler(self, payload)
+        return True
+
+    def _snapshot(self):
+        return {
+            'id': self._property_id,
+            'settable': self._settable,
+            'range': list(self._range),
+            'attributes': helpers.snapshot_attributes(self),
+        }
+
+    def _restore(self, snapshot):
+        helpers.restore_attributes(self, snapshot['attributes'])
+
+    def _parse_state(self, payload: str):
+        converters = self._node._device._converters
+        converter = None
+        if converters is not None:
+            converter = converters.converter_for(
+                self._node._type,
+                self._property_id,
+                None if self._datatype is constants.STATE_UNKNOWN else self._datatype,
+                None if self._format is constants.STATE_UNKNOWN else self._format)
+        self._value = payload if converter is None else converters.convert(converter, payload)
+
+    def _reparse_state(self):
+        if self._state is not constants.STATE_UNKNOWN:
+            self._parse_state(self._state)
+
+    def _record_state(self):
+        state_store = self._node._device._state_store
+        if state_store is not None:
+            state_store.record(self, self._value)
+
+    _ATTRIBUTE_HANDLERS = {
+        # The property topic itself carries the state, parsed to its value first
+        '': helpers.attribute_setter('_state', '_record_state', '_parse_state'),
+        '$datatype': helpers.attribute_setter('_datatype', '_reparse_state'),
+        '$format': helpers.attribute_setter('_format', '_reparse_state'),
+    }
 
-        if topic == '':
-            self._state = payload
+    @property
+    def _prefix_topic(self):
+        # Built when needed rather than kept for every property
+        return f'{self._base_topic}/{self._property_id}'
 
     @property
     def property_id(self):
@@ -48,6 +97,16 @@ class HomieProperty(HomieDiscoveryBase):
         """Return the state of the Property."""
         return self._state
 
+    @property
+    def value(self):
+        """Return the state of the Property converted to its type, None if it couldn't be converted."""
+        return self._value
+
+    @property
+    def datatype(self):
+        """Return the declared Data Type of the Property."""
+        return self._datatype
+
     def set_state(self, value: str):
         """Set the state of the Property."""
         if self.settable:
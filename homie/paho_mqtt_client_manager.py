@@ -1,26 +1,40 @@
 """Paho MQTT wrapper for managing subscriptions module"""
 
 # Imports
+from collections import OrderedDict
 from operator import attrgetter
 from itertools import groupby
+import asyncio
 import logging
+import queue
+import random
 import socket
+import threading
 import time
-import re
 from typing import Union, Callable
 import attr
 import paho.mqtt.client as mqtt
 
+from .tools.metrics import (Metrics, NULL_METRICS)
+
 
 # Types
 from paho.mqtt.client import Client as MQTTClient
 PublishPayloadType = Union[str, bytes, int, float, None]
-SubscribePayloadType = Union[str, bytes]  # Only bytes if encoding is None
+SubscribePayloadType = Union[str, memoryview]  # Only memoryview if encoding is None
 MessageCallbackType = Callable[[str, SubscribePayloadType, int], None]
 
 # Consts
 MAX_RECONNECT_WAIT = 300  # seconds
+MAX_SUBSCRIBE_BATCH = 100  # topic filters per SUBSCRIBE packet
+DEFAULT_MAX_PENDING_MESSAGES = 1000
+DEFAULT_MAX_QUEUED_PUBLISHES = 1000
 _LOGGER = logging.getLogger(__name__)
+_UNDECODABLE = object()
+_COUNTERS = (
+    'dropped_publishes', 'suppressed_messages', 'suppressed_callbacks', 'suppressed_bytes',
+    'skipped_subscriptions', 'replayed_messages', 'skipped_resends',
+)
 
 
 @attr.s(slots=True, frozen=True)
@@ -31,6 +45,267 @@ class Subscription(object):
     callback = attr.ib(type=MessageCallbackType)
     qos = attr.ib(type=int, default=0)
     encoding = attr.ib(type=str, default='utf-8')
+    deduplicate = attr.ib(type=bool, default=False)
+
+
+@attr.s(slots=True, frozen=True)
+class OutboundMessage(object):
+    """Class to hold a message waiting to be published."""
+
+    topic = attr.ib(type=str)
+    payload = attr.ib(type=PublishPayloadType)
+    qos = attr.ib(type=int, default=0)
+    retain = attr.ib(type=bool, default=False)
+
+
+class SubscriptionTrie(object):
+    """
+    Topic level trie of subscriptions
+
+    Lookups walk one level of the topic at a time, following the literal level,
+    `+` and `#` branches, so matching costs depend on topic depth not on the number of subscriptions.
+    """
+
+    __slots__ = ('children', 'subscriptions')
+
+    def __init__(self):
+        self.children = dict()  # type: Dict[str, SubscriptionTrie]
+        self.subscriptions = list()  # type: List[Subscription]
+
+    def add(self, subscription: Subscription) -> None:
+        """Add a subscription at the node of its topic filter."""
+
+        node = self
+        for level in subscription.topic.split('/'):
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = SubscriptionTrie()
+            node = child
+        node.subscriptions.append(subscription)
+
+    def remove(self, subscription: Subscription) -> None:
+        """Remove a subscription and prune the branches left empty."""
+
+        path = []
+        node = self
+        for level in subscription.topic.split('/'):
+            path.append((node, level))
+            node = node.children[level]
+        node.subscriptions.remove(subscription)
+
+        for parent, level in reversed(path):
+            child = parent.children[level]
+            if child.subscriptions or child.children:
+                break
+            del parent.children[level]
+
+    def has_topic(self, topic: str) -> bool:
+        """Return True if any subscription uses this exact topic filter."""
+
+        node = self
+        for level in topic.split('/'):
+            node = node.children.get(level)
+            if node is None:
+                return False
+        return bool(node.subscriptions)
+
+    def match(self, topic: str) -> list:
+        """Return all subscriptions whose topic filter matches the topic."""
+
+        levels = topic.split('/')
+        depth = len(levels)
+        matches = []
+        stack = [(self, 0)]
+        while stack:
+            node, index = stack.pop()
+            # Wildcards at the first level don't match topics starting with `$`
+            wildcards = index > 0 or not levels[0].startswith('$')
+
+            if wildcards:
+                multi = node.children.get('#')
+                if multi is not None:
+                    matches.extend(multi.subscriptions)
+
+            if index == depth:
+                matches.extend(node.subscriptions)
+                continue
+
+            child = node.children.get(levels[index])
+            if child is not None:
+                stack.append((child, index + 1))
+            if wildcards:
+                child = node.children.get('+')
+                if child is not None:
+                    stack.append((child, index + 1))
+        return matches
+
+    def covers(self, topic: str, qos: int=0, exact: bool=True) -> bool:
+        """
+        Return True if a subscription with at least `qos` matches every topic the topic filter matches
+
+        Without `exact`, the subscriptions on this very topic filter don't count.
+        """
+
+        levels = topic.split('/')
+        depth = len(levels)
+        stack = [(self, 0, True)]
+        while stack:
+            node, index, same = stack.pop()
+            wildcards = index > 0 or not levels[0].startswith('$')
+
+            if wildcards:
+                multi = node.children.get('#')
+                # Unless it is the `#` ending the topic filter itself
+                itself = same and index == depth - 1 and levels[index] == '#'
+                if multi is not None and (exact or not itself) and _granted(multi.subscriptions, qos):
+                    return True
+
+            if index == depth:
+                if (exact or not same) and _granted(node.subscriptions, qos):
+                    return True
+                continue
+
+            level = levels[index]
+            if level == '#':
+                # Only covered by a `#` of the same level
+                continue
+            child = node.children.get(level)
+            if child is not None:
+                stack.append((child, index + 1, same))
+            if wildcards and level != '+':
+                child = node.children.get('+')
+                if child is not None:
+                    stack.append((child, index + 1, False))
+        return False
+
+    def covered_by(self, topic: str) -> list:
+        """Return all subscriptions whose topic filter only matches topics the topic filter matches."""
+
+        levels = topic.split('/')
+        depth = len(levels)
+        matches = []
+        stack = [(self, 0)]
+        while stack:
+            node, index = stack.pop()
+            if index == depth:
+                matches.extend(node.subscriptions)
+                continue
+
+            # Wildcards at the first level don't cover topic filters starting with `$`
+            children = [(level, child) for level, child in node.children.items() if index > 0 or not level.startswith('$')]
+            level = levels[index]
+            if level == '#':
+                # `#` also matches its parent level
+                matches.extend(node.subscriptions)
+                descendants = [child for _, child in children]
+                while descendants:
+                    descendant = descendants.pop()
+                    matches.extend(descendant.subscriptions)
+                    descendants.extend(descendant.children.values())
+            elif level == '+':
+                stack.extend((child, index + 1) for child_level, child in children if child_level != '#')
+            else:
+                child = node.children.get(level)
+                if child is not None:
+                    stack.append((child, index + 1))
+        return matches
+
+
+class RetainedCache(object):
+    """
+    Last message of each topic, by topic level to find the ones matching a topic filter without a full scan
+
+    Each entry is a node holding a `message`. It is `retained` if the message came retained, or updated a topic that had one.
+    Brokers clear the retain flag of live messages, so whether other topics have a retained message is unknown.
+    `delivered` are the subscriptions that got the message.
+    """
+
+    __slots__ = ('children', 'message', 'retained', 'delivered')
+
+    def __init__(self):
+        self.children = dict()  # type: Dict[str, RetainedCache]
+        self.message = None
+        self.retained = False
+        self.delivered = ()  # type: Tuple[Subscription, ...]
+
+    def store(self, message, retained: bool=True) -> 'RetainedCache':
+        """Keep the last message of its topic and return its entry."""
+
+        node = self
+        for level in message.topic.split('/'):
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = RetainedCache()
+            node = child
+        node.message = message
+        node.retained = retained
+        node.delivered = ()
+        return node
+
+    def get(self, topic: str) -> 'RetainedCache':
+        """Return the entry of a topic, None if there is none."""
+
+        node = self
+        for level in topic.split('/'):
+            node = node.children.get(level)
+            if node is None:
+                return None
+        return node if node.message is not None else None
+
+    def remove(self, topic: str) -> None:
+        """Forget the retained message of a topic and prune the branches left empty."""
+
+        path = []
+        node = self
+        for level in topic.split('/'):
+            path.append((node, level))
+            node = node.children.get(level)
+            if node is None:
+                return
+        node.message = None
+        node.retained = False
+        node.delivered = ()
+
+        for parent, level in reversed(path):
+            child = parent.children[level]
+            if child.message is not None or child.children:
+                break
+            del parent.children[level]
+
+    def match(self, topic: str) -> list:
+        """Return the entries whose topic matches the topic filter."""
+
+        levels = topic.split('/')
+        depth = len(levels)
+        matches = []
+        stack = [(self, 0)]
+        while stack:
+            node, index = stack.pop()
+            if index == depth:
+                if node.message is not None:
+                    matches.append(node)
+                continue
+
+            # Wildcards at the first level don't match topics starting with `$`
+            level = levels[index]
+            if level == '#':
+                # `#` also matches its parent level
+                if index > 0 and node.message is not None:
+                    matches.append(node)
+                descendants = [child for child_level, child in node.children.items() if index > 0 or not child_level.startswith('$')]
+                while descendants:
+                    descendant = descendants.pop()
+                    if descendant.message is not None:
+                        matches.append(descendant)
+                    descendants.extend(descendant.children.values())
+            elif level == '+':
+                stack.extend((child, index + 1) for child_level, child in node.children.items()
+                             if index > 0 or not child_level.startswith('$'))
+            else:
+                child = node.children.get(level)
+                if child is not None:
+                    stack.append((child, index + 1))
+        return matches
 
 
 class MQTTWrapper():
@@ -38,50 +313,368 @@ class MQTTWrapper():
     Paho MQTT client wrapper
 
     Helps manage subscriptions and auto reconnect and auto resubscribe
+
+    By default the wrapper reconnects on a timer thread, backing off exponentially with jitter.
+    With `reconnect_in_loop` the network loop of the client reconnects instead, with a backoff of 1 to `MAX_RECONNECT_WAIT`
+    seconds: pass it when running paho's `loop_forever` or `loop_start`, which reconnect by themselves.
+
+    Messages are published through an outbound queue, one message per topic: a newer message to a topic replaces the
+    pending one. The queue is flushed as far as `topic_rate` and `global_rate` (messages per second)
+    and `max_inflight` (unacknowledged QoS > 0 messages) allow.
+    While disconnected up to `max_queued_publishes` topics are kept, the oldest is dropped beyond that.
+
+    Pass a `Metrics` to record message, callback and connection metrics, none are recorded by default.
+
+    Duplicate payloads can be suppressed for subscriptions made with `deduplicate=True`, or for all subscriptions
+    of the topics matching `deduplicate_topics` (topic filters, see `add_deduplicate_topic`).
+    The last payload of those topics is kept, a message with the same payload bytes reaching the same subscriptions
+    is dropped before decoding. Suppressed messages, callbacks and payload bytes are counted.
+    The payloads are forgotten on reconnect, so the retained messages the broker sends again aren't suppressed.
+
+    With `retained_cache` the retained messages received are kept. A subscription to a topic filter that an existing
+    subscription already covers doesn't send a SUBSCRIBE, its callback gets the matching retained messages
+    from the cache instead, and it isn't resubscribed on reconnect. That is when the cache has retained messages
+    for the topic filter and knows all of its topics had one, otherwise the broker is asked.
+    A new subscription covering topic filters subscribed on the broker unsubscribes them, and a retained message
+    the broker then sends again unchanged only goes to the subscriptions that didn't get it yet.
+    Removing the covering subscription subscribes the topic filters it covered.
     """
 
-    def __init__(self, mqtt_client: MQTTClient):
+    def __init__(self, mqtt_client: MQTTClient, max_queued_publishes: int=DEFAULT_MAX_QUEUED_PUBLISHES,
+                 topic_rate: float=None, global_rate: float=None, max_inflight: int=None, metrics: Metrics=None,
+                 deduplicate_topics: list=None, retained_cache: bool=False, reconnect_in_loop: bool=False):
         self.client = mqtt_client  # type: MQTTClient
         self.subscriptions = []  # type: List[Subscription]
+        self._subscription_trie = SubscriptionTrie()
+
+        self.suppressed_messages = 0
+        self.suppressed_callbacks = 0
+        self.suppressed_bytes = 0
+        self._deduplicate_trie = SubscriptionTrie()
+        self._deduplicate_topics = 0
+        self._deduplicate_subscriptions = 0
+        self._last_payloads = dict()  # type: Dict[str, Tuple[bytes, List[Subscription]]]
+        for topic in deduplicate_topics or ():
+            self.add_deduplicate_topic(topic)
+
+        self.retained_cache = RetainedCache() if retained_cache else None  # type: RetainedCache
+        self.skipped_subscriptions = 0
+        self.replayed_messages = 0
+        self.skipped_resends = 0
+        self._covered_topics = dict()  # type: Dict[str, Subscription]
+        self._covered_trie = SubscriptionTrie()
         self.connected = False
+        self._reconnect_tries = 0
+        self._reconnect_timer = None
+        self.reconnect_in_loop = reconnect_in_loop
+        if reconnect_in_loop:
+            self.client.reconnect_delay_set(1, MAX_RECONNECT_WAIT)
+
+        self.max_queued_publishes = max_queued_publishes
+        self.topic_rate = topic_rate
+        self.global_rate = global_rate
+        self.max_inflight = max_inflight
+        self.dropped_publishes = 0
+        self._outbound = OrderedDict()  # type: OrderedDict[str, OutboundMessage]
+        self._outbound_lock = threading.RLock()
+        self._outbound_timer = None
+        self._outbound_timer_at = None
+        self._last_publish = dict()  # type: Dict[str, float]
+        self._publish_tokens = global_rate
+        self._publish_tokens_at = time.monotonic()
+        self._inflight = set()
+        # Acknowledgements received while the client publishes, `LocalClient` acknowledges straight away
+        self._publishing_acks = None
+
+        self.metrics = metrics or NULL_METRICS
+        self.metrics.add_collector(self._collect_metrics, _COUNTERS)
 
         self.client.on_connect = self._mqtt_on_connect
         self.client.on_disconnect = self._mqtt_on_disconnect
         self.client.on_message = self._mqtt_on_message
+        self.client.on_publish = self._mqtt_on_publish
+
+    def _collect_metrics(self) -> dict:
+        return {
+            'subscriptions': len(self.subscriptions),
+            'queued_publishes': len(self._outbound),
+            'dropped_publishes': self.dropped_publishes,
+            'suppressed_messages': self.suppressed_messages,
+            'suppressed_callbacks': self.suppressed_callbacks,
+            'suppressed_bytes': self.suppressed_bytes,
+            'covered_subscriptions': len(self._covered_topics),
+            'skipped_subscriptions': self.skipped_subscriptions,
+            'replayed_messages': self.replayed_messages,
+            'skipped_resends': self.skipped_resends,
+        }
+
+    def add_deduplicate_topic(self, topic: str) -> None:
+        """Suppress duplicate payloads of the topics matching a topic filter, for all their subscriptions."""
+
+        self._deduplicate_trie.add(Subscription(topic, None))
+        self._deduplicate_topics += 1
+
+    def _forget_last_payloads(self, topic: str) -> None:
+        """Drop the last payloads of the topics matching a topic filter, they refer to its subscriptions."""
+
+        for last_topic in [last_topic for last_topic in self._last_payloads if _match_topic(topic, last_topic)]:
+            del self._last_payloads[last_topic]
+
+    @property
+    def queued_publishes(self) -> int:
+        """Return the number of messages waiting to be published."""
+        return len(self._outbound)
 
     def publish(self, topic: str, payload: PublishPayloadType, qos: int, retain: bool = False) -> int:
-        """Publish a MQTT message."""
-
-        if self.connected:
-            _LOGGER.debug(f"Publishing to {topic}")
-            result, message_id = self.client.publish(topic, payload, qos, retain)
-            _raise_on_error(result)
-            return message_id
+        """Publish a MQTT message, returns the message id if it could be sent straight away."""
+
+        message = OutboundMessage(topic, payload, qos, retain)
+        with self._outbound_lock:
+            if topic not in self._outbound and len(self._outbound) >= self.max_queued_publishes:
+                dropped = self._outbound.popitem(last=False)[1]
+                self.dropped_publishes += 1
+                _LOGGER.warning(f"Publish queue is full, dropping message to {dropped.topic}")
+            # Replacing keeps the place in the queue
+            self._outbound[topic] = message
+            return self._flush_outbound(topic)
+
+    def _flush_outbound(self, wanted_topic: str=None) -> int:
+        """Publish queued messages as the limits allow, returns the message id of `wanted_topic` if it was sent."""
+
+        with self._outbound_lock:
+            if not self.connected or not self._outbound:
+                return None
+
+            now = time.monotonic()
+            wanted_message_id = None
+            retry_in = None
+            for topic in list(self._outbound):
+                if self.max_inflight is not None and len(self._inflight) >= self.max_inflight:
+                    # Resumed by the publish acknowledgements
+                    break
 
-    def subscribe(self, topic: str, msg_callback: MessageCallbackType, qos: int, encoding: str = 'utf-8') -> Callable[[], None]:
-        """Set up a subscription to a topic with the provided qos."""
+                if self.global_rate is not None:
+                    self._publish_tokens = min(self.global_rate, self._publish_tokens + (now - self._publish_tokens_at) * self.global_rate)
+                    self._publish_tokens_at = now
+                    if self._publish_tokens < 1:
+                        retry_in = (1 - self._publish_tokens) / self.global_rate
+                        break
+
+                if self.topic_rate is not None and topic in self._last_publish:
+                    wait_time = self._last_publish[topic] + 1 / self.topic_rate - now
+                    if wait_time > 0:
+                        retry_in = wait_time if retry_in is None else min(retry_in, wait_time)
+                        continue
+
+                message = self._outbound.pop(topic)
+                _LOGGER.debug(f"Publishing to {topic}")
+                self._publishing_acks = set()
+                try:
+                    result, message_id = self.client.publish(message.topic, message.payload, message.qos, message.retain)
+                finally:
+                    acknowledged, self._publishing_acks = self._publishing_acks, None
+                if result == mqtt.MQTT_ERR_NO_CONN:
+                    # Connection is lost, keep it for the reconnect
+                    self._outbound[topic] = message
+                    self._outbound.move_to_end(topic, last=False)
+                    return wanted_message_id
+                _raise_on_error(result)
+
+                if self.global_rate is not None:
+                    self._publish_tokens -= 1
+                if self.topic_rate is not None:
+                    self._last_publish[topic] = now
+                if self.max_inflight is not None and message.qos > 0 and message_id not in acknowledged:
+                    self._inflight.add(message_id)
+                if topic == wanted_topic:
+                    wanted_message_id = message_id
+
+            if retry_in is not None:
+                self._schedule_flush(now + retry_in)
+            return wanted_message_id
+
+    def _schedule_flush(self, flush_at: float) -> None:
+        if self._outbound_timer is not None:
+            if self._outbound_timer_at <= flush_at:
+                return
+            self._outbound_timer.cancel()
+
+        self._outbound_timer_at = flush_at
+        self._outbound_timer = threading.Timer(max(flush_at - time.monotonic(), 0), self._on_flush_timer)
+        self._outbound_timer.daemon = True
+        self._outbound_timer.start()
+
+    def _on_flush_timer(self) -> None:
+        with self._outbound_lock:
+            self._outbound_timer = None
+            self._flush_outbound()
+
+    def _mqtt_on_publish(self, _mqttc, _userdata, message_id: int) -> None:
+        """Publish acknowledged callback."""
+
+        with self._outbound_lock:
+            if message_id in self._inflight:
+                self._inflight.discard(message_id)
+                self._flush_outbound()
+            elif self._publishing_acks is not None:
+                self._publishing_acks.add(message_id)
+
+    def subscribe(self, topic: str, msg_callback: MessageCallbackType, qos: int, encoding: str = 'utf-8',
+                  deduplicate: bool = False) -> Callable[[], None]:
+        """
+        Set up a subscription to a topic with the provided qos
+
+        Payloads are decoded with `encoding`, without encoding the callback gets a `memoryview` of the payload bytes.
+        With `deduplicate` the callback isn't called again for a topic until its payload changes.
+        With the retained cache, a topic filter covered by another subscription returns no message id.
+        """
 
         if not isinstance(topic, str):
             raise Exception("topic needs to be a string!")
 
-        subscription = Subscription(topic, msg_callback, qos, encoding)
+        subscription = Subscription(topic, msg_callback, qos, encoding, deduplicate)
+        covered = self.retained_cache is not None and self._subscription_trie.covers(topic, qos) and self._cached(topic)
+        # Already subscribed on the broker with at least this qos, not just covered
+        subscribed = covered and topic not in self._covered_topics and self._subscription_trie.has_topic(topic)
         self.subscriptions.append(subscription)
-
-        message_id = self._perform_subscription(topic, qos)
+        self._subscription_trie.add(subscription)
+        if deduplicate:
+            self._deduplicate_subscriptions += 1
+
+        if covered:
+            self.skipped_subscriptions += 1
+            if not subscribed:
+                self._cover_topic(topic, qos)
+            self._replay_retained(subscription)
+            message_id = None
+        else:
+            if topic in self._covered_topics:
+                # Higher qos than the covering subscription, or retained messages not in the cache
+                self._covered_trie.remove(self._covered_topics.pop(topic))
+            message_id = self._perform_subscription(topic, qos)
+            if self.retained_cache is not None:
+                self._fold_topics(topic, qos)
 
         def remove() -> None:
             """Remove subscription."""
             if subscription not in self.subscriptions:
                 raise Exception("Can't remove subscription twice")
             self.subscriptions.remove(subscription)
-
-            if any(other.topic == topic for other in self.subscriptions):
+            self._subscription_trie.remove(subscription)
+            if subscription.deduplicate:
+                self._deduplicate_subscriptions -= 1
+            if self._last_payloads:
+                self._forget_last_payloads(topic)
+            if self.retained_cache is not None:
+                self._forget_retained(subscription)
+
+            if self._subscription_trie.has_topic(topic):
                 # Other subscriptions on topic remaining - don't unsubscribe.
                 return
-            self._unsubscribe(topic)
+            if self.retained_cache is None:
+                self._unsubscribe(topic)
+                return
+
+            covered = self._covered_topics.pop(topic, None)
+            if covered is not None:
+                # Not subscribed on the broker
+                self._covered_trie.remove(covered)
+            else:
+                self._uncover_topics(topic)
+                self._unsubscribe(topic)
 
         return (remove, message_id)
 
+    def _cover_topic(self, topic: str, qos: int) -> None:
+        """Record a topic filter left to the subscriptions covering it."""
+
+        covered = self._covered_topics.get(topic)
+        if covered is not None and covered.qos >= qos:
+            return
+        if covered is not None:
+            self._covered_trie.remove(covered)
+        covered = self._covered_topics[topic] = Subscription(topic, None, qos)
+        self._covered_trie.add(covered)
+
+    def _fold_topics(self, topic: str, qos: int) -> None:
+        """Unsubscribe the topic filters subscribed on the broker that a new topic filter covers, they become covered."""
+
+        folded = dict()  # type: Dict[str, int]
+        for subscription in self._subscription_trie.covered_by(topic):
+            if subscription.topic != topic and subscription.topic not in self._covered_topics:
+                folded[subscription.topic] = max(subscription.qos, folded.get(subscription.topic, 0))
+        folded = [(folded_topic, folded_qos) for folded_topic, folded_qos in folded.items() if folded_qos <= qos]
+        for folded_topic, folded_qos in folded:
+            self._cover_topic(folded_topic, folded_qos)
+        for start in range(0, len(folded), MAX_SUBSCRIBE_BATCH):
+            self._unsubscribe([folded_topic for folded_topic, _ in folded[start:start + MAX_SUBSCRIBE_BATCH]])
+
+    def _uncover_topics(self, topic: str) -> None:
+        """Subscribe the topic filters a removed topic filter was the only one to cover."""
+
+        uncovered = []
+        for covered in self._covered_trie.covered_by(topic):
+            if not self._subscription_trie.covers(covered.topic, covered.qos, exact=False):
+                self._covered_trie.remove(self._covered_topics.pop(covered.topic))
+                uncovered.append((covered.topic, covered.qos))
+        for start in range(0, len(uncovered), MAX_SUBSCRIBE_BATCH):
+            self._perform_subscriptions(uncovered[start:start + MAX_SUBSCRIBE_BATCH])
+
+    def _replay_retained(self, subscription: Subscription) -> None:
+        """Call back a new subscription with the cached retained messages it matches, as the broker would have sent them."""
+
+        for entry in self.retained_cache.match(subscription.topic):
+            msg = entry.message
+            entry.delivered += (subscription,)
+            payload = _decode_payload(msg, subscription.encoding)
+            if payload is _UNDECODABLE:
+                continue
+            self.replayed_messages += 1
+            subscription.callback(msg.topic, payload, msg.qos)
+
+    def _cached(self, topic: str) -> bool:
+        """Return True if the cache has retained messages for a topic filter and no topic of unknown retained message."""
+
+        entries = self.retained_cache.match(topic)
+        return bool(entries) and all(entry.retained for entry in entries)
+
+    def _cache_retained(self, msg, subscriptions: list) -> list:
+        """
+        Keep a message in the cache and return the subscriptions to call back
+
+        A retained message the broker sends again unchanged, for a new subscription, is only for the subscriptions
+        that didn't get it yet.
+        """
+
+        entry = self.retained_cache.get(msg.topic)
+        if entry is None or not entry.retained:
+            if not msg.retain:
+                # A live message, the broker clears the retain flag whether the topic has a retained message or not
+                self.retained_cache.store(msg, retained=False)
+                return subscriptions
+        if not msg.payload:
+            # Empty retained payloads clear the retained message
+            self.retained_cache.remove(msg.topic)
+            return subscriptions
+
+        # An update of a topic that had a retained message is retained too
+        callbacks = subscriptions
+        if msg.retain and entry is not None and entry.delivered and entry.message.payload == msg.payload:
+            callbacks = [subscription for subscription in subscriptions if subscription not in entry.delivered]
+            self.skipped_resends += len(subscriptions) - len(callbacks)
+        self.retained_cache.store(msg).delivered = tuple(subscriptions)
+        return callbacks
+
+    def _forget_retained(self, subscription: Subscription) -> None:
+        """Drop a removed subscription from the cache, and the messages no other subscription matches."""
+
+        for entry in self.retained_cache.match(subscription.topic):
+            topic = entry.message.topic
+            if not self._subscription_trie.match(topic):
+                self.retained_cache.remove(topic)
+            elif subscription in entry.delivered:
+                entry.delivered = tuple(delivered for delivered in entry.delivered if delivered is not subscription)
+
     def _perform_subscription(self, topic: str, qos: int) -> int:
         """Perform a paho-mqtt subscription."""
 
@@ -91,8 +684,16 @@ class MQTTWrapper():
             _raise_on_error(result)
             return message_id
 
-    def _unsubscribe(self, topic: str) -> int:
-        """Unsubscribe from a topic."""
+    def _perform_subscriptions(self, topics: list) -> int:
+        """Perform a paho-mqtt subscription to a list of `(topic, qos)` in one SUBSCRIBE packet."""
+
+        if self.connected:
+            result, message_id = self.client.subscribe(topics)
+            _raise_on_error(result)
+            return message_id
+
+    def _unsubscribe(self, topic: Union[str, list]) -> int:
+        """Unsubscribe from a topic or a list of topics in one UNSUBSCRIBE packet."""
 
         if self.connected:
             _LOGGER.debug(f"Unsubscribing to {topic}")
@@ -105,18 +706,70 @@ class MQTTWrapper():
 
         # _LOGGER.debug(f"Received message on { msg.topic}: {msg.payload}")
 
-        for subscription in self.subscriptions:
-            if not _match_topic(subscription.topic, msg.topic):
-                continue
+        metrics = self.metrics
+        if metrics.enabled:
+            dispatch_start = time.perf_counter()
 
-            payload = msg.payload  # type: SubscribePayloadType
-            if subscription.encoding is not None:
-                try:
-                    payload = msg.payload.decode(subscription.encoding)
-                except (AttributeError, UnicodeDecodeError):
-                    _LOGGER.warning(f"Can't decode payload {msg.payload} on {msg.topic} with encoding {subscription.encoding}")
-                    continue
-            subscription.callback(msg.topic, payload, msg.qos)
+        subscriptions = self._subscription_trie.match(msg.topic)
+        if self.retained_cache is not None and subscriptions:
+            subscriptions = self._cache_retained(msg, subscriptions)
+
+        duplicate = deduplicate_all = False
+        if self._deduplicate_topics or self._deduplicate_subscriptions:
+            duplicate, deduplicate_all = self._check_duplicate(msg, subscriptions)
+            if duplicate and deduplicate_all:
+                if metrics.enabled:
+                    metrics.message_dispatched(len(subscriptions), time.perf_counter() - dispatch_start)
+                return
+
+        payloads = dict()  # type: Dict[str, SubscribePayloadType]
+        for subscription in subscriptions:
+            if duplicate and subscription.deduplicate:
+                self.suppressed_callbacks += 1
+                continue
+            # Decode once per encoding, shared by all subscriptions
+            payload = payloads.get(subscription.encoding)
+            if payload is None:
+                payload = payloads[subscription.encoding] = _decode_payload(msg, subscription.encoding)
+            if payload is _UNDECODABLE:
+                continue
+            if metrics.enabled:
+                callback_start = time.perf_counter()
+                subscription.callback(msg.topic, payload, msg.qos)
+                metrics.callback_called(subscription.topic, time.perf_counter() - callback_start)
+            else:
+                subscription.callback(msg.topic, payload, msg.qos)
+
+        if metrics.enabled:
+            metrics.message_dispatched(len(subscriptions), time.perf_counter() - dispatch_start)
+
+    def _check_duplicate(self, msg, subscriptions: list) -> tuple:
+        """
+        Return whether a message repeats the last payload of its topic, and whether all its callbacks are then suppressed
+
+        Keeps the payload for the next message. Payloads only count as repeated for the same subscriptions,
+        so a new subscription gets the message it subscribed for.
+        """
+
+        deduplicate_all = bool(self._deduplicate_topics) and bool(self._deduplicate_trie.match(msg.topic))
+        if not deduplicate_all:
+            deduplicated = [subscription for subscription in subscriptions if subscription.deduplicate]
+            if not deduplicated:
+                return False, False
+            deduplicate_all = len(deduplicated) == len(subscriptions)
+
+        payload = msg.payload
+        last_payload = self._last_payloads.get(msg.topic)
+        if last_payload is not None and last_payload[0] == payload and last_payload[1] == subscriptions:
+            if deduplicate_all:
+                self.suppressed_messages += 1
+                self.suppressed_callbacks += len(subscriptions)
+                self.suppressed_bytes += len(payload)
+            return True, deduplicate_all
+
+        if subscriptions:
+            self._last_payloads[msg.topic] = (bytes(payload), subscriptions)
+        return False, deduplicate_all
 
     def _mqtt_on_connect(self, _mqttc, _userdata, _flags, result_code: int) -> None:
         """On connect callback. Resubscribe to all topics we were subscribed to and publish birth message."""
@@ -127,38 +780,175 @@ class MQTTWrapper():
             return
 
         self.connected = True
+        self._reconnect_tries = 0
+        self.metrics.connected()
+        # Messages may have been missed, the retained messages sent again all reach their callbacks
+        self._last_payloads.clear()
 
         # Group subscriptions to only re-subscribe once for each topic.
+        topics = []
         keyfunc = attrgetter('topic')
         for topic, subs in groupby(sorted(self.subscriptions, key=keyfunc), keyfunc):
             # Re-subscribe with the highest requested qos
             max_qos = max(subscription.qos for subscription in subs)
-            self._perform_subscription(topic, max_qos)
+            topics.append((topic, max_qos))
+
+        if self.retained_cache is not None:
+            # The broker sends the retained messages again, only to the topic filters no other one covers
+            self.retained_cache = RetainedCache()
+            self._covered_topics.clear()
+            self._covered_trie = SubscriptionTrie()
+            uncovered = []
+            for topic, max_qos in topics:
+                if self._subscription_trie.covers(topic, max_qos, exact=False):
+                    covered = self._covered_topics[topic] = Subscription(topic, None, max_qos)
+                    self._covered_trie.add(covered)
+                else:
+                    uncovered.append((topic, max_qos))
+            topics = uncovered
+
+        # Re-subscribe with several topics per SUBSCRIBE packet
+        for start in range(0, len(topics), MAX_SUBSCRIBE_BATCH):
+            self._perform_subscriptions(topics[start:start + MAX_SUBSCRIBE_BATCH])
+
+        # Send what was published while disconnected, unacknowledged messages are resent by paho
+        with self._outbound_lock:
+            self._inflight.clear()
+            self._flush_outbound()
 
     def _mqtt_on_disconnect(self, _mqttc, _userdata, result_code: int) -> None:
         """Disconnected callback."""
 
         self.connected = False
+        self.metrics.disconnected()
 
         # When disconnected because of calling disconnect()
         if result_code == 0:
+            if self._reconnect_timer is not None:
+                self._reconnect_timer.cancel()
+                self._reconnect_timer = None
             return
 
-        tries = 0
+        if self.reconnect_in_loop:
+            # Only one owner reconnects the socket
+            _LOGGER.warning(f"Disconnected from MQTT ({result_code}), the client loop reconnects")
+        elif self._reconnect_timer is None:
+            self._schedule_reconnect(result_code)
+
+    def _schedule_reconnect(self, result_code: int) -> None:
+        """Try to reconnect later without blocking the MQTT thread, backing off exponentially with jitter."""
+
+        wait_time = min(2**self._reconnect_tries, MAX_RECONNECT_WAIT)
+        wait_time = random.uniform(wait_time / 2, wait_time) if self._reconnect_tries else 0
+        if self._reconnect_tries:
+            _LOGGER.warning(f"Disconnected from MQTT ({result_code}). Trying to reconnect in {wait_time:.1f} s")
+
+        self._reconnect_timer = threading.Timer(wait_time, self._try_reconnect, (result_code,))
+        self._reconnect_timer.daemon = True
+        self._reconnect_timer.start()
+
+    def _try_reconnect(self, result_code: int) -> None:
+        self._reconnect_timer = None
+        if self.connected:
+            return
+
+        try:
+            if self.client.reconnect() == 0:
+                _LOGGER.info("Successfully reconnected to the MQTT server")
+                return
+        except socket.error:
+            pass
+
+        self._reconnect_tries += 1
+        self._schedule_reconnect(result_code)
+
 
+class AsyncMQTTWrapper(MQTTWrapper):
+    """
+    Paho MQTT client wrapper for asyncio
+
+    Message and connect callbacks of the paho network thread are handed over to the event loop,
+    so subscription callbacks always run on the loop.
+    The hand over queue is bounded, when it is full the network thread waits for the loop to catch up.
+    Without `loop` the wrapper uses the running event loop, it must then be built in a coroutine.
+    """
+
+    def __init__(self, mqtt_client: MQTTClient, loop: asyncio.AbstractEventLoop=None, max_pending_messages: int=DEFAULT_MAX_PENDING_MESSAGES, **kwargs):
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                raise Exception("AsyncMQTTWrapper needs a loop when built outside of a running event loop")
+        self.loop = loop
+        self._pending = queue.Queue(max_pending_messages)
+        self._drain_lock = threading.Lock()
+        self._drain_scheduled = False
+        super().__init__(mqtt_client, **kwargs)
+
+    @property
+    def pending_messages(self) -> int:
+        """Return the number of callbacks waiting for the event loop."""
+        return self._pending.qsize()
+
+    def _collect_metrics(self) -> dict:
+        metrics = super()._collect_metrics()
+        metrics['pending_messages'] = self._pending.qsize()
+        return metrics
+
+    def _mqtt_on_message(self, _mqttc, _userdata, msg) -> None:
+        self._call_in_loop(super()._mqtt_on_message, _mqttc, _userdata, msg)
+
+    def _mqtt_on_connect(self, _mqttc, _userdata, _flags, result_code: int) -> None:
+        self._call_in_loop(super()._mqtt_on_connect, _mqttc, _userdata, _flags, result_code)
+
+    def _in_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def _call_in_loop(self, callback, *args) -> None:
+        if self._in_loop():
+            callback(*args)
+            return
+
+        # Blocks the network thread while the loop is behind
+        self._pending.put((callback, args))
+        with self._drain_lock:
+            schedule_drain = not self._drain_scheduled
+            self._drain_scheduled = True
+        if schedule_drain:
+            self.loop.call_soon_threadsafe(self._drain)
+
+    def _drain(self) -> None:
+        with self._drain_lock:
+            self._drain_scheduled = False
         while True:
             try:
-                if self.client.reconnect() == 0:
-                    _LOGGER.info("Successfully reconnected to the MQTT server")
-                    break
-            except socket.error:
-                pass
+                callback, args = self._pending.get_nowait()
+            except queue.Empty:
+                return
+            callback(*args)
+
+
+def _decode_payload(msg, encoding: str) -> SubscribePayloadType:
+    """Decode the payload of a message, a `memoryview` of it without encoding."""
+
+    if encoding is None:
+        try:
+            return memoryview(msg.payload)
+        except TypeError:
+            return msg.payload
+    try:
+        return msg.payload.decode(encoding)
+    except (AttributeError, UnicodeDecodeError):
+        _LOGGER.warning(f"Can't decode payload {msg.payload} on {msg.topic} with encoding {encoding}")
+        return _UNDECODABLE
 
-            wait_time = min(2**tries, MAX_RECONNECT_WAIT)
-            _LOGGER.warning(f"Disconnected from MQTT ({result_code}). Trying to reconnect in {wait_time} s")
-            # It is ok to sleep here as we are in the MQTT thread.
-            time.sleep(wait_time)
-            tries += 1
+
+def _granted(subscriptions: list, qos: int) -> bool:
+    """Return True if any of the subscriptions has at least `qos`."""
+    return any(subscription.qos >= qos for subscription in subscriptions)
 
 
 def _raise_on_error(result_code: int) -> None:
@@ -171,20 +961,13 @@ def _raise_on_error(result_code: int) -> None:
 def _match_topic(subscription: str, topic: str) -> bool:
     """Test if topic matches subscription."""
 
-    reg_ex_parts = []  # type: List[str]
-    suffix = ""
-    if subscription.endswith('#'):
-        subscription = subscription[:-2]
-        suffix = "(.*)"
     sub_parts = subscription.split('/')
-    for sub_part in sub_parts:
-        if sub_part == "+":
-            reg_ex_parts.append(r"([^\/]+)")
-        else:
-            reg_ex_parts.append(re.escape(sub_part))
-
-    reg_ex = "^" + (r'\/'.join(reg_ex_parts)) + suffix + "$"
-
-    reg = re.compile(reg_ex)
-
-    return reg.match(topic) is not None
+    topic_parts = topic.split('/')
+    for index, sub_part in enumerate(sub_parts):
+        if sub_part == '#':
+            return True
+        if index >= len(topic_parts):
+            return False
+        if sub_part != '+' and sub_part != topic_parts[index]:
+            return False
+    return len(sub_parts) == len(topic_parts)
@@ -0,0 +1,230 @@
+""" Homie Discovery sharding module """
+
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from typing import Callable
+import zlib
+
+from .homie import Homie
+from .paho_mqtt_client_manager import MQTTWrapper
+from .models import HomieDevice
+from .tools import STAGE_2
+
+MODE_PROCESS = 'process'
+MODE_THREAD = 'thread'
+DEFAULT_TIMEOUT = 10  # seconds
+_SNAPSHOT_RETRIES = 5
+_LOGGER = logging.getLogger(__name__)
+
+
+def shard_of(device_id: str, shards: int) -> int:
+    """Return the shard owning a device, stable across processes unlike `hash`."""
+    return zlib.crc32(device_id.encode('utf-8')) % shards
+
+
+class ShardHomie(Homie):
+    """
+    Homie Discovery controller of one shard
+
+    Only discovers the devices whose ID hashes to `shard` out of `shards`, see `shard_of`.
+    Every shard receives the `$homie` messages (or all messages with `single_subscription`) and drops those
+    of other shards' devices after hashing the device ID, only its own devices get per device subscriptions.
+    """
+
+    def __init__(self, mqtt: MQTTWrapper, shard: int, shards: int, **kwargs):
+        super().__init__(mqtt, **kwargs)
+        self.shard = shard
+        self.shards = shards
+
+    def owns(self, device_id: str) -> bool:
+        """Return True if the device belongs to this shard."""
+        return shard_of(device_id, self.shards) == self.shard
+
+    def _on_discovery_device(self, topic: str, payload: str, msg_qos: int):
+        device_id = topic[len(self.discovery_prefix) + 1:].split('/', 1)[0]
+        if self.owns(device_id):
+            super()._on_discovery_device(topic, payload, msg_qos)
+
+    def _route_message(self, topic: str, payload: str, msg_qos: int):
+        device_id = topic[len(self.discovery_prefix) + 1:].split('/', 1)[0]
+        if self.owns(device_id):
+            super()._route_message(topic, payload, msg_qos)
+
+
+class ShardWorker(object):
+    """
+    Worker running a `ShardHomie` on its own MQTT connection
+
+    Serves the requests of a `ShardCoordinator` until asked to stop.
+    Requests are `(request_id, name, *args)`, responses `(request_id, success, result)`.
+    """
+
+    def __init__(self, shard: int, shards: int, client_factory: Callable, host: str, port: int, homie_kwargs: dict, requests, responses):
+        self.shard = shard
+        self.shards = shards
+        self.client_factory = client_factory
+        self.host = host
+        self.port = port
+        self.homie_kwargs = homie_kwargs
+        self.requests = requests
+        self.responses = responses
+        self.homie = None
+
+    def run(self):
+        """Connect, start discovery and serve requests."""
+
+        client = self.client_factory(self.shard)
+        mqtt = MQTTWrapper(client)
+        self.homie = ShardHomie(mqtt, self.shard, self.shards, **self.homie_kwargs)
+        self.homie.start()
+        client.connect(self.host, self.port)
+        if hasattr(client, 'loop_start'):
+            client.loop_start()
+
+        try:
+            while True:
+                request_id, name, *args = self.requests.get()
+                if name == 'stop':
+                    self.responses.put((request_id, True, None))
+                    return
+                try:
+                    self.responses.put((request_id, True, getattr(self, f'_on_{name}')(*args)))
+                except Exception as error:  # pylint: disable=broad-except
+                    _LOGGER.exception(f"Error serving shard request {name}")
+                    self.responses.put((request_id, False, repr(error)))
+        finally:
+            client.disconnect()
+            if hasattr(client, 'loop_stop'):
+                client.loop_stop()
+
+    def _snapshot_device(self, homie_device):
+        # Discovery keeps running on the MQTT thread, retry if the device changed while copying it
+        for _ in range(_SNAPSHOT_RETRIES):
+            try:
+                return {'stage': homie_device.stage_of_discovery, 'device': homie_device._snapshot()}
+            except RuntimeError:
+                continue
+        return None
+
+    def _on_devices(self):
+        snapshots = (self._snapshot_device(homie_device) for homie_device in list(self.homie.devices))
+        return [device_snapshot for device_snapshot in snapshots if device_snapshot is not None]
+
+    def _on_device(self, device_id: str):
+        if not self.homie.has_device(device_id):
+            return None
+        return self._snapshot_device(self.homie.get_device(device_id))
+
+    def _on_set_state(self, device_id: str, node_id: str, property_id: str, value: str):
+        # Published like `set_state` of the devices rebuilt by the coordinator, not retained
+        homie_property = self.homie.get_device(device_id).get_node(node_id).get_property(property_id)
+        if homie_property.settable:
+            self._on_publish(f'{homie_property._prefix_topic}/set', value)
+
+    def _on_publish(self, topic: str, payload: str):
+        self.homie._publish(topic, payload, retain=False)
+
+
+def _run_worker(*args):
+    ShardWorker(*args).run()
+
+
+class ShardCoordinator(object):
+    """
+    Coordinator of `shards` workers discovering a partition of the devices each
+
+    `client_factory(shard)` returns an unconnected paho client (or a `LocalClient`), workers connect it to `host:port`.
+    In `MODE_PROCESS` each worker is a process, `client_factory` must then be picklable (a module level function).
+    `MODE_THREAD` runs the workers as threads, to use a `LocalBroker` in tests.
+
+    `devices` and `get_device` return copies of the devices rebuilt from their shard's snapshot.
+    Devices still being discovered are returned without their nodes set up.
+    `set_state` of their properties, like `set_state` of the coordinator, is sent to the owning shard,
+    which publishes it without the retain flag.
+
+    MQTT shared subscriptions (`$share/...`) spread messages by load rather than by device,
+    so shards filter on the device ID instead.
+
+    A request not answered within `timeout` seconds raises `queue.Empty`, its late response is discarded.
+    """
+
+    def __init__(self, shards: int, client_factory: Callable, host: str='localhost', port: int=1883, mode: str=MODE_PROCESS,
+                 timeout: float=DEFAULT_TIMEOUT, **homie_kwargs):
+        if mode not in (MODE_PROCESS, MODE_THREAD):
+            raise Exception(f"Unknown shard mode: {mode}")
+
+        self.shards = shards
+        self.mode = mode
+        self.timeout = timeout
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._request_ids = itertools.count()
+        if mode == MODE_PROCESS:
+            self._requests = [multiprocessing.Queue() for _ in range(shards)]
+            self._responses = [multiprocessing.Queue() for _ in range(shards)]
+            self._workers = [multiprocessing.Process(
+                target=_run_worker, name=f'homie-shard-{shard}', daemon=True,
+                args=(shard, shards, client_factory, host, port, homie_kwargs, self._requests[shard], self._responses[shard]),
+            ) for shard in range(shards)]
+        else:
+            self._requests = [queue.Queue() for _ in range(shards)]
+            self._responses = [queue.Queue() for _ in range(shards)]
+            self._workers = [threading.Thread(
+                target=_run_worker, name=f'homie-shard-{shard}', daemon=True,
+                args=(shard, shards, client_factory, host, port, homie_kwargs, self._requests[shard], self._responses[shard]),
+            ) for shard in range(shards)]
+
+    def start(self):
+        """Start the workers."""
+        for worker in self._workers:
+            worker.start()
+
+    def stop(self):
+        """Stop the workers, they disconnect from MQTT."""
+        for shard, worker in enumerate(self._workers):
+            if worker.is_alive():
+                self._request(shard, 'stop')
+                worker.join(self.timeout)
+
+    def _request(self, shard: int, name: str, *args):
+        with self._locks[shard]:
+            request_id = next(self._request_ids)
+            self._requests[shard].put((request_id, name, *args))
+            deadline = time.monotonic() + self.timeout
+            while True:
+                response_id, success, result = self._responses[shard].get(timeout=max(deadline - time.monotonic(), 0))
+                if response_id == request_id:
+                    break
+                # The response of an earlier request that timed out
+                _LOGGER.debug(f"Discarding late response {response_id} of shard {shard}")
+        if not success:
+            raise Exception(f"Shard {shard} failed {name}: {result}")
+        return result
+
+    def _rebuild(self, device_snapshot) -> HomieDevice:
+        snapshot = device_snapshot['device']
+        homie_device = HomieDevice(snapshot['base_topic'], snapshot['id'])
+        homie_device._restore(snapshot)
+        if device_snapshot['stage'] >= STAGE_2:
+            homie_device.setup(lambda topic, msg_callback, qos=None: None, self._publish)
+        return homie_device
+
+    def _publish(self, topic: str, payload: str, retain: bool=False, qos: int=None):
+        device_id = topic.split('/')[-4]  # <prefix>/<device>/<node>/<property>/set
+        self._request(shard_of(device_id, self.shards), 'publish', topic, payload)
+
+    def devices(self) -> list:
+        """Return copies of the devices of all shards."""
+        return [self._rebuild(device_snapshot) for shard in range(self.shards) for device_snapshot in self._request(shard, 'devices')]
+
+    def get_device(self, device_id: str) -> HomieDevice:
+        """Return a copy of a device from its shard, None if it is not known."""
+        device_snapshot = self._request(shard_of(device_id, self.shards), 'device', device_id)
+        return None if device_snapshot is None else self._rebuild(device_snapshot)
+
+    def set_state(self, device_id: str, node_id: str, property_id: str, value: str):
+        """Set the state of a property through the shard owning its device."""
+        self._request(shard_of(device_id, self.shards), 'set_state', device_id, node_id, property_id, value)
@@ -2,3 +2,8 @@
 
 from .change_listner import AttributeChangeListener
 from .homie_discovery_base import (HomieDiscoveryBase, STAGE_0, STAGE_1, STAGE_2, STAGE_ALL)
+from .callback_executor import (CallbackExecutor, POLICY_BLOCK, POLICY_DROP)
+from .metrics import (Metrics, NullMetrics)
+from .converters import ConverterRegistry
+from .entity_index import EntityIndex
+from .journal import (Journal, JournalEvent)
@@ -0,0 +1,124 @@
+"""Callback Executor helper"""
+
+from collections import deque
+import logging
+import threading
+from typing import Callable, Hashable
+
+POLICY_BLOCK = 'block'
+POLICY_DROP = 'drop'
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_QUEUED = 10000
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class CallbackExecutor(object):
+    """
+    Callback Executor helper
+
+    Runs callbacks on a bounded pool of threads, off the MQTT network thread.
+    Callbacks submitted with the same key run one at a time in submit order, different keys run in parallel.
+    When `max_queued` callbacks are waiting, `submit` drops the callback (`POLICY_DROP`, counted in `dropped`)
+    or blocks until there is space (`POLICY_BLOCK`), which holds back the MQTT network thread.
+    Callbacks submitting more callbacks never block, as the workers would then wait for themselves:
+    with a full queue they run the new callback inline when none is pending for its key, or queue it past `max_queued`.
+    """
+
+    def __init__(self, max_workers: int=DEFAULT_MAX_WORKERS, max_queued: int=DEFAULT_MAX_QUEUED, policy: str=POLICY_DROP):
+        if policy not in (POLICY_BLOCK, POLICY_DROP):
+            raise Exception(f"Unknown executor policy: {policy}")
+
+        self.max_queued = max_queued
+        self.policy = policy
+        self.dropped = 0
+
+        self._lock = threading.Lock()
+        self._has_work = threading.Condition(self._lock)
+        self._has_space = threading.Condition(self._lock)
+        self._pending = dict()  # type: Dict[Hashable, deque]
+        self._ready = deque()
+        self._queued = 0
+        self._shutdown = False
+
+        self._workers = [threading.Thread(target=self._work, name=f'homie-callback-{index}', daemon=True) for index in range(max_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    @property
+    def queue_depth(self) -> int:
+        """Return the number of callbacks waiting or running."""
+        return self._queued
+
+    def submit(self, key: Hashable, callback: Callable, *args) -> bool:
+        """Queue a callback after the other callbacks of the key, returns False if it was dropped."""
+
+        with self._lock:
+            inline = False
+            while self._queued >= self.max_queued and not self._shutdown:
+                if self.policy == POLICY_DROP:
+                    if not self.dropped:
+                        _LOGGER.warning(f"Callback queue full with {self.max_queued} callbacks, dropping callbacks")
+                    self.dropped += 1
+                    return False
+                if threading.current_thread() in self._workers:
+                    # Waiting would deadlock the workers, queued past the bound if running it now overtakes the key
+                    inline = key not in self._pending
+                    break
+                self._has_space.wait()
+            if self._shutdown:
+                return False
+
+            if not inline:
+                pending = self._pending.get(key)
+                if pending is None:
+                    self._pending[key] = deque(((callback, args),))
+                    self._ready.append(key)
+                    self._has_work.notify()
+                else:
+                    # Either waiting in the ready queue or running, it is picked up again when done
+                    pending.append((callback, args))
+                self._queued += 1
+                return True
+
+        self._run(callback, args)
+        return True
+
+    def shutdown(self, wait: bool=True):
+        """Stop the workers once the queued callbacks have run."""
+
+        with self._lock:
+            self._shutdown = True
+            self._has_work.notify_all()
+            self._has_space.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while not self._ready and not self._shutdown:
+                    self._has_work.wait()
+                if not self._ready:
+                    return
+                key = self._ready.popleft()
+                callback, args = self._pending[key].popleft()
+
+            self._run(callback, args)
+
+            with self._lock:
+                self._queued -= 1
+                if self._pending[key]:
+                    self._ready.append(key)
+                    self._has_work.notify()
+                else:
+                    del self._pending[key]
+                self._has_space.notify()
+
+    @staticmethod
+    def _run(callback: Callable, args: tuple):
+        try:
+            callback(*args)
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception(f"Error in callback {callback}")
@@ -0,0 +1,79 @@
+"""Change Feed helper"""
+
+import logging
+import threading
+from typing import Callable
+import attr
+
+DEFAULT_WINDOW = 1.0  # seconds
+DEFAULT_BATCH_SIZE = 1000
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@attr.s(slots=True, frozen=True)
+class Change(object):
+    """Class to hold the change of an attribute of an entity."""
+
+    entity = attr.ib()
+    attribute = attr.ib(type=str)
+    previous_value = attr.ib(type=str)
+    value = attr.ib(type=str)
+
+
+class ChangeFeed(object):
+    """
+    Change Feed helper
+
+    Collects attribute changes and delivers them in batches, once `window` seconds after the first change of a batch
+    or as soon as it holds `batch_size` changes. Changes to the same attribute of an entity are coalesced into one change,
+    holding the value before the first change and the latest value.
+    Batches are delivered one at a time and in order, from the timer thread or from the thread adding the change.
+    """
+
+    def __init__(self, on_batch: Callable[[list], None], window: float=DEFAULT_WINDOW, batch_size: int=DEFAULT_BATCH_SIZE):
+        self.on_batch = on_batch
+        self.window = window
+        self.batch_size = batch_size
+
+        self._lock = threading.Lock()
+        # Held while delivering, a batch callback adding changes may flush again
+        self._flush_lock = threading.RLock()
+        self._changes = dict()
+        self._timer = None
+
+    def add(self, entity, attribute: str, previous_value, value):
+        """Add a change to the current batch."""
+
+        key = (entity, attribute)
+        with self._lock:
+            change = self._changes.get(key)
+            if change is not None:
+                previous_value = change.previous_value
+            self._changes[key] = Change(entity, attribute, previous_value, value)
+
+            flush = len(self._changes) >= self.batch_size
+            if not flush and self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if flush:
+            self.flush()
+
+    def flush(self):
+        """Deliver the current batch now."""
+
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                changes = self._changes
+                self._changes = dict()
+
+            if changes:
+                try:
+                    self.on_batch(list(changes.values()))
+                except Exception:  # pylint: disable=broad-except
+                    _LOGGER.exception("Error in change feed batch callback")
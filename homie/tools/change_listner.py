@@ -1,18 +1,9 @@
 """Change Listener Base helper"""
 
 import types
-from typing import Callable
-import attr
 
 ANY_ATTRIBUTE = "*"
-
-
-@attr.s(slots=True, frozen=True)
-class Subscription(object):
-    """Class to hold data about an active subscription."""
-
-    callback = attr.ib(type=Callable[[object, int], None])
-    attribute_names = attr.ib(type=list)
+_MISSING = object()
 
 
 class AttributeChangeListener(object):
@@ -20,33 +11,86 @@ class AttributeChangeListener(object):
     Change Listener Base helper
 
     This class helps you observe chages too arributes of a class
+
+    Listeners are indexed by attribute name, with `ANY_ATTRIBUTE` listeners in their own bucket,
+    so setting an attribute nobody listens to costs a dict lookup at most.
     """
 
+    __slots__ = ('_attribute_subscriptions',)
+
     def __init__(self):
         super().__init__()
-        # self._listeners = list()
-        setattr(self, '_attribute_subscriptions', list())
+        # Created on the first listener, most objects never get one
+        setattr(self, '_attribute_subscriptions', None)
 
     def __setattr__(self, name: str, value: str):
-        previouse_value = getattr(self, name, None)
-        if previouse_value != value:
+        try:
+            subscriptions = self._attribute_subscriptions
+        except AttributeError:
+            subscriptions = None
+        if subscriptions is None or (name not in subscriptions and ANY_ATTRIBUTE not in subscriptions):
+            object.__setattr__(self, name, value)
+            return
+
+        previouse_value = getattr(self, name, _MISSING)
+        if previouse_value is _MISSING:
+            # First assignment, always set it even if the value is None
+            super().__setattr__(name, value)
+            self._call_subscriptions(name, None, value)
+        elif previouse_value != value:
             super().__setattr__(name, value)
             self._call_subscriptions(name, previouse_value, value)
 
     def add_attribute_listener(self, on_attribute_change, attribute_names=ANY_ATTRIBUTE):
         """Add a listener to object attribute value changes"""
 
-        if not isinstance(on_attribute_change, types.FunctionType) and not isinstance(on_attribute_change, types.MethodType):
-            raise Exception("on_attribute_change must be a function")
+        check_callback(on_attribute_change, 'on_attribute_change')
+        self._add_attribute_listener(on_attribute_change, attribute_names)
 
+    def _add_attribute_listener(self, on_attribute_change, attribute_names=ANY_ATTRIBUTE):
         if isinstance(attribute_names, str):
             attribute_names = attribute_names.split(',')
         if not isinstance(attribute_names, list):
             raise Exception(f"attribute_names must be a string or a list: {type(attribute_names)}")
 
-        self._attribute_subscriptions.append(Subscription(on_attribute_change, attribute_names))
+        if self._attribute_subscriptions is None:
+            self._attribute_subscriptions = dict()
+        subscriptions = self._attribute_subscriptions
+        for attribute_name in (ANY_ATTRIBUTE,) if ANY_ATTRIBUTE in attribute_names else attribute_names:
+            subscriptions.setdefault(attribute_name, []).append(on_attribute_change)
+
+    def remove_attribute_listener(self, on_attribute_change, attribute_names=ANY_ATTRIBUTE):
+        """Remove a listener added with the same attribute names, attributes left without listeners are set without checks"""
+
+        if isinstance(attribute_names, str):
+            attribute_names = attribute_names.split(',')
+        subscriptions = self._attribute_subscriptions
+        if subscriptions is None:
+            return
+        for attribute_name in (ANY_ATTRIBUTE,) if ANY_ATTRIBUTE in attribute_names else attribute_names:
+            callbacks = subscriptions.get(attribute_name, ())
+            for callback in callbacks:
+                # Listeners run by a callback executor are wrapped
+                if callback == on_attribute_change or getattr(callback, 'listener', None) == on_attribute_change:
+                    callbacks.remove(callback)
+                    break
+            if not callbacks:
+                subscriptions.pop(attribute_name, None)
+        if not subscriptions:
+            self._attribute_subscriptions = None
 
     def _call_subscriptions(self, attribute_name, previouse_value, value):
-        for subscription in self._attribute_subscriptions:
-            if attribute_name in subscription.attribute_names or ANY_ATTRIBUTE in subscription.attribute_names:
-                subscription.callback(self, attribute_name, previouse_value, value)
+        """Call the listeners of the attribute, then those of any attribute"""
+        subscriptions = self._attribute_subscriptions
+        for callback in subscriptions.get(attribute_name, ()):
+            callback(self, attribute_name, previouse_value, value)
+        if attribute_name != ANY_ATTRIBUTE:
+            for callback in subscriptions.get(ANY_ATTRIBUTE, ()):
+                callback(self, attribute_name, previouse_value, value)
+
+
+def check_callback(callback, argument_name: str):
+    """Raise if a callback isn't a function or a method"""
+
+    if not isinstance(callback, types.FunctionType) and not isinstance(callback, types.MethodType):
+        raise Exception(f"{argument_name} must be a function")
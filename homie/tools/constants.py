@@ -6,6 +6,7 @@ import re
 # REGEX
 DISCOVER_DEVICE_FROM_TOPIC = re.compile(r'(?P<prefix_topic>\w[-/\w]*\w)/(?P<device_id>\w[-\w]*\w)/\$homie')
 DISCOVER_NODES_FROM_PAYLOAD = re.compile(r'(?P<node_id>\w[-/\w]*\w)')
+DEVICE_ID = re.compile(r'\w[-\w]*\w')
 DISCOVER_PROPERTIES_FROM_PAYLOAD = re.compile(r'(?P<property_id>\w[-/\w]*\w)(\[(?P<range_start>[0-9])-(?P<range_end>[0-9]+)\])?(?P<settable>:settable)?')
 
 # Global
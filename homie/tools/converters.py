@@ -0,0 +1,139 @@
+"""Property Value Converters helper"""
+
+from typing import Callable
+
+from .constants import (
+    STATE_ON,
+    STATE_OFF,
+    TYPE_SENSOR,
+    TYPE_SWITCH,
+    TYPE_LIGHT,
+    TYPE_LIGHT_RGB,
+    PROP_VALUE,
+    PROP_ON,
+    PROP_BRIGHTNESS,
+    PROP_RGB,
+)
+
+ConverterType = Callable[[str], object]
+
+
+def to_bool(payload: str) -> bool:
+    """Convert a homie string bool, raises ValueError if it is neither `true` nor `false`"""
+    if payload == STATE_ON:
+        return True
+    if payload == STATE_OFF:
+        return False
+    raise ValueError(f"Not a bool: {payload}")
+
+
+def to_int(payload: str) -> int:
+    """Convert a homie string integer"""
+    return int(payload)
+
+
+def to_float(payload: str) -> float:
+    """Convert a homie string float"""
+    return float(payload)
+
+
+def to_rgb(payload: str) -> tuple:
+    """Convert a homie `r,g,b` color to a tuple of ints"""
+    rgb = tuple(int(channel) for channel in payload.split(','))
+    if len(rgb) != 3 or not all(0 <= channel <= 255 for channel in rgb):
+        raise ValueError(f"Not an RGB color: {payload}")
+    return rgb
+
+
+def to_enum(values) -> ConverterType:
+    """Return a converter accepting only one of `values`"""
+    values = frozenset(values)
+
+    def _to_enum(payload: str) -> str:
+        if payload not in values:
+            raise ValueError(f"Not one of {sorted(values)}: {payload}")
+        return payload
+    _to_enum.__name__ = 'to_enum'
+    return _to_enum
+
+
+# Converters by node type and property ID
+DEFAULT_RULES = {
+    (TYPE_SENSOR, PROP_VALUE): to_float,
+    (TYPE_SWITCH, PROP_ON): to_bool,
+    (TYPE_LIGHT, PROP_ON): to_bool,
+    (TYPE_LIGHT, PROP_BRIGHTNESS): to_int,
+    (TYPE_LIGHT_RGB, PROP_ON): to_bool,
+    (TYPE_LIGHT_RGB, PROP_BRIGHTNESS): to_int,
+    (TYPE_LIGHT_RGB, PROP_RGB): to_rgb,
+}
+
+# Converters by declared `$datatype` of a property
+DATATYPES = {
+    'integer': to_int,
+    'float': to_float,
+    'boolean': to_bool,
+}
+
+
+class ConverterRegistry(object):
+    """
+    Property Value Converters helper
+
+    Chooses the converter of a property state, in order from the rules added with `register` (latest first),
+    the `$datatype` and `$format` declared by the property, then its node type and property ID.
+    Properties without a converter keep their string state as value.
+    Payloads a converter rejects are counted in `parse_failures`, by converter name in `parse_failures_by_converter`.
+    """
+
+    def __init__(self):
+        self.parse_failures = 0
+        self.parse_failures_by_converter = dict()  # type: Dict[str, int]
+        self._rules = list()
+        self._cache = dict()
+
+    def register(self, converter: ConverterType, property_id: str=None, node_type: str=None, datatype: str=None):
+        """Use `converter` for the properties matching all the given filters."""
+        self._rules.insert(0, (property_id, node_type, datatype, converter))
+        self._cache.clear()
+
+    def converter_for(self, node_type: str, property_id: str, datatype: str=None, value_format: str=None) -> ConverterType:
+        """Return the converter of a property, None if its state is a plain string."""
+
+        key = (node_type, property_id, datatype, value_format)
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+
+        converter = self._choose(node_type, property_id, datatype, value_format)
+        self._cache[key] = converter
+        return converter
+
+    def _choose(self, node_type: str, property_id: str, datatype: str, value_format: str) -> ConverterType:
+        for rule_property_id, rule_node_type, rule_datatype, converter in self._rules:
+            if ((rule_property_id is None or rule_property_id == property_id) and
+                    (rule_node_type is None or rule_node_type == node_type) and
+                    (rule_datatype is None or rule_datatype == datatype)):
+                return converter
+
+        if datatype == 'enum' and value_format:
+            return to_enum(value_format.split(','))
+        if datatype == 'color' and value_format == 'rgb':
+            return to_rgb
+        if datatype in DATATYPES:
+            return DATATYPES[datatype]
+        if datatype is not None:
+            return None
+
+        return DEFAULT_RULES.get((node_type, property_id))
+
+    def convert(self, converter: ConverterType, payload: str):
+        """Convert a payload, None if the converter rejects it."""
+        try:
+            return converter(payload)
+        except (TypeError, ValueError):
+            self.parse_failures += 1
+            name = getattr(converter, '__name__', repr(converter))
+            self.parse_failures_by_converter[name] = self.parse_failures_by_converter.get(name, 0) + 1
+            return None
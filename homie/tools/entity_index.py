@@ -0,0 +1,130 @@
+"""Entity Index helper"""
+
+import threading
+
+from .helpers import string_to_bool
+
+INDEX_ONLINE = 'online'
+INDEX_FIRMWARE_NAME = 'firmware_name'
+INDEX_FIRMWARE_VERSION = 'firmware_version'
+INDEX_NODE_TYPE = 'node_type'
+INDEX_PROPERTY_ID = 'property_id'
+INDEX_SETTABLE = 'settable'
+
+# Indexed attributes that change: attribute name -> (index, key of a value)
+_ATTRIBUTE_INDEXES = {
+    '_online': (INDEX_ONLINE, string_to_bool),
+    '_fw_name': (INDEX_FIRMWARE_NAME, None),
+    '_fw_version': (INDEX_FIRMWARE_VERSION, None),
+    '_type': (INDEX_NODE_TYPE, None),
+    '_settable': (INDEX_SETTABLE, None),
+}
+DEVICE_ATTRIBUTES = ['_online', '_fw_name', '_fw_version']
+NODE_ATTRIBUTES = ['_type']
+PROPERTY_ATTRIBUTES = ['_settable']
+
+
+class EntityIndex(object):
+    """
+    Entity Index helper
+
+    Indexes of devices by online state and firmware name and version, nodes by type,
+    properties by property ID and settable flag, and of all entities by entity ID.
+    Entities are kept in insertion order, `on_attribute_change` is the attribute listener that keeps indexes up to date.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._indexes = {name: dict() for name in (
+            INDEX_ONLINE, INDEX_FIRMWARE_NAME, INDEX_FIRMWARE_VERSION, INDEX_NODE_TYPE, INDEX_PROPERTY_ID, INDEX_SETTABLE)}
+        self._entities = dict()
+
+    def _add(self, index: str, key, entity):
+        # Dicts as ordered sets
+        self._indexes[index].setdefault(key, dict())[entity] = None
+
+    def _discard(self, index: str, key, entity):
+        entities = self._indexes[index].get(key)
+        if entities is not None:
+            entities.pop(entity, None)
+            if not entities:
+                del self._indexes[index][key]
+
+    def add_device(self, homie_device):
+        """Index a device, not its nodes."""
+        with self._lock:
+            self._entities[homie_device.entity_id] = homie_device
+            self._add(INDEX_ONLINE, homie_device.online, homie_device)
+            self._add(INDEX_FIRMWARE_NAME, homie_device.firmware_name, homie_device)
+            self._add(INDEX_FIRMWARE_VERSION, homie_device.firmware_version, homie_device)
+
+    def add_node(self, homie_node):
+        """Index a node, not its properties."""
+        with self._lock:
+            self._entities[homie_node.entity_id] = homie_node
+            self._add(INDEX_NODE_TYPE, homie_node.type, homie_node)
+
+    def add_property(self, homie_property):
+        """Index a property."""
+        with self._lock:
+            self._entities[homie_property.entity_id] = homie_property
+            self._add(INDEX_PROPERTY_ID, homie_property.property_id, homie_property)
+            self._add(INDEX_SETTABLE, homie_property.settable, homie_property)
+
+    def _discard_entity(self, entity):
+        if self._entities.get(entity.entity_id) is entity:
+            del self._entities[entity.entity_id]
+
+    def remove_property(self, homie_property):
+        """Remove a property from the indexes."""
+        with self._lock:
+            self._discard_entity(homie_property)
+            self._discard(INDEX_PROPERTY_ID, homie_property.property_id, homie_property)
+            self._discard(INDEX_SETTABLE, homie_property.settable, homie_property)
+
+    def remove_node(self, homie_node):
+        """Remove a node and its properties from the indexes."""
+        with self._lock:
+            for homie_property in homie_node.properties:
+                self.remove_property(homie_property)
+            self._discard_entity(homie_node)
+            self._discard(INDEX_NODE_TYPE, homie_node.type, homie_node)
+
+    def remove_device(self, homie_device):
+        """Remove a device, its nodes and their properties from the indexes."""
+        with self._lock:
+            for homie_node in homie_device.nodes:
+                self.remove_node(homie_node)
+            self._discard_entity(homie_device)
+            self._discard(INDEX_ONLINE, homie_device.online, homie_device)
+            self._discard(INDEX_FIRMWARE_NAME, homie_device.firmware_name, homie_device)
+            self._discard(INDEX_FIRMWARE_VERSION, homie_device.firmware_version, homie_device)
+
+    def on_attribute_change(self, entity, attribute_name, previous_value, value):
+        """Move an entity to the key of the new value of an indexed attribute."""
+        index, key = _ATTRIBUTE_INDEXES[attribute_name]
+        if key is not None:
+            previous_value, value = key(previous_value), key(value)
+        if previous_value != value:
+            with self._lock:
+                self._discard(index, previous_value, entity)
+                self._add(index, value, entity)
+
+    def get(self, index: str, key) -> list:
+        """Return the entities of a key of an index."""
+        with self._lock:
+            return list(self._indexes[index].get(key, ()))
+
+    def find(self, criteria: dict) -> list:
+        """Return the entities matching all `index: key` criteria, walking the smallest of their index entries."""
+        with self._lock:
+            candidates = [self._indexes[index].get(key, {}) for index, key in criteria.items()]
+            if not candidates:
+                return []
+            candidates.sort(key=len)
+            smallest, others = candidates[0], candidates[1:]
+            return [entity for entity in smallest if all(entity in entities for entities in others)]
+
+    def get_entity(self, entity_id: str):
+        """Return the entity of an entity ID, None if there is none."""
+        return self._entities.get(entity_id)
@@ -1,5 +1,8 @@
 """Homie hHelper module"""
 
+import warnings
+
+from . import constants
 from .constants import (
     DISCOVER_DEVICE_FROM_TOPIC,
     DISCOVER_NODES_FROM_PAYLOAD,
@@ -36,6 +39,41 @@ def int_to_string(value, dp=0):
     return str(round(value, dp))
 
 
+def attribute_setter(attribute_name: str, after_update: str=None, before_update: str=None):
+    """
+    Return a topic handler that stores the payload in an attribute of the entity
+
+    `after_update` is the name of a method of the entity to call once the attribute is stored,
+    `before_update` the name of a method called with the payload before it is stored
+    """
+    def _set_attribute(entity, payload):
+        if before_update is not None:
+            getattr(entity, before_update)(payload)
+        setattr(entity, attribute_name, payload)
+        if after_update is not None:
+            getattr(entity, after_update)()
+    _set_attribute.attribute_name = attribute_name
+    return _set_attribute
+
+
+def snapshot_attributes(entity):
+    """Return the known attributes of an entity by attribute topic"""
+    attributes = dict()
+    for attribute, handler in entity._ATTRIBUTE_HANDLERS.items():
+        value = getattr(entity, handler.attribute_name)
+        if value is not constants.STATE_UNKNOWN:
+            attributes[attribute] = value
+    return attributes
+
+
+def restore_attributes(entity, attributes):
+    """Load attributes of an entity by attribute topic, as if they were received"""
+    for attribute, payload in attributes.items():
+        handler = entity._ATTRIBUTE_HANDLERS.get(attribute)
+        if handler is not None:
+            handler(entity, payload)
+
+
 def check_node_has_prop(platform: str, node, homie_property_id: str):
     """Check a homie node has a homie property"""
     if not node.has_property(homie_property_id):
@@ -90,13 +128,13 @@ def _proccess_property_match(property_match):
 
 
 def can_advance_stage(target_stage, children):
-    """Helper to know if all children are at lest at a target stage of discovery"""
-    can_advance = True
-    for child in children.values():
-        if child.stage_of_discovery < target_stage:
-            can_advance = False
+    """
+    Helper to know if all children are at lest at a target stage of discovery
 
-    return can_advance
+    Deprecated, entities keep count of the stages of their children, see `HomieDiscoveryBase`.
+    """
+    warnings.warn("can_advance_stage is deprecated, entities count the stages of their children", DeprecationWarning, stacklevel=2)
+    return all(child.stage_of_discovery >= target_stage for child in children.values())
 
 
 class MissingPropertyError(Exception):
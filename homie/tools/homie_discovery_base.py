@@ -1,9 +1,8 @@
 """Homie Discovery Base helper"""
 
-import types
 from typing import Callable
 import attr
-from .change_listner import AttributeChangeListener
+from .change_listner import (AttributeChangeListener, ANY_ATTRIBUTE, check_callback)
 
 STAGE_ALL = -1
 STAGE_0 = 0
@@ -22,27 +21,83 @@ class Subscription(object):
 class HomieDiscoveryBase(AttributeChangeListener):
     """Homie Discovery Base heper"""
 
+    __slots__ = ('_stage_of_discovery', '_on_discovery_subscriptions', '_discovery_parent', '_child_stage_counts')
+
     def __init__(self):
         super().__init__()
 
         self._stage_of_discovery = STAGE_0
-        self._on_discovery_subscriptions = list()
+        # Created when first needed, properties never have children
+        self._on_discovery_subscriptions = None
+        self._discovery_parent = None
+        self._child_stage_counts = None
 
     def add_on_discovery_stage_change(self, on_discovery_stage, stage=STAGE_ALL):
         """Add a on discovery change subscription"""
 
-        if not isinstance(on_discovery_stage, types.FunctionType) and not isinstance(on_discovery_stage, types.MethodType):
-            raise Exception(f"on_discovery_stage must be a function")
+        check_callback(on_discovery_stage, 'on_discovery_stage')
+        if self._on_discovery_subscriptions is None:
+            self._on_discovery_subscriptions = list()
         self._on_discovery_subscriptions.append(Subscription(on_discovery_stage, stage))
 
+    def add_attribute_listener(self, on_attribute_change, attribute_names=ANY_ATTRIBUTE):
+        """Add a listener to object attribute value changes, run by the callback executor of the device if it has one"""
+
+        check_callback(on_attribute_change, 'on_attribute_change')
+        executor, homie_device = self._get_callback_executor()
+        if executor is not None:
+            listener = on_attribute_change
+
+            def on_attribute_change(entity, attribute_name, previouse_value, value):
+                executor.submit(homie_device, listener, entity, attribute_name, previouse_value, value)
+            on_attribute_change.listener = listener
+
+        self._add_attribute_listener(on_attribute_change, attribute_names)
+
+    def _get_callback_executor(self):
+        """Return the callback executor of the device the entity belongs to and the device"""
+
+        entity = self
+        while entity._discovery_parent is not None:
+            entity = entity._discovery_parent
+        return getattr(entity, '_callback_executor', None), entity
+
     @property
     def stage_of_discovery(self):
         """Get stage of discovery"""
 
         return self._stage_of_discovery
 
+    def _add_discovery_child(self, child):
+        """Keep count of the discovery stage of a child, it updates the count as it changes stage"""
+
+        child._discovery_parent = self
+        if self._child_stage_counts is None:
+            self._child_stage_counts = [0, 0, 0]
+        self._child_stage_counts[child._stage_of_discovery] += 1
+
+    def _remove_discovery_child(self, child):
+        """Stop counting the discovery stage of a child"""
+
+        child._discovery_parent = None
+        self._child_stage_counts[child._stage_of_discovery] -= 1
+
+    def _can_advance_stage(self, target_stage):
+        """Return True if there are children and all of them are at least at a target stage of discovery"""
+
+        stage_counts = self._child_stage_counts
+        return stage_counts is not None and any(stage_counts) and not any(stage_counts[:target_stage])
+
     def _set_discovery_stage(self, stage):
+        previous_stage = self._stage_of_discovery
+        if previous_stage == stage:
+            return
         self._stage_of_discovery = stage
-        for subscription in self._on_discovery_subscriptions:
+        if self._discovery_parent is not None:
+            stage_counts = self._discovery_parent._child_stage_counts
+            stage_counts[previous_stage] -= 1
+            stage_counts[stage] += 1
+        # Listeners added by listeners, while the stage change cascades to the parents, only get later changes
+        for subscription in tuple(self._on_discovery_subscriptions or ()):
             if subscription.stage == stage or subscription.stage == STAGE_ALL:
                 subscription.callback(self, stage)
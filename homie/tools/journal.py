@@ -0,0 +1,117 @@
+"""Event Journal helper"""
+
+import logging
+import threading
+from typing import Callable
+import attr
+
+DEFAULT_CAPACITY = 10000
+EVENT_DEVICE_STAGE = 'device_stage'
+EVENT_NODE_STAGE = 'node_stage'
+EVENT_PROPERTY_STAGE = 'property_stage'
+EVENT_PROPERTY_STATE = 'property_state'
+EVENT_DEVICE_REMOVED = 'device_removed'
+EVENT_NODE_REMOVED = 'node_removed'
+EVENT_PROPERTY_REMOVED = 'property_removed'
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@attr.s(slots=True, frozen=True)
+class JournalEvent(object):
+    """Class to hold an event of the journal."""
+
+    sequence = attr.ib(type=int)
+    kind = attr.ib(type=str)
+    entity = attr.ib()
+    previous_value = attr.ib()
+    value = attr.ib()
+
+
+class Journal(object):
+    """
+    Event Journal helper
+
+    Keeps the last `capacity` events in a preallocated ring, numbered by a sequence starting at 1.
+    Consumers attach from a sequence: the events they missed are replayed from the ring, then they get new events as they are appended.
+    Consumers run on the thread appending the event, or on the attaching thread for the replay, one event at a time.
+    """
+
+    def __init__(self, capacity: int=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._events = [None] * capacity
+        self._next_sequence = 1
+        self._consumers = list()
+        self._lock = threading.RLock()
+
+    @property
+    def last_sequence(self) -> int:
+        """Return the sequence of the last event, 0 if there is none."""
+        return self._next_sequence - 1
+
+    @property
+    def oldest_sequence(self) -> int:
+        """Return the sequence of the oldest event still in the journal."""
+        return max(1, self._next_sequence - self.capacity)
+
+    def append(self, kind: str, entity, previous_value, value) -> int:
+        """Append an event, deliver it to the consumers and return its sequence."""
+
+        with self._lock:
+            sequence = self._next_sequence
+            event = JournalEvent(sequence, kind, entity, previous_value, value)
+            self._events[sequence % self.capacity] = event
+            self._next_sequence = sequence + 1
+            for consumer in self._consumers:
+                _deliver(consumer, event)
+        return sequence
+
+    def read(self, from_sequence: int) -> list:
+        """Return the events from a sequence on, None if some of them are no longer in the journal."""
+
+        with self._lock:
+            from_sequence = max(from_sequence, 1)
+            if from_sequence < self.oldest_sequence:
+                return None
+            return [self._events[sequence % self.capacity] for sequence in range(from_sequence, self._next_sequence)]
+
+    def attach(self, on_event: Callable[[JournalEvent], None], from_sequence: int=None, on_gap: Callable[[int], None]=None) -> bool:
+        """
+        Replay the events from `from_sequence` on to `on_event`, then deliver new events to it
+
+        If those events are no longer in the journal, `on_gap` is called with the last sequence instead of the replay,
+        and False is returned. Without `from_sequence` only new events are delivered.
+        The replay and `on_gap` run without holding the journal, events appended meanwhile are replayed after them.
+        """
+
+        replayed = True
+        while True:
+            with self._lock:
+                if from_sequence is None or from_sequence >= self._next_sequence:
+                    # Caught up, the consumer gets the next events as they are appended
+                    self._consumers.append(on_event)
+                    return replayed
+                events = self.read(from_sequence)
+                last_sequence = self.last_sequence
+                if events is None and on_gap is None:
+                    raise Exception(f"Journal events from {from_sequence} are no longer kept, the oldest is {self.oldest_sequence}")
+
+            if events is None:
+                on_gap(last_sequence)
+                replayed = False
+            else:
+                for event in events:
+                    _deliver(on_event, event)
+            from_sequence = last_sequence + 1
+
+    def detach(self, on_event: Callable[[JournalEvent], None]):
+        """Stop delivering events to a consumer."""
+        with self._lock:
+            self._consumers.remove(on_event)
+
+
+def _deliver(consumer, event: JournalEvent):
+    try:
+        consumer(event)
+    except Exception:  # pylint: disable=broad-except
+        _LOGGER.exception(f"Error in journal consumer {consumer}")
@@ -0,0 +1,221 @@
+"""Runtime Metrics helper"""
+
+from bisect import bisect_left
+import threading
+import time
+from typing import Callable
+
+# Latency buckets in seconds, the last one is +Inf
+DEFAULT_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+METRIC_PREFIX = 'homie'
+
+
+class Histogram(object):
+    """Cumulative latency histogram, Prometheus style."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """Add a sample."""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        """Return the cumulative count of each bucket, the sum and the count."""
+        cumulative, buckets = 0, dict()
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            buckets[bound] = cumulative
+        return {'buckets': buckets, 'sum': self.sum, 'count': self.count}
+
+
+class Metrics(object):
+    """
+    Runtime Metrics helper
+
+    Counts messages received, matched and unmatched, callbacks, reconnects and time disconnected,
+    with histograms of message dispatch and callback latency.
+    With `callbacks_by_topic` callbacks are also counted per subscription topic filter, one series per filter.
+    Gauges and counters kept elsewhere, like the number of subscriptions or of entities by discovery stage, are read from
+    collectors added with `add_collector` when `snapshot` is called. A collector returns a dict of metric name to a number,
+    or to a dict of discovery stage to a number. Metrics are gauges unless their name is in the `counters` of the collector.
+    """
+
+    enabled = True
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, callbacks_by_topic: bool=False):
+        self.messages_received = 0
+        self.messages_matched = 0
+        self.messages_unmatched = 0
+        self.callbacks = 0
+        self.callbacks_by_topic = dict() if callbacks_by_topic else None  # type: Dict[str, int]
+        self.dispatch_latency = Histogram(buckets)
+        self.callback_latency = Histogram(buckets)
+        self.reconnects = 0
+        self._disconnected_seconds = 0.0
+        self._disconnected_at = None
+        self._connected_once = False
+        self._collectors = list()
+        self._counters = set()
+        self._lock = threading.Lock()
+
+    def add_collector(self, collector: Callable[[], dict], counters=()):
+        """Add a function returning metrics, called by `snapshot`, those named in `counters` only ever increase."""
+        self._collectors.append(collector)
+        self._counters.update(counters)
+
+    def remove_collector(self, collector: Callable[[], dict]):
+        """Remove a function added with `add_collector`."""
+        self._collectors.remove(collector)
+
+    def message_dispatched(self, matched: int, seconds: float):
+        """Record a received message, the number of subscriptions it matched and the time to dispatch it."""
+        self.messages_received += 1
+        if matched:
+            self.messages_matched += 1
+        else:
+            self.messages_unmatched += 1
+        self.dispatch_latency.observe(seconds)
+
+    def callback_called(self, topic: str, seconds: float):
+        """Record a call of the callback of a subscription."""
+        self.callbacks += 1
+        if self.callbacks_by_topic is not None:
+            self.callbacks_by_topic[topic] = self.callbacks_by_topic.get(topic, 0) + 1
+        self.callback_latency.observe(seconds)
+
+    def connected(self):
+        """Record a connection, a reconnect if it was connected before."""
+        with self._lock:
+            if self._connected_once:
+                self.reconnects += 1
+            self._connected_once = True
+            if self._disconnected_at is not None:
+                self._disconnected_seconds += time.monotonic() - self._disconnected_at
+                self._disconnected_at = None
+
+    def disconnected(self):
+        """Record a lost connection."""
+        with self._lock:
+            if self._disconnected_at is None:
+                self._disconnected_at = time.monotonic()
+
+    @property
+    def disconnected_seconds(self) -> float:
+        """Return the time spent disconnected, including the current disconnection."""
+        with self._lock:
+            seconds = self._disconnected_seconds
+            if self._disconnected_at is not None:
+                seconds += time.monotonic() - self._disconnected_at
+        return seconds
+
+    def snapshot(self) -> dict:
+        """Return all metrics as a dict."""
+        metrics = {
+            'messages_received': self.messages_received,
+            'messages_matched': self.messages_matched,
+            'messages_unmatched': self.messages_unmatched,
+            'callbacks': self.callbacks,
+            'dispatch_latency': self.dispatch_latency.snapshot(),
+            'callback_latency': self.callback_latency.snapshot(),
+            'reconnects': self.reconnects,
+            'disconnected_seconds': self.disconnected_seconds,
+        }
+        if self.callbacks_by_topic is not None:
+            metrics['callbacks_by_topic'] = dict(self.callbacks_by_topic)
+        for collector in self._collectors:
+            metrics.update(collector())
+        return metrics
+
+    def to_prometheus(self, prefix: str=METRIC_PREFIX) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+
+        metrics = self.snapshot()
+        lines = []
+
+        def add(name, kind, help_text, samples):
+            lines.append(f'# HELP {prefix}_{name} {help_text}')
+            lines.append(f'# TYPE {prefix}_{name} {kind}')
+            for suffix, labels, value in samples:
+                label_text = ','.join(f'{label}="{_escape(label_value)}"' for label, label_value in labels)
+                lines.append(f'{prefix}_{name}{suffix}{{{label_text}}} {value}' if labels else f'{prefix}_{name}{suffix} {value}')
+
+        add('messages_received_total', 'counter', 'MQTT messages received.', [('', (), metrics.pop('messages_received'))])
+        add('messages_matched_total', 'counter', 'MQTT messages matching a subscription.', [('', (), metrics.pop('messages_matched'))])
+        add('messages_unmatched_total', 'counter', 'MQTT messages matching no subscription.', [('', (), metrics.pop('messages_unmatched'))])
+        callbacks, callbacks_by_topic = metrics.pop('callbacks'), metrics.pop('callbacks_by_topic', None)
+        if callbacks_by_topic is None:
+            add('callbacks_total', 'counter', 'Subscription callbacks called.', [('', (), callbacks)])
+        else:
+            add('callbacks_total', 'counter', 'Subscription callbacks called, by subscription topic.',
+                [('', (('topic', topic),), count) for topic, count in sorted(callbacks_by_topic.items())])
+        for name, help_text in (('dispatch_latency', 'Time to dispatch an MQTT message to its subscriptions.'),
+                                ('callback_latency', 'Time spent in a subscription callback.')):
+            histogram = metrics.pop(name)
+            samples = [('_bucket', (('le', _format_bound(bound)),), count) for bound, count in histogram['buckets'].items()]
+            samples.append(('_sum', (), histogram['sum']))
+            samples.append(('_count', (), histogram['count']))
+            add(f'{name}_seconds', 'histogram', help_text, samples)
+        add('reconnects_total', 'counter', 'Reconnections to the MQTT broker.', [('', (), metrics.pop('reconnects'))])
+        add('disconnected_seconds_total', 'counter', 'Time spent disconnected from the MQTT broker.',
+            [('', (), metrics.pop('disconnected_seconds'))])
+
+        # Metrics of the collectors
+        for name, value in metrics.items():
+            if name in self._counters:
+                add(f'{name}_total', 'counter', f'{name.replace("_", " ").capitalize()}.', [('', (), value)])
+            elif isinstance(value, dict):
+                add(name, 'gauge', f'{name.replace("_", " ").capitalize()} by discovery stage.',
+                    [('', (('stage', stage),), count) for stage, count in sorted(value.items())])
+            else:
+                add(name, 'gauge', f'{name.replace("_", " ").capitalize()}.', [('', (), value)])
+
+        return '\n'.join(lines) + '\n'
+
+
+class NullMetrics(object):
+    """Metrics that record nothing, the default."""
+
+    enabled = False
+
+    def add_collector(self, collector, counters=()):
+        pass
+
+    def remove_collector(self, collector):
+        pass
+
+    def message_dispatched(self, matched: int, seconds: float):
+        pass
+
+    def callback_called(self, topic: str, seconds: float):
+        pass
+
+    def connected(self):
+        pass
+
+    def disconnected(self):
+        pass
+
+    def snapshot(self) -> dict:
+        return dict()
+
+    def to_prometheus(self, prefix: str=METRIC_PREFIX) -> str:
+        return ''
+
+
+NULL_METRICS = NullMetrics()
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_bound(bound: float) -> str:
+    return '+Inf' if bound == float('inf') else repr(bound)
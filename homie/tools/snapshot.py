@@ -0,0 +1,40 @@
+"""Homie discovery snapshot helper"""
+
+import gzip
+import json
+import os
+
+SNAPSHOT_VERSION = 1
+
+
+def save_snapshot(path: str, devices: list):
+    """
+    Write a snapshot of device trees to a file
+
+    The file is gzip compressed when the path ends with `.gz`, it is replaced atomically
+    """
+    data = json.dumps({'version': SNAPSHOT_VERSION, 'devices': devices}, separators=(',', ':')).encode('utf-8')
+    if path.endswith('.gz'):
+        data = gzip.compress(data)
+
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as snapshot_file:
+        snapshot_file.write(data)
+    os.replace(temp_path, path)
+
+
+def load_snapshot(path: str):
+    """
+    Read the device trees of a snapshot file
+
+    Returns an empty list if the snapshot was written by an other snapshot version
+    """
+    with open(path, 'rb') as snapshot_file:
+        data = snapshot_file.read()
+    if path.endswith('.gz'):
+        data = gzip.decompress(data)
+
+    snapshot = json.loads(data.decode('utf-8'))
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        return []
+    return snapshot['devices']
@@ -0,0 +1,220 @@
+"""Numeric State Store helper"""
+
+from array import array
+import math
+import threading
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .constants import (STATE_ON, STATE_OFF)
+
+DEFAULT_HISTORY = 64
+DEFAULT_CAPACITY = 1024
+_NAN = float('nan')
+
+
+class NumericStateStore(object):
+    """
+    Numeric State Store helper
+
+    Keeps the last `history` numeric samples and their timestamps of every property it is fed,
+    in preallocated ring buffers with one row per property.
+    The buffers are NumPy arrays when NumPy is installed, `array('d')` otherwise.
+    Values are numbers, bools or Homie states, non numeric values are not stored and are counted in `parse_failures`.
+    Rows of removed properties are reused by new properties.
+    """
+
+    def __init__(self, history: int=DEFAULT_HISTORY, capacity: int=DEFAULT_CAPACITY, use_numpy: bool=None):
+        self.history = history
+        self.parse_failures = 0
+        self._numpy = numpy if use_numpy is None or use_numpy else None
+        if use_numpy and numpy is None:
+            raise Exception("NumPy is not installed")
+
+        self._lock = threading.Lock()
+        self._rows = dict()  # type: Dict[HomieProperty, int]
+        self._properties = list()
+        self._rows_by_property_id = dict()  # type: Dict[str, List[int]]
+        self._free_rows = list()
+        self._capacity = 0
+        self._values = None
+        self._timestamps = None
+        self._positions = None
+        self._grow(capacity)
+
+    def _grow(self, capacity: int):
+        added = capacity - self._capacity
+        if self._numpy is not None:
+            values = self._numpy.full((capacity, self.history), _NAN)
+            timestamps = self._numpy.full((capacity, self.history), _NAN)
+            positions = self._numpy.zeros(capacity, dtype=self._numpy.int64)
+            if self._capacity:
+                values[:self._capacity] = self._values
+                timestamps[:self._capacity] = self._timestamps
+                positions[:self._capacity] = self._positions
+            self._values, self._timestamps, self._positions = values, timestamps, positions
+        elif self._capacity:
+            self._values.extend(array('d', [_NAN]) * (added * self.history))
+            self._timestamps.extend(array('d', [_NAN]) * (added * self.history))
+            self._positions.extend(array('q', [0]) * added)
+        else:
+            self._values = array('d', [_NAN]) * (capacity * self.history)
+            self._timestamps = array('d', [_NAN]) * (capacity * self.history)
+            self._positions = array('q', [0]) * capacity
+        self._capacity = capacity
+
+    def _row(self, homie_property) -> int:
+        row = self._rows.get(homie_property)
+        if row is None:
+            if self._free_rows:
+                row = self._free_rows.pop()
+                self._properties[row] = homie_property
+            else:
+                row = len(self._properties)
+                if row == self._capacity:
+                    self._grow(self._capacity * 2)
+                self._properties.append(homie_property)
+            self._rows[homie_property] = row
+            self._rows_by_property_id.setdefault(homie_property.property_id, list()).append(row)
+        return row
+
+    def record(self, homie_property, value, timestamp: float=None):
+        """Record a sample of a property, its converted value or its state, ignored if it isn't numeric."""
+
+        if isinstance(value, (int, float)):
+            # Converted values, bools included
+            value = float(value)
+        elif value == STATE_ON:
+            value = 1.0
+        elif value == STATE_OFF:
+            value = 0.0
+        else:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                self.parse_failures += 1
+                return
+
+        with self._lock:
+            row = self._row(homie_property)
+            position = self._positions[row]
+            if self._numpy is not None:
+                slot = (row, position)
+            else:
+                slot = row * self.history + position
+            self._values[slot] = value
+            self._timestamps[slot] = time.time() if timestamp is None else timestamp
+            self._positions[row] = (position + 1) % self.history
+
+    def remove(self, homie_properties):
+        """Forget the samples of properties, their rows are reused."""
+
+        with self._lock:
+            for homie_property in homie_properties:
+                row = self._rows.pop(homie_property, None)
+                if row is None:
+                    continue
+                self._properties[row] = None
+                self._rows_by_property_id[homie_property.property_id].remove(row)
+                if not self._rows_by_property_id[homie_property.property_id]:
+                    del self._rows_by_property_id[homie_property.property_id]
+                if self._numpy is not None:
+                    self._values[row] = _NAN
+                    self._timestamps[row] = _NAN
+                else:
+                    start = row * self.history
+                    self._values[start:start + self.history] = array('d', [_NAN]) * self.history
+                    self._timestamps[start:start + self.history] = array('d', [_NAN]) * self.history
+                self._positions[row] = 0
+                self._free_rows.append(row)
+
+    def properties(self, property_id: str=None) -> list:
+        """Return the stored properties, all of them or those with a property ID, in row order."""
+
+        if property_id is None:
+            return [homie_property for homie_property in self._properties if homie_property is not None]
+        return [self._properties[row] for row in self._rows_by_property_id.get(property_id, ())]
+
+    def _select_rows(self, homie_properties):
+        if homie_properties is None:
+            return [row for row, homie_property in enumerate(self._properties) if homie_property is not None]
+        if isinstance(homie_properties, str):
+            return list(self._rows_by_property_id.get(homie_properties, ()))
+        return [self._rows[homie_property] for homie_property in homie_properties]
+
+    def latest(self, homie_properties=None):
+        """
+        Return a vector of the latest value of properties
+
+        `homie_properties` is a list of properties, a property ID or None for all, in the order of `properties()`
+        """
+
+        with self._lock:
+            rows = self._select_rows(homie_properties)
+            if self._numpy is not None:
+                rows = self._numpy.array(rows, dtype=self._numpy.int64)
+                return self._values[rows, (self._positions[rows] - 1) % self.history]
+
+            history = self.history
+            return array('d', (self._values[row * history + (self._positions[row] - 1) % history] for row in rows))
+
+    def history_of(self, homie_property):
+        """Return the `(values, timestamps)` of a property, oldest first."""
+
+        with self._lock:
+            row = self._rows[homie_property]
+            position = self._positions[row]
+            if self._numpy is not None:
+                order = (self._numpy.arange(self.history) + position) % self.history
+                values, timestamps = self._values[row, order], self._timestamps[row, order]
+                valid = ~self._numpy.isnan(timestamps)
+                return values[valid], timestamps[valid]
+
+            start = row * self.history
+            order = [start + (position + index) % self.history for index in range(self.history)]
+            order = [slot for slot in order if not math.isnan(self._timestamps[slot])]
+            return array('d', (self._values[slot] for slot in order)), array('d', (self._timestamps[slot] for slot in order))
+
+    def window(self, homie_properties=None, seconds: float=None, now: float=None):
+        """
+        Return `(min, max, mean)` vectors of the samples of properties over the last `seconds`, or over all kept samples
+
+        Properties without samples in the window get NaN
+        """
+
+        cutoff = -math.inf if seconds is None else (time.time() if now is None else now) - seconds
+        with self._lock:
+            rows = self._select_rows(homie_properties)
+            if self._numpy is not None:
+                np = self._numpy
+                rows = np.array(rows, dtype=np.int64)
+                values = self._values[rows]
+                in_window = self._timestamps[rows] >= cutoff
+                counts = in_window.sum(axis=1)
+                empty = counts == 0
+                minimums = np.where(in_window, values, np.inf).min(axis=1, initial=np.inf)
+                maximums = np.where(in_window, values, -np.inf).max(axis=1, initial=-np.inf)
+                sums = np.where(in_window, values, 0.0).sum(axis=1)
+                minimums[empty] = maximums[empty] = _NAN
+                means = np.divide(sums, counts, out=np.full(len(rows), _NAN), where=~empty)
+                return minimums, maximums, means
+
+            minimums, maximums, means = array('d'), array('d'), array('d')
+            history = self.history
+            for row in rows:
+                start = row * history
+                timestamps = self._timestamps[start:start + history]
+                samples = [value for value, timestamp in zip(self._values[start:start + history], timestamps) if timestamp >= cutoff]
+                if samples:
+                    minimums.append(min(samples))
+                    maximums.append(max(samples))
+                    means.append(sum(samples) / len(samples))
+                else:
+                    minimums.append(_NAN)
+                    maximums.append(_NAN)
+                    means.append(_NAN)
+            return minimums, maximums, means
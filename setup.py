@@ -11,5 +11,6 @@ setup(
     license='MIT',
     packages=['homie', 'homie/models', 'homie/tools'],
     install_requires=['attr'],
+    extras_require={'numpy': ['numpy']},
     zip_safe=True
 )
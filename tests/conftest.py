@@ -0,0 +1,33 @@
+"""Fixtures of the tests: a local broker holding the retained messages of a small synthetic fleet"""
+
+import pytest
+
+from benchmarks.fleet import Fleet
+from homie.local_broker import (LocalBroker, LocalClient)
+from homie.paho_mqtt_client_manager import MQTTWrapper
+
+
+@pytest.fixture
+def fleet():
+    return Fleet(devices=3, nodes=2, properties=2)
+
+
+@pytest.fixture
+def broker(fleet):
+    broker = LocalBroker()
+    for topic, payload in fleet.retained_messages():
+        broker.publish(topic, payload, 1, True)
+    return broker
+
+
+@pytest.fixture
+def client(broker):
+    return LocalClient(broker)
+
+
+@pytest.fixture
+def mqtt(client):
+    mqtt = MQTTWrapper(client)
+    client.connect()
+    yield mqtt
+    client.disconnect()
@@ -0,0 +1,126 @@
+"""Tests of the asyncio Homie client"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from homie.async_homie import AsyncHomie
+from homie.local_broker import LocalClient
+from homie.paho_mqtt_client_manager import AsyncMQTTWrapper
+from homie.tools import (STAGE_1, STAGE_2)
+from homie.tools.state_store import NumericStateStore
+
+
+def _run(coroutine_function, *args):
+    return asyncio.run(coroutine_function(*args))
+
+
+async def _connect(client, **kwargs) -> AsyncHomie:
+    mqtt = AsyncMQTTWrapper(client)
+    client.connect()
+    homie = AsyncHomie(mqtt, **kwargs)
+    homie.start()
+    return homie
+
+
+def test_wait_for_device(client, broker):
+    async def wait():
+        homie = await _connect(client)
+        assert (await homie.wait_for_device('device00000')).device_id == 'device00000'
+
+        waiting = asyncio.ensure_future(homie.wait_for_device('late', STAGE_1, timeout=5))
+        await asyncio.sleep(0)
+        # Published from another thread, like paho's network thread
+        publisher = threading.Thread(target=lambda: [
+            broker.publish('homie/late/$nodes', 'node0', 1, True),
+            broker.publish('homie/late/node0/$properties', 'level', 1, True),
+            broker.publish('homie/late/$homie', '2.0.1', 1, True),
+        ])
+        publisher.start()
+        homie_device = await waiting
+        publisher.join()
+        assert homie_device.device_id == 'late'
+        assert homie_device.stage_of_discovery >= STAGE_1
+
+        with pytest.raises(asyncio.TimeoutError):
+            await homie.wait_for_device('never', timeout=0.05)
+        assert not homie._device_waiters
+    _run(wait)
+
+
+def test_property_changes(client, broker):
+    async def iterate():
+        homie = await _connect(client)
+        stream = homie.property_changes()
+        broker.publish('homie/device00001/node0/property1', '10', 1, True)
+        broker.publish('homie/device00001/node0/property1', '11', 1, True)
+        stream.close()
+        return [(change.homie_property.entity_id, change.previous_state, change.state) async for change in stream]
+    assert _run(iterate) == [('device00001_node0_property1', '1', '10'), ('device00001_node0_property1', '10', '11')]
+
+
+def test_property_changes_drop_the_oldest(client, broker):
+    async def overflow():
+        homie = await _connect(client)
+        stream = homie.property_changes(maxsize=2)
+        for state in ('10', '11', '12', '13'):
+            broker.publish('homie/device00001/node0/property1', state, 1, True)
+        assert stream.dropped == 2
+        assert (await stream.__anext__()).state == '12'
+        assert (await stream.__anext__()).state == '13'
+    _run(overflow)
+
+
+def test_wait_for_discovery(client):
+    async def wait():
+        homie = await _connect(client)
+        return await homie.wait_for_discovery(quiet_period=0.05, deadline=5)
+    status = _run(wait)
+    assert status.settled
+    assert status.ready_devices == status.devices == 3
+
+
+def test_passes_homie_arguments_through(client):
+    store = NumericStateStore()
+
+    async def connect():
+        return await _connect(client, state_store=store, max_unrouted=10)
+    homie = _run(connect)
+    assert homie.state_store is store
+    assert homie.max_unrouted == 10
+    assert len(store.properties()) == 3 * 2 * 2
+    assert all(homie_device.stage_of_discovery == STAGE_2 for homie_device in homie.devices)
+
+
+def test_wrapper_needs_a_loop_outside_of_coroutines(client):
+    with pytest.raises(Exception):
+        AsyncMQTTWrapper(client)
+    loop = asyncio.new_event_loop()
+    try:
+        assert AsyncMQTTWrapper(client, loop).loop is loop
+    finally:
+        loop.close()
+
+
+def test_wrapper_bounds_the_pending_messages(broker):
+    async def deliver():
+        client = LocalClient(broker)
+        mqtt = AsyncMQTTWrapper(client, max_pending_messages=2)
+        client.connect()
+        received = []
+        mqtt.subscribe('test/#', lambda topic, payload, qos: received.append((payload, threading.current_thread())), 0)
+
+        publisher = threading.Thread(target=lambda: [broker.publish('test/topic', str(index)) for index in range(5)])
+        publisher.start()
+        # The loop is busy, the network thread waits once 2 messages are pending
+        time.sleep(0.1)
+        assert mqtt.pending_messages == 2
+        assert publisher.is_alive()
+
+        while publisher.is_alive() or mqtt.pending_messages:
+            await asyncio.sleep(0.01)
+        assert [payload for payload, _ in received] == ['0', '1', '2', '3', '4']
+        assert all(thread is threading.current_thread() for _, thread in received)
+    _run(deliver)
@@ -0,0 +1,82 @@
+"""Tests of running callbacks on the callback executor"""
+
+import threading
+
+from homie.tools import (CallbackExecutor, POLICY_BLOCK, POLICY_DROP)
+
+TIMEOUT = 5  # seconds
+
+
+def test_runs_callbacks_in_order_per_key():
+    executor = CallbackExecutor(max_workers=4)
+    calls = {key: [] for key in range(4)}
+    for index in range(200):
+        key = index % 4
+        executor.submit(key, calls[key].append, index)
+    executor.shutdown()
+
+    for key, indexes in calls.items():
+        assert indexes == list(range(key, 200, 4))
+    assert executor.queue_depth == 0
+
+
+def test_drops_callbacks_beyond_the_bound():
+    executor = CallbackExecutor(max_workers=1, max_queued=2)
+    assert executor.policy == POLICY_DROP
+    release = threading.Event()
+    calls = []
+
+    assert executor.submit('device', release.wait, TIMEOUT)
+    assert executor.submit('device', calls.append, 1)
+    assert not executor.submit('device', calls.append, 2)
+    assert executor.dropped == 1
+    release.set()
+    executor.shutdown()
+    assert calls == [1]
+
+
+def test_blocks_until_there_is_space():
+    executor = CallbackExecutor(max_workers=1, max_queued=1, policy=POLICY_BLOCK)
+    release = threading.Event()
+    calls = []
+    executor.submit('device', release.wait, TIMEOUT)
+
+    submitter = threading.Thread(target=executor.submit, args=('device', calls.append, 1))
+    submitter.start()
+    submitter.join(0.1)
+    assert submitter.is_alive()
+
+    release.set()
+    submitter.join(TIMEOUT)
+    assert not submitter.is_alive()
+    executor.shutdown()
+    assert calls == [1]
+    assert executor.dropped == 0
+
+
+def test_callbacks_submitting_to_a_full_queue_do_not_block():
+    executor = CallbackExecutor(max_workers=1, max_queued=1, policy=POLICY_BLOCK)
+    calls = []
+    submitted = threading.Event()
+
+    def callback():
+        # The queue is full with this callback
+        executor.submit('device', calls.append, 'same device')
+        executor.submit('other', calls.append, 'other device')
+        calls.append('callback')
+        submitted.set()
+
+    executor.submit('device', callback)
+    assert submitted.wait(TIMEOUT)
+    executor.shutdown()
+    # Other keys run inline, the same key after the running callback
+    assert calls == ['other device', 'callback', 'same device']
+
+
+def test_unknown_policy():
+    try:
+        CallbackExecutor(policy='wait')
+    except Exception as error:
+        assert 'wait' in str(error)
+    else:
+        assert False
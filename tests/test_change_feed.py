@@ -0,0 +1,97 @@
+"""Tests of delivering changes in batches"""
+
+import threading
+import time
+
+from homie import Homie
+from homie.tools.change_feed import (Change, ChangeFeed)
+
+TIMEOUT = 5  # seconds
+
+
+def test_coalesces_changes_of_an_attribute():
+    batches = []
+    change_feed = ChangeFeed(batches.append, window=60)
+    change_feed.add('entity', '_state', '1', '2')
+    change_feed.add('entity', '_state', '2', '3')
+    change_feed.add('entity', '_name', 'a', 'b')
+    change_feed.add('other', '_state', '1', '4')
+    change_feed.flush()
+
+    assert batches == [[
+        Change('entity', '_state', '1', '3'),
+        Change('entity', '_name', 'a', 'b'),
+        Change('other', '_state', '1', '4'),
+    ]]
+    change_feed.flush()
+    assert len(batches) == 1
+
+
+def test_flushes_after_the_window():
+    delivered = threading.Event()
+    batches = []
+
+    def on_batch(changes):
+        batches.append(changes)
+        delivered.set()
+
+    change_feed = ChangeFeed(on_batch, window=0.05)
+    start = time.monotonic()
+    change_feed.add('entity', '_state', '1', '2')
+    assert not batches
+    assert delivered.wait(TIMEOUT)
+    assert time.monotonic() - start >= 0.05
+    assert batches == [[Change('entity', '_state', '1', '2')]]
+
+
+def test_flushes_once_the_batch_is_full():
+    batches = []
+    change_feed = ChangeFeed(batches.append, window=60, batch_size=2)
+    change_feed.add('entity', '_state', '1', '2')
+    # Coalesced, still one change
+    change_feed.add('entity', '_state', '2', '3')
+    assert not batches
+    # Attributes of the same entity count separately
+    change_feed.add('entity', '_name', 'a', 'b')
+    assert batches == [[Change('entity', '_state', '1', '3'), Change('entity', '_name', 'a', 'b')]]
+    assert change_feed._timer is None
+
+
+def test_delivers_one_batch_at_a_time_in_order():
+    running = threading.Lock()
+    overlapped = []
+    values = []
+
+    def on_batch(changes):
+        if not running.acquire(blocking=False):
+            overlapped.append(changes)
+            return
+        time.sleep(0.002)
+        values.extend(change.value for change in changes)
+        running.release()
+
+    # Flushed both by the timer thread and by this thread
+    change_feed = ChangeFeed(on_batch, window=0.0005, batch_size=3)
+    for value in range(200):
+        change_feed.add(f'entity{value}', '_state', None, value)
+        time.sleep(0.0005)
+    change_feed.flush()
+
+    assert not overlapped
+    assert values == list(range(200))
+
+
+def test_homie_feeds_property_states(mqtt, broker):
+    homie = Homie(mqtt)
+    homie.start()
+    batches = []
+    change_feed = homie.add_change_feed(batches.append, window=60)
+    homie_property = homie.get_device('device00001').get_node('node0').get_property('property1')
+
+    broker.publish('homie/device00001/node0/property1', '42', 1, True)
+    broker.publish('homie/device00001/node0/property1', '43', 1, True)
+    homie.remove_change_feed(change_feed)
+    assert batches == [[Change(homie_property, 'state', '1', '43')]]
+
+    broker.publish('homie/device00001/node0/property1', '44', 1, True)
+    assert len(batches) == 1
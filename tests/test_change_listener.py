@@ -0,0 +1,84 @@
+"""Tests of attribute change listeners"""
+
+import pytest
+
+from homie import Homie
+from homie.tools import CallbackExecutor
+from homie.tools.change_listner import (ANY_ATTRIBUTE, AttributeChangeListener)
+
+
+class _Entity(AttributeChangeListener):
+    __slots__ = ('name', 'level')
+
+
+def test_calls_attribute_listeners_then_any_attribute_listeners():
+    entity = _Entity()
+    calls = []
+    entity.add_attribute_listener(lambda _entity, name, previous, value: calls.append(('any', name, previous, value)))
+    entity.add_attribute_listener(lambda _entity, name, previous, value: calls.append(('name', name, previous, value)), 'name')
+
+    entity.name = 'kitchen'
+    entity.name = 'kitchen'
+    entity.level = 1
+    entity.name = 'hall'
+    assert calls == [
+        ('name', 'name', None, 'kitchen'), ('any', 'name', None, 'kitchen'),
+        ('any', 'level', None, 1),
+        ('name', 'name', 'kitchen', 'hall'), ('any', 'name', 'kitchen', 'hall'),
+    ]
+    assert set(entity._attribute_subscriptions) == {ANY_ATTRIBUTE, 'name'}
+
+
+def test_any_attribute_takes_over_the_attribute_names():
+    entity = _Entity()
+    calls = []
+    entity.add_attribute_listener(lambda _entity, name, previous, value: calls.append(name), ['name', ANY_ATTRIBUTE])
+    entity.name = 'kitchen'
+    entity.level = 1
+    assert calls == ['name', 'level']
+    assert list(entity._attribute_subscriptions) == [ANY_ATTRIBUTE]
+
+
+def test_removes_listeners():
+    entity = _Entity()
+    calls = []
+
+    def on_change(_entity, name, previous, value):
+        calls.append(name)
+
+    entity.add_attribute_listener(on_change, 'name,level')
+    entity.add_attribute_listener(on_change)
+    entity.remove_attribute_listener(on_change, 'level')
+    entity.level = 1
+    assert calls == ['level']
+
+    entity.remove_attribute_listener(on_change)
+    entity.remove_attribute_listener(on_change, 'name')
+    assert entity._attribute_subscriptions is None
+    entity.name = 'kitchen'
+    assert calls == ['level']
+    # Removing twice is fine
+    entity.remove_attribute_listener(on_change, 'name')
+
+
+def test_removes_listeners_run_by_the_executor(mqtt, broker):
+    executor = CallbackExecutor(max_workers=1)
+    homie = Homie(mqtt, executor=executor)
+    homie.start()
+    homie_property = homie.get_device('device00001').get_node('node0').get_property('property1')
+    states = []
+
+    def on_change(_entity, _name, _previous, value):
+        states.append(value)
+
+    homie_property.add_attribute_listener(on_change, '_state')
+    broker.publish('homie/device00001/node0/property1', '42', 1, True)
+    homie_property.remove_attribute_listener(on_change, '_state')
+    broker.publish('homie/device00001/node0/property1', '43', 1, True)
+    executor.shutdown()
+    assert states == ['42']
+
+
+def test_listeners_must_be_functions():
+    with pytest.raises(Exception, match='on_attribute_change must be a function'):
+        _Entity().add_attribute_listener('not a function')
@@ -0,0 +1,61 @@
+"""Tests of converting property states to values"""
+
+from homie import Homie
+from homie.tools import constants
+from homie.tools.converters import (ConverterRegistry, to_bool, to_float, to_int, to_rgb)
+from homie.tools.state_store import NumericStateStore
+
+
+def test_chooses_converters():
+    converters = ConverterRegistry()
+    assert converters.converter_for(constants.TYPE_SENSOR, constants.PROP_VALUE) is to_float
+    assert converters.converter_for(constants.TYPE_LIGHT, constants.PROP_BRIGHTNESS) is to_int
+    assert converters.converter_for('thermostat', 'mode') is None
+    # Declared datatypes and formats win over the node type
+    assert converters.converter_for(constants.TYPE_SENSOR, constants.PROP_VALUE, 'integer') is to_int
+    assert converters.converter_for('light', 'color', 'color', 'rgb') is to_rgb
+    assert converters.converter_for(constants.TYPE_SENSOR, constants.PROP_VALUE, 'string') is None
+    to_enum = converters.converter_for('thermostat', 'mode', 'enum', 'heat,cool')
+    assert converters.convert(to_enum, 'heat') == 'heat'
+
+    # Registered rules win, the latest first
+    converters.register(to_int, property_id=constants.PROP_VALUE)
+    converters.register(to_bool, property_id=constants.PROP_VALUE, node_type='switch')
+    assert converters.converter_for(constants.TYPE_SENSOR, constants.PROP_VALUE, 'float') is to_int
+    assert converters.converter_for('switch', constants.PROP_VALUE) is to_bool
+
+
+def test_counts_parse_failures():
+    converters = ConverterRegistry()
+    to_enum = converters.converter_for('thermostat', 'mode', 'enum', 'heat,cool')
+    assert converters.convert(to_float, 'warm') is None
+    assert converters.convert(to_rgb, '1,2,300') is None
+    assert converters.convert(to_bool, 'yes') is None
+    assert converters.convert(to_enum, 'off') is None
+    assert converters.convert(to_bool, 'true') is True
+
+    assert converters.parse_failures == 4
+    assert converters.parse_failures_by_converter == {'to_float': 1, 'to_rgb': 1, 'to_bool': 1, 'to_enum': 1}
+
+
+def test_properties_convert_their_states(mqtt, broker):
+    store = NumericStateStore()
+    homie = Homie(mqtt, state_store=store)
+    homie.start()
+    homie_property = homie.get_device('device00001').get_node('node0').get_property('property1')
+
+    broker.publish('homie/device00001/node0/property1/$datatype', 'boolean', 1, True)
+    assert homie_property.value is None
+    assert homie.converters.parse_failures == 1
+    broker.publish('homie/device00001/node0/property1', 'true', 1, True)
+    assert homie_property.value is True
+
+    broker.publish('homie/device00001/node0/property1/$datatype', 'float', 1, True)
+    broker.publish('homie/device00001/node0/property1', 'warm', 1, True)
+    assert homie_property.value is None
+    assert homie_property.state == 'warm'
+    assert homie.converters.parse_failures_by_converter == {'to_bool': 1, 'to_float': 2}
+
+    # The store gets the converted values
+    assert list(store.history_of(homie_property)[0]) == [1.0, 1.0]
+    assert store.parse_failures == 1
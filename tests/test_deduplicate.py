@@ -0,0 +1,62 @@
+"""Tests of suppressing duplicate payloads"""
+
+from homie.local_broker import LocalClient
+from homie.paho_mqtt_client_manager import MQTTWrapper
+
+
+def _subscribe(mqtt, topic, deduplicate=False):
+    received = []
+    mqtt.subscribe(topic, lambda _topic, payload, _qos: received.append(payload), 1, deduplicate=deduplicate)
+    return received
+
+
+def test_suppresses_repeated_payloads_of_deduplicated_subscriptions(mqtt, broker):
+    deduplicated = _subscribe(mqtt, 'test/#', deduplicate=True)
+    every = _subscribe(mqtt, 'test/+')
+    for payload in ('on', 'on', 'off', 'off'):
+        broker.publish('test/switch', payload, 1)
+
+    assert deduplicated == ['on', 'off']
+    assert every == ['on', 'on', 'off', 'off']
+    assert mqtt.suppressed_callbacks == 2
+    # Not all callbacks were suppressed
+    assert mqtt.suppressed_messages == 0
+
+
+def test_suppresses_repeated_payloads_of_deduplicated_topics(broker):
+    client = LocalClient(broker)
+    mqtt = MQTTWrapper(client, deduplicate_topics=['test/+/$online'])
+    client.connect()
+    online = _subscribe(mqtt, 'test/#')
+    for payload in ('true', 'true', 'true'):
+        broker.publish('test/device/$online', payload, 1)
+        broker.publish('test/device/$name', payload, 1)
+
+    assert online == ['true', 'true', 'true', 'true']
+    assert (mqtt.suppressed_messages, mqtt.suppressed_callbacks, mqtt.suppressed_bytes) == (2, 2, 8)
+
+    # A new subscription gets the retained message it subscribed for
+    broker.publish('test/device/$online', 'true', 1, True)
+    assert _subscribe(mqtt, 'test/+/$online') == ['true']
+    client.disconnect()
+
+
+def test_retained_messages_sent_again_on_reconnect_are_not_suppressed(broker):
+    client = LocalClient(broker)
+    mqtt = MQTTWrapper(client)
+    client.connect()
+    broker.publish('test/sensor', '21.5', 1, True)
+    received = _subscribe(mqtt, 'test/#', deduplicate=True)
+    broker.publish('test/sensor', '21.5', 1, True)
+    assert received == ['21.5']
+
+    broker.stop()
+    broker.start()
+    client.connect()
+    assert received == ['21.5', '21.5']
+    assert mqtt.suppressed_callbacks == 1
+
+    # Deduplicated again after the retained message
+    broker.publish('test/sensor', '21.5', 1, True)
+    assert received == ['21.5', '21.5']
+    client.disconnect()
@@ -0,0 +1,161 @@
+"""Tests of Homie discovery against a local broker, with subscriptions per device and with a single subscription"""
+
+import pytest
+
+from homie import Homie
+from homie.paho_mqtt_client_manager import MQTTWrapper
+from homie.tools import (constants, STAGE_1, STAGE_2)
+
+MODES = pytest.mark.parametrize('single_subscription', [False, True], ids=['per_device', 'single_subscription'])
+
+
+@pytest.fixture
+def discovered(mqtt):
+    def start(single_subscription: bool):
+        homie = Homie(mqtt, single_subscription=single_subscription)
+        events = []
+        homie.set_on_device_discovery(lambda homie_device, stage: events.append((homie_device.device_id, stage)))
+        homie.set_on_node_discovery(lambda homie_node, stage: events.append((homie_node.entity_id, stage)))
+        homie.set_on_property_discovery(lambda homie_property, stage: events.append((homie_property.entity_id, stage)))
+        homie.start()
+        return homie, events
+    return start
+
+
+@MODES
+def test_discovers_the_fleet(discovered, fleet, single_subscription):
+    homie, events = discovered(single_subscription)
+
+    assert sorted(homie_device.device_id for homie_device in homie.devices) == sorted(fleet.device_ids())
+    for homie_device in homie.devices:
+        assert homie_device.stage_of_discovery == STAGE_2
+        assert homie_device.online
+        assert [homie_node.node_id for homie_node in homie_device.nodes] == ['node0', 'node1']
+        homie_property = homie_device.get_node('node1').get_property('property1')
+        assert homie_property.state == '1'
+        assert homie_property.settable
+        assert [stage for entity_id, stage in events if entity_id == homie_device.device_id] == [STAGE_1, STAGE_2]
+
+
+@MODES
+def test_follows_property_states(discovered, broker, single_subscription):
+    homie, _ = discovered(single_subscription)
+
+    broker.publish('homie/device00001/node0/property1', '42', 1, True)
+    assert homie.get_device('device00001').get_node('node0').get_property('property1').state == '42'
+    assert homie.get_device('device00002').get_node('node0').get_property('property1').state == '1'
+
+
+@MODES
+def test_discovers_nodes_added_later(discovered, broker, single_subscription):
+    homie, events = discovered(single_subscription)
+    events.clear()
+
+    broker.publish('homie/device00000/$nodes', 'node0,node1,node9', 1, True)
+    broker.publish('homie/device00000/node9/$type', 'sensor', 1, True)
+    broker.publish('homie/device00000/node9/$properties', 'level', 1, True)
+    broker.publish('homie/device00000/node9/level', '7', 1, True)
+
+    homie_node = homie.get_device('device00000').get_node('node9')
+    assert homie_node.stage_of_discovery == STAGE_2
+    assert homie_node.get_property('level').state == '7'
+    assert ('device00000_node9', STAGE_2) in events
+    assert ('device00000_node9_level', STAGE_2) in events
+    assert [homie_property.entity_id for homie_property in homie.find_properties(property_id='level')] == ['device00000_node9_level']
+
+
+def test_single_subscription_buffers_messages_of_undiscovered_devices(mqtt, broker):
+    homie = Homie(mqtt, single_subscription=True)
+    homie.start()
+
+    # Retained messages don't arrive in discovery order
+    broker.publish('homie/late/node0/level', '3', 1, True)
+    broker.publish('homie/late/node0/$properties', 'level', 1, True)
+    broker.publish('homie/late/node0/$type', 'sensor', 1, True)
+    broker.publish('homie/late/$nodes', 'node0', 1, True)
+    broker.publish('homie/late/$online', 'true', 1, True)
+    assert not homie.has_device('late')
+
+    broker.publish('homie/late/$homie', '2.0.1', 1, True)
+    homie_device = homie.get_device('late')
+    assert homie_device.stage_of_discovery == STAGE_2
+    assert homie_device.get_node('node0').get_property('level').state == '3'
+    assert homie.discovery_status().devices == 4
+
+
+def test_single_subscription_bounds_the_buffer(mqtt, broker):
+    homie = Homie(mqtt, single_subscription=True, max_unrouted=4)
+    homie.start()
+
+    for device_id in ('first', 'second'):
+        broker.publish(f'homie/{device_id}/$nodes', 'node0', 1, True)
+        broker.publish(f'homie/{device_id}/$online', 'true', 1, True)
+    assert homie.dropped_unrouted == 0
+    broker.publish('homie/third/$nodes', 'node0', 1, True)
+    # The device buffered first is dropped
+    assert homie.dropped_unrouted == 2
+    assert sorted(homie._unrouted) == ['second', 'third']
+
+
+def test_single_subscription_drops_unsupported_devices(mqtt, broker):
+    homie = Homie(mqtt, single_subscription=True)
+    homie.start()
+
+    broker.publish('homie/old/$homie', '1.0.0', 1, True)
+    broker.publish('homie/old/$nodes', 'node0', 1, True)
+    assert not homie.has_device('old')
+    assert 'old' not in homie._unrouted
+@MODES
+def test_evicts_devices_cleared_from_the_broker(discovered, broker, single_subscription):
+    homie, _ = discovered(single_subscription)
+    removed = []
+    homie.set_on_device_removed(lambda homie_device: removed.append(homie_device.device_id))
+
+    broker.publish('homie/device00001/$homie', '', 1, True)
+    assert not homie.has_device('device00001')
+    assert removed == ['device00001']
+
+    broker.publish('homie/device00001/node0/property1', '42', 1, True)
+    assert not homie.has_device('device00001')
+
+
+
+
+@pytest.mark.parametrize('retained_cache', [False, True], ids=['', 'retained_cache'])
+@MODES
+def test_discovers_evicted_devices_announced_again(broker, client, single_subscription, retained_cache):
+    mqtt = MQTTWrapper(client, retained_cache=retained_cache)
+    client.connect()
+    homie = Homie(mqtt, single_subscription=single_subscription)
+    homie.start()
+    subscriptions = len(mqtt.subscriptions)
+
+    broker.publish('homie/device00001/$homie', '', 1, True)
+    broker.publish('homie/device00001/node0/property1', '42', 1, True)
+    broker.publish('homie/device00001/$homie', constants.HOMIE_SUPPORTED_VERSION, 1, True)
+
+    homie_device = homie.get_device('device00001')
+    assert homie_device.stage_of_discovery == STAGE_2
+    assert homie_device.get_node('node0').get_property('property1').state == '42'
+    assert len(mqtt.subscriptions) == subscriptions
+    broker.publish('homie/device00001/node0/property1', '43', 1, True)
+    assert homie_device.get_node('node0').get_property('property1').state == '43'
+    client.disconnect()
+
+
+def test_single_subscription_discovers_devices_dropped_from_the_buffer(mqtt, broker):
+    homie = Homie(mqtt, single_subscription=True, max_unrouted=5)
+    homie.start()
+
+    broker.publish('homie/dropped/$online', 'true', 1, True)
+    broker.publish('homie/dropped/$nodes', 'node0', 1, True)
+    broker.publish('homie/dropped/node0/$type', 'sensor', 1, True)
+    broker.publish('homie/dropped/node0/$properties', 'value', 1, True)
+    broker.publish('homie/dropped/node0/value', '21.5', 1, True)
+    broker.publish('homie/other/$nodes', 'node0', 1, True)
+    assert homie.dropped_unrouted == 5
+
+    broker.publish('homie/dropped/$homie', constants.HOMIE_SUPPORTED_VERSION, 1, True)
+    homie_device = homie.get_device('dropped')
+    assert homie_device.stage_of_discovery == STAGE_2
+    assert homie_device.get_node('node0').get_property('value').state == '21.5'
@@ -0,0 +1,85 @@
+"""Tests of waiting for discovery to settle"""
+
+import threading
+import time
+
+import pytest
+
+from homie import Homie
+from homie.homie import (SETTLED_COMPLETE, SETTLED_DEADLINE, SETTLED_QUIET)
+from homie.local_broker import (LocalBroker, LocalClient)
+from homie.paho_mqtt_client_manager import MQTTWrapper
+from homie.tools import (constants, STAGE_0, STAGE_1)
+
+TIMEOUT = 5  # seconds
+
+
+def test_needs_start(mqtt):
+    with pytest.raises(Exception, match='not been started'):
+        Homie(mqtt).discovery_status()
+
+
+def test_settles_once_every_device_is_discovered(mqtt, fleet):
+    homie = Homie(mqtt)
+    homie.start()
+    status = homie.wait_for_discovery(quiet_period=TIMEOUT, deadline=TIMEOUT)
+    assert status.settled
+    assert status.reason == SETTLED_COMPLETE
+    assert status.devices == status.ready_devices == fleet.devices
+    assert status.stuck_devices == {}
+
+
+def test_settles_when_quiet_and_reports_stuck_devices(mqtt, broker):
+    broker.publish('homie/stuck/$homie', constants.HOMIE_SUPPORTED_VERSION, 1, True)
+    broker.publish('homie/partial/$homie', constants.HOMIE_SUPPORTED_VERSION, 1, True)
+    broker.publish('homie/partial/$nodes', 'node0', 1, True)
+    broker.publish('homie/partial/node0/$properties', 'value', 1, True)
+    homie = Homie(mqtt)
+    homie.start()
+    assert not homie.discovery_status(quiet_period=TIMEOUT, deadline=TIMEOUT).settled
+
+    start = time.monotonic()
+    status = homie.wait_for_discovery(quiet_period=0.1, deadline=TIMEOUT)
+    assert time.monotonic() - start >= 0.05
+    assert status.reason == SETTLED_QUIET
+    assert status.quiet_seconds >= 0.1
+    assert status.devices == 5
+    assert status.ready_devices == 3
+    assert status.stuck_devices == {'stuck': STAGE_0, 'partial': STAGE_1}
+
+
+def test_discovery_messages_hold_off_settling(mqtt, broker):
+    broker.publish('homie/late/$homie', constants.HOMIE_SUPPORTED_VERSION, 1, True)
+    homie = Homie(mqtt)
+    homie.start()
+    stop = threading.Event()
+
+    def announce():
+        index = 0
+        while not stop.wait(0.02):
+            broker.publish(f'homie/late/node{index}/$properties', 'value', 1, True)
+            broker.publish('homie/late/$nodes', ','.join(f'node{node}' for node in range(index + 1)), 1, True)
+            index += 1
+
+    announcer = threading.Thread(target=announce)
+    announcer.start()
+    try:
+        start = time.monotonic()
+        status = homie.wait_for_discovery(quiet_period=0.2, deadline=0.5)
+    finally:
+        stop.set()
+        announcer.join()
+    assert status.reason == SETTLED_DEADLINE
+    assert time.monotonic() - start >= 0.4
+    assert 'late' in status.stuck_devices
+
+
+def test_settles_at_the_deadline_without_devices():
+    client = LocalClient(LocalBroker())
+    mqtt = MQTTWrapper(client)
+    client.connect()
+    homie = Homie(mqtt)
+    homie.start()
+    status = homie.wait_for_discovery(quiet_period=TIMEOUT, deadline=0.1)
+    assert status.reason == SETTLED_DEADLINE
+    assert status.devices == 0
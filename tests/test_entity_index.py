@@ -0,0 +1,77 @@
+"""Tests of finding entities through the indexes, as entities change, retire and get evicted"""
+
+import pytest
+
+from homie import Homie
+from homie.tools import constants
+
+MODES = pytest.mark.parametrize('single_subscription', [False, True], ids=['per_device', 'single_subscription'])
+
+
+@pytest.fixture
+def homie(mqtt):
+    def start(single_subscription: bool):
+        homie = Homie(mqtt, single_subscription=single_subscription)
+        homie.start()
+        return homie
+    return start
+
+
+def _ids(entities):
+    return sorted(entity.entity_id for entity in entities)
+
+
+@MODES
+def test_finds_discovered_entities(homie, single_subscription):
+    homie = homie(single_subscription)
+
+    assert _ids(homie.find_devices(online=True)) == ['device00000', 'device00001', 'device00002']
+    assert homie.find_devices(firmware_name='other') == []
+    assert _ids(homie.find_nodes(constants.TYPE_SWITCH)) == ['device00000_node1', 'device00001_node1', 'device00002_node1']
+    assert _ids(homie.find_properties('property1', settable=True)) == [
+        'device00000_node0_property1', 'device00000_node1_property1', 'device00001_node0_property1',
+        'device00001_node1_property1', 'device00002_node0_property1', 'device00002_node1_property1']
+    assert homie.find_properties('property0', settable=True) == []
+    assert homie.get_entity('device00001_node1_property0') is homie.get_device('device00001').get_node('node1').get_property('property0')
+
+
+@MODES
+def test_follows_attribute_changes(homie, broker, single_subscription):
+    homie = homie(single_subscription)
+
+    broker.publish('homie/device00001/$online', 'false', 1, True)
+    broker.publish('homie/device00002/$fw/version', '2.0.0', 1, True)
+    broker.publish('homie/device00002/node0/$type', constants.TYPE_SWITCH, 1, True)
+    assert _ids(homie.find_devices(online=True)) == ['device00000', 'device00002']
+    assert _ids(homie.find_devices(online=False)) == ['device00001']
+    assert _ids(homie.find_devices(firmware_version='2.0.0')) == ['device00002']
+    assert 'device00002_node0' in _ids(homie.find_nodes(constants.TYPE_SWITCH))
+    assert 'device00002_node0' not in _ids(homie.find_nodes(constants.TYPE_SENSOR))
+
+
+@MODES
+def test_forgets_retired_entities(homie, broker, single_subscription):
+    homie = homie(single_subscription)
+
+    broker.publish('homie/device00001/$nodes', 'node0', 1, True)
+    broker.publish('homie/device00002/node0/$properties', 'property0', 1, True)
+    assert homie.get_entity('device00001_node1') is None
+    assert homie.get_entity('device00001_node1_property0') is None
+    assert 'device00001_node1' not in _ids(homie.find_nodes(constants.TYPE_SWITCH))
+    assert _ids(homie.find_properties('property1')) == [
+        'device00000_node0_property1', 'device00000_node1_property1', 'device00001_node0_property1', 'device00002_node1_property1']
+    assert homie.get_entity('device00002_node0_property0') is not None
+
+
+@MODES
+def test_forgets_evicted_devices(homie, broker, single_subscription):
+    homie = homie(single_subscription)
+
+    broker.publish('homie/device00001/$online', 'false', 1, True)
+    broker.publish('homie/device00001/$homie', '', 1, True)
+    assert homie.find_devices(online=False) == []
+    assert _ids(homie.find_devices()) == ['device00000', 'device00002']
+    assert 'device00001_node1' not in _ids(homie.find_nodes(constants.TYPE_SWITCH))
+    assert not any(entity_id.startswith('device00001') for entity_id in _ids(homie.find_properties('property0')))
+    assert homie.get_entity('device00001') is None
+    assert homie.get_entity('device00001_node0_property0') is None
@@ -0,0 +1,18 @@
+"""Tests of the helpers"""
+
+import pytest
+
+from homie import Homie
+from homie.tools import (helpers, STAGE_1, STAGE_2)
+
+
+def test_can_advance_stage_is_deprecated(mqtt):
+    homie = Homie(mqtt)
+    homie.start()
+    homie_device = homie.get_device('device00000')
+
+    with pytest.deprecated_call():
+        assert helpers.can_advance_stage(STAGE_2, homie_device._homie_nodes)
+    homie_device.get_node('node0')._stage_of_discovery = STAGE_1
+    with pytest.deprecated_call():
+        assert not helpers.can_advance_stage(STAGE_2, homie_device._homie_nodes)
@@ -0,0 +1,97 @@
+"""Tests of the event journal and of attaching consumers to it"""
+
+import threading
+
+import pytest
+
+from homie import Homie
+from homie.tools import Journal
+from homie.tools.journal import (EVENT_PROPERTY_STATE, EVENT_DEVICE_STAGE)
+
+TIMEOUT = 5  # seconds
+
+
+def _journal(events: int, capacity: int=16) -> Journal:
+    journal = Journal(capacity)
+    for index in range(events):
+        journal.append(EVENT_PROPERTY_STATE, 'entity', index, index + 1)
+    return journal
+
+
+def test_replays_then_delivers_new_events():
+    journal = _journal(5)
+    sequences = []
+    assert journal.attach(lambda event: sequences.append(event.sequence), from_sequence=3)
+    journal.append(EVENT_PROPERTY_STATE, 'entity', 5, 6)
+    assert sequences == [3, 4, 5, 6]
+
+    new_sequences = []
+    journal.attach(lambda event: new_sequences.append(event.sequence))
+    journal.append(EVENT_PROPERTY_STATE, 'entity', 6, 7)
+    assert new_sequences == [7]
+
+
+def test_calls_on_gap_for_events_no_longer_kept():
+    journal = _journal(10, capacity=4)
+    assert journal.oldest_sequence == 7
+    gaps, sequences = [], []
+    assert not journal.attach(lambda event: sequences.append(event.sequence), from_sequence=2, on_gap=gaps.append)
+    assert gaps == [10]
+    journal.append(EVENT_PROPERTY_STATE, 'entity', 10, 11)
+    assert sequences == [11]
+
+    with pytest.raises(Exception, match='no longer kept'):
+        journal.attach(lambda event: None, from_sequence=2)
+
+
+def test_appends_do_not_wait_for_the_replay():
+    journal = _journal(3)
+    sequences = []
+
+    def on_event(event):
+        sequences.append(event.sequence)
+        if event.sequence == 1:
+            # An other thread appending while the replay runs
+            appender = threading.Thread(target=journal.append, args=(EVENT_PROPERTY_STATE, 'entity', 3, 4))
+            appender.start()
+            appender.join(TIMEOUT)
+            assert not appender.is_alive()
+
+    journal.attach(on_event, from_sequence=1)
+    journal.append(EVENT_PROPERTY_STATE, 'entity', 4, 5)
+    assert sequences == [1, 2, 3, 4, 5]
+
+
+def test_appends_during_on_gap_are_delivered_after_it():
+    journal = _journal(10, capacity=4)
+    calls = []
+
+    def on_gap(sequence):
+        calls.append(('gap', sequence))
+        appender = threading.Thread(target=journal.append, args=(EVENT_PROPERTY_STATE, 'entity', 10, 11))
+        appender.start()
+        appender.join(TIMEOUT)
+        assert not appender.is_alive()
+
+    journal.attach(lambda event: calls.append(event.sequence), from_sequence=1, on_gap=on_gap)
+    assert calls == [('gap', 10), 11]
+
+
+def test_homie_journal(mqtt, broker, fleet):
+    journal = Journal(capacity=1000)
+    homie = Homie(mqtt, journal=journal)
+    homie.start()
+    stages = [event.entity.device_id for event in journal.read(1) if event.kind == EVENT_DEVICE_STAGE and event.value == 2]
+    assert sorted(stages) == sorted(fleet.device_ids())
+
+    events = []
+    assert homie.attach_journal(events.append, from_sequence=journal.last_sequence + 1)
+    broker.publish('homie/device00001/node0/property1', '42', 1, True)
+    assert [(event.kind, event.previous_value, event.value) for event in events] == [(EVENT_PROPERTY_STATE, '1', '42')]
+    homie.detach_journal(events.append)
+
+    snapshots = []
+    small = Homie(mqtt, journal=Journal(capacity=4))
+    small.start()
+    assert not small.attach_journal(events.append, from_sequence=1, on_snapshot=lambda devices, sequence: snapshots.append((len(devices), sequence)))
+    assert snapshots == [(fleet.devices, small.journal.last_sequence)]
@@ -0,0 +1,49 @@
+"""Tests of the in-process broker stand-in"""
+
+from homie.local_broker import (LocalBroker, LocalClient)
+
+
+def _subscriber(broker, *topics):
+    client = LocalClient(broker, 'subscriber')
+    messages = []
+    client.on_message = lambda _client, _userdata, message: messages.append((message.topic, message.payload, message.qos, message.retain))
+    client.connect()
+    for topic, qos in topics:
+        client.subscribe(topic, qos)
+    return client, messages
+
+
+def test_sends_retained_messages_in_retained_order():
+    broker = LocalBroker()
+    broker.publish('homie/b/$name', 'b', 1, True)
+    broker.publish('homie/a/$name', 'a', 1, True)
+    broker.publish('homie/b/$name', 'b2', 0, True)
+    broker.publish('homie/c/$name', 'c', 1, True)
+    broker.publish('homie/c/$name', '', 1, True)
+    broker.publish('$SYS/uptime', '1', 1, True)
+
+    _, messages = _subscriber(broker, ('#', 1))
+    assert messages == [('homie/b/$name', b'b2', 0, True), ('homie/a/$name', b'a', 1, True)]
+    assert sorted(broker.retained) == ['$SYS/uptime', 'homie/a/$name', 'homie/b/$name']
+
+
+def test_forwards_live_messages_with_the_granted_qos():
+    broker = LocalBroker()
+    client, messages = _subscriber(broker, ('homie/+/$name', 0), ('homie/#', 1))
+    broker.publish('homie/a/$name', 'a', 1, True)
+    broker.publish('other/a', 'a', 1)
+    assert messages == [('homie/a/$name', b'a', 1, False)]
+
+    client.unsubscribe('homie/#')
+    broker.publish('homie/a/$name', 'b', 1)
+    assert messages[-1] == ('homie/a/$name', b'b', 0, False)
+    # Subscribing again replaces the granted qos
+    client.subscribe('homie/+/$name', 1)
+    broker.publish('homie/a/$name', 'c', 1)
+    assert messages[-1] == ('homie/a/$name', b'c', 1, False)
+
+    broker.stop()
+    broker.start()
+    client.connect()
+    broker.publish('homie/a/$name', 'd', 1)
+    assert messages[-1] == ('homie/a/$name', b'c', 1, False)
@@ -0,0 +1,74 @@
+"""Tests of the runtime metrics and their Prometheus output"""
+
+from homie import Homie
+from homie.local_broker import LocalClient
+from homie.paho_mqtt_client_manager import MQTTWrapper
+from homie.tools import (STAGE_0, STAGE_2)
+from homie.tools.metrics import (Histogram, Metrics, NULL_METRICS)
+
+
+def _samples(text: str) -> dict:
+    return dict(line.rsplit(' ', 1) for line in text.splitlines() if not line.startswith('#'))
+
+
+def test_histogram_is_cumulative():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    assert histogram.snapshot() == {'buckets': {0.1: 2, 1.0: 3, float('inf'): 4}, 'sum': 2.65, 'count': 4}
+
+
+def test_prometheus_output():
+    metrics = Metrics(buckets=(0.1,), callbacks_by_topic=True)
+    metrics.message_dispatched(1, 0.05)
+    metrics.message_dispatched(0, 0.5)
+    metrics.callback_called('homie/"quoted"/#', 0.05)
+    metrics.add_collector(lambda: {'dropped': 3, 'queued': 2, 'devices': {STAGE_0: 1, STAGE_2: 4}}, ('dropped',))
+    text = metrics.to_prometheus(prefix='test')
+
+    assert '# TYPE test_messages_received_total counter' in text
+    assert '# TYPE test_dispatch_latency_seconds histogram' in text
+    assert '# TYPE test_dropped_total counter' in text
+    assert '# TYPE test_queued gauge' in text
+    samples = _samples(text)
+    assert samples['test_messages_received_total'] == '2'
+    assert samples['test_messages_unmatched_total'] == '1'
+    assert samples['test_callbacks_total{topic="homie/\\"quoted\\"/#"}'] == '1'
+    assert samples['test_dispatch_latency_seconds_bucket{le="0.1"}'] == '1'
+    assert samples['test_dispatch_latency_seconds_bucket{le="+Inf"}'] == '2'
+    assert samples['test_dispatch_latency_seconds_count'] == '2'
+    assert samples['test_dropped_total'] == '3'
+    assert samples['test_queued'] == '2'
+    assert samples['test_devices{stage="0"}'] == '1'
+    assert samples['test_devices{stage="2"}'] == '4'
+    assert text.endswith('\n')
+    assert NULL_METRICS.to_prometheus() == ''
+
+
+def test_collects_wrapper_and_discovery_metrics(broker):
+    metrics = Metrics()
+    client = LocalClient(broker)
+    mqtt = MQTTWrapper(client, metrics=metrics)
+    client.connect()
+    homie = Homie(mqtt)
+    homie.start()
+    broker.publish('homie/device00001/node0/property1', '42', 1, True)
+    broker.publish('homie/device00001/node0/property1', '42', 1, True)
+    broker.stop()
+    broker.start()
+    client.connect()
+
+    snapshot = metrics.snapshot()
+    assert snapshot['devices'] == {STAGE_0: 0, 1: 0, STAGE_2: 3}
+    assert snapshot['properties'][STAGE_2] == 12
+    assert snapshot['subscriptions'] == len(mqtt.subscriptions)
+    assert snapshot['messages_received'] == snapshot['messages_matched'] > 0
+    assert snapshot['callbacks'] >= snapshot['messages_matched']
+    assert snapshot['reconnects'] == 1
+    assert snapshot['disconnected_seconds'] > 0
+
+    samples = _samples(metrics.to_prometheus())
+    assert samples['homie_reconnects_total'] == '1'
+    assert samples['homie_property_parse_failures_total'] == '0'
+    assert samples['homie_devices{stage="2"}'] == '3'
+    client.disconnect()
@@ -0,0 +1,20 @@
+"""Tests of the Homie device, node and property models"""
+
+import weakref
+
+from homie import Homie
+
+
+def test_models_are_slotted_and_weakly_referenceable(mqtt):
+    homie = Homie(mqtt)
+    homie.start()
+    homie_device = homie.get_device('device00000')
+    homie_node = homie_device.get_node('node0')
+    homie_property = homie_node.get_property('property0')
+
+    for entity in (homie_device, homie_node, homie_property):
+        assert not hasattr(entity, '__dict__')
+        reference = weakref.ref(entity)
+        assert reference() is entity
+    cache = weakref.WeakValueDictionary({homie_property.entity_id: homie_property})
+    assert cache[homie_property.entity_id] is homie_property
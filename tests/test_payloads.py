@@ -0,0 +1,36 @@
+"""Tests of decoding message payloads for subscriptions"""
+
+
+def _subscribe(mqtt, topic, encoding='utf-8'):
+    received = []
+    mqtt.subscribe(topic, lambda _topic, payload, _qos: received.append(payload), 1, encoding)
+    return received
+
+
+def test_memoryview_subscriptions(mqtt, broker):
+    received = _subscribe(mqtt, 'test/#', encoding=None)
+    broker.publish('test/binary', b'\x00\xff', 1)
+
+    assert len(received) == 1
+    assert isinstance(received[0], memoryview)
+    assert received[0].tobytes() == b'\x00\xff'
+
+
+def test_decodes_once_per_encoding(mqtt, broker):
+    first = _subscribe(mqtt, 'test/#')
+    second = _subscribe(mqtt, 'test/+')
+    latin = _subscribe(mqtt, 'test/text', encoding='latin-1')
+    broker.publish('test/text', 'café', 1)
+
+    assert first == second == ['café']
+    assert first[0] is second[0]
+    assert latin == ['cafÃ©']
+
+
+def test_undecodable_payloads_skip_their_subscriptions(mqtt, broker):
+    text = _subscribe(mqtt, 'test/#')
+    raw = _subscribe(mqtt, 'test/#', encoding=None)
+    broker.publish('test/binary', b'\xff', 1)
+
+    assert text == []
+    assert [payload.tobytes() for payload in raw] == [b'\xff']
@@ -0,0 +1,128 @@
+"""Tests of the outbound publish queue of the MQTT wrapper"""
+
+import time
+
+import pytest
+
+from homie.local_broker import LocalClient
+from homie.paho_mqtt_client_manager import MQTTWrapper
+
+TIMEOUT = 5  # seconds
+
+
+class DeferredAckClient(LocalClient):
+    """Local client acknowledging QoS > 0 messages when asked to, like a broker would later on."""
+
+    def __init__(self, broker):
+        super().__init__(broker)
+        self.unacknowledged = []
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        on_publish, self.on_publish = self.on_publish, None
+        try:
+            result, message_id = super().publish(topic, payload, qos, retain)
+        finally:
+            self.on_publish = on_publish
+        if qos > 0:
+            self.unacknowledged.append(message_id)
+        elif self.on_publish:
+            self.on_publish(self, self._userdata, message_id)
+        return result, message_id
+
+    def acknowledge(self):
+        self.on_publish(self, self._userdata, self.unacknowledged.pop(0))
+
+
+@pytest.fixture
+def received(broker):
+    observer = LocalClient(broker, 'observer')
+    messages = []
+    observer.on_message = lambda _client, _userdata, message: messages.append((message.topic, message.payload.decode()))
+    observer.connect()
+    observer.subscribe('test/#', 1)
+    yield messages
+    observer.disconnect()
+
+
+def _wait_for(condition):
+    deadline = time.monotonic() + TIMEOUT
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+def test_coalesces_messages_while_disconnected(broker, received):
+    client = LocalClient(broker)
+    mqtt = MQTTWrapper(client, max_queued_publishes=2)
+    assert mqtt.publish('test/a', '1', 1) is None
+    mqtt.publish('test/b', '1', 1)
+    mqtt.publish('test/a', '2', 1)
+    assert mqtt.queued_publishes == 2
+    assert mqtt._outbound['test/a'].payload == '2'
+    # The oldest topic is dropped, a replaced message keeps its place
+    mqtt.publish('test/c', '1', 1)
+    assert mqtt.dropped_publishes == 1
+
+    client.connect()
+    assert mqtt.queued_publishes == 0
+    assert received == [('test/b', '1'), ('test/c', '1')]
+    client.disconnect()
+
+
+def test_limits_the_rate_of_a_topic(broker, received):
+    client = LocalClient(broker)
+    mqtt = MQTTWrapper(client, topic_rate=10)
+    client.connect()
+    assert mqtt.publish('test/a', '1', 1) is not None
+    assert mqtt.publish('test/a', '2', 1) is None
+    assert mqtt.publish('test/a', '3', 1) is None
+    assert mqtt.publish('test/b', '1', 1) is not None
+    assert received == [('test/a', '1'), ('test/b', '1')]
+
+    _wait_for(lambda: mqtt.queued_publishes == 0)
+    assert received == [('test/a', '1'), ('test/b', '1'), ('test/a', '3')]
+    client.disconnect()
+
+
+def test_limits_the_global_rate(broker, received):
+    client = LocalClient(broker)
+    mqtt = MQTTWrapper(client, global_rate=20)
+    client.connect()
+    for index in range(21):
+        mqtt.publish(f'test/{index}', '1', 0)
+    assert len(received) == 20
+    assert mqtt.queued_publishes == 1
+
+    _wait_for(lambda: mqtt.queued_publishes == 0)
+    assert received[-1] == ('test/20', '1')
+    client.disconnect()
+
+
+def test_limits_the_unacknowledged_messages(broker, received):
+    client = DeferredAckClient(broker)
+    mqtt = MQTTWrapper(client, max_inflight=2)
+    client.connect()
+    mqtt.publish('test/a', '1', 1)
+    mqtt.publish('test/b', '1', 1)
+    mqtt.publish('test/c', '1', 1)
+    # QoS 0 messages aren't acknowledged, they queue behind
+    mqtt.publish('test/d', '1', 0)
+    assert [topic for topic, _ in received] == ['test/a', 'test/b']
+
+    client.acknowledge()
+    assert [topic for topic, _ in received] == ['test/a', 'test/b', 'test/c']
+    client.acknowledge()
+    assert [topic for topic, _ in received] == ['test/a', 'test/b', 'test/c', 'test/d']
+    assert mqtt.queued_publishes == 0
+    client.disconnect()
+
+
+def test_acknowledgements_during_publish_are_not_inflight(broker, received):
+    client = LocalClient(broker)
+    mqtt = MQTTWrapper(client, max_inflight=1)
+    client.connect()
+    for index in range(3):
+        assert mqtt.publish(f'test/{index}', '1', 1) is not None
+    assert len(received) == 3
+    assert not mqtt._inflight
+    client.disconnect()
@@ -0,0 +1,88 @@
+"""Tests of reconnecting to the broker and subscribing again"""
+
+import time
+
+import pytest
+
+from homie import Homie
+from homie.local_broker import LocalClient
+from homie.paho_mqtt_client_manager import (MQTTWrapper, MAX_RECONNECT_WAIT)
+
+RECONNECT_TIMEOUT = 5  # seconds
+
+
+class LoopClient(LocalClient):
+    """Local client reconnected by its network loop, like paho's `loop_forever`."""
+
+    def __init__(self, broker):
+        super().__init__(broker)
+        self.reconnect_delay = None
+
+    def reconnect_delay_set(self, min_delay: int, max_delay: int):
+        self.reconnect_delay = (min_delay, max_delay)
+
+
+def _wait_for(condition):
+    deadline = time.monotonic() + RECONNECT_TIMEOUT
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize('single_subscription', [False, True], ids=['per_device', 'single_subscription'])
+@pytest.mark.parametrize('retained_cache', [False, True], ids=['', 'retained_cache'])
+def test_resubscribes_after_reconnecting(broker, client, single_subscription, retained_cache):
+    mqtt = MQTTWrapper(client, retained_cache=retained_cache)
+    client.connect()
+    homie = Homie(mqtt, single_subscription=single_subscription)
+    homie.start()
+    homie_property = homie.get_device('device00001').get_node('node0').get_property('property1')
+    filters = dict(broker._clients[client])
+
+    broker.stop()
+    assert not mqtt.connected
+    broker.publish('homie/device00001/node0/property1', '42', 1, True)
+    broker.start()
+
+    # Reconnected on a timer thread
+    _wait_for(lambda: mqtt.connected)
+    assert broker._clients[client] == filters
+    # Retained messages are sent again for the new subscriptions
+    assert homie_property.state == '42'
+
+    broker.publish('homie/device00001/node0/property1', '43', 1, True)
+    assert homie_property.state == '43'
+    client.disconnect()
+
+
+def test_reconnects_paho_clients_by_default(broker):
+    client = LoopClient(broker)
+    mqtt = MQTTWrapper(client)
+    client.connect()
+    assert not mqtt.reconnect_in_loop
+    assert client.reconnect_delay is None
+
+    broker.stop()
+    broker.start()
+    _wait_for(lambda: mqtt.connected)
+    client.disconnect()
+
+
+def test_leaves_reconnecting_to_the_client_loop(broker):
+    client = LoopClient(broker)
+    mqtt = MQTTWrapper(client, reconnect_in_loop=True)
+    client.connect()
+    homie = Homie(mqtt)
+    homie.start()
+    assert client.reconnect_delay == (1, MAX_RECONNECT_WAIT)
+
+    broker.stop()
+    assert not mqtt.connected
+    assert mqtt._reconnect_timer is None
+
+    broker.start()
+    client.reconnect()
+    assert mqtt.connected
+    broker.publish('homie/device00002/node1/property0', 'on', 1, True)
+    assert homie.get_device('device00002').get_node('node1').get_property('property0').state == 'on'
+    client.disconnect()
@@ -0,0 +1,66 @@
+"""Tests of serving covered subscriptions from the retained cache"""
+
+import pytest
+
+from homie.paho_mqtt_client_manager import MQTTWrapper
+
+
+@pytest.fixture
+def cached(client):
+    mqtt = MQTTWrapper(client, retained_cache=True)
+    client.connect()
+    yield mqtt
+    client.disconnect()
+
+
+def _subscribe(mqtt, topic):
+    received = []
+    remove, message_id = mqtt.subscribe(topic, lambda topic, payload, _qos: received.append((topic, payload)), 1)
+    return remove, message_id, received
+
+
+def test_serves_covered_subscriptions_from_the_cache(cached, broker, client):
+    _subscribe(cached, 'homie/#')
+    filters = dict(broker._clients[client])
+
+    _, message_id, received = _subscribe(cached, 'homie/device00001/+/$type')
+    assert message_id is None
+    assert broker._clients[client] == filters
+    assert sorted(received) == [('homie/device00001/node0/$type', 'sensor'), ('homie/device00001/node1/$type', 'switch')]
+    assert cached.skipped_subscriptions == 1
+    assert cached.replayed_messages == 2
+
+    # Live messages still reach it, through the covering subscription
+    broker.publish('homie/device00001/node0/$type', 'light', 1, True)
+    assert received[-1] == ('homie/device00001/node0/$type', 'light')
+
+
+def test_asks_the_broker_on_a_cache_miss(cached, broker, client):
+    _subscribe(cached, 'homie/#')
+    # A live message, whether the topic has a retained message is unknown
+    broker.publish('homie/device00001/node0/level', '5', 1)
+
+    for topic in ('homie/device00001/node0/level', 'homie/unknown/#'):
+        _, message_id, _ = _subscribe(cached, topic)
+        assert message_id is not None
+        assert topic in broker._clients[client]
+    assert cached.skipped_subscriptions == 0
+
+
+def test_folds_covered_subscriptions_and_restores_them(cached, broker, client):
+    _, _, nodes = _subscribe(cached, 'homie/device00001/$nodes')
+    assert nodes == [('homie/device00001/$nodes', 'node0,node1')]
+
+    remove, message_id, received = _subscribe(cached, 'homie/device00001/#')
+    assert message_id is not None
+    assert 'homie/device00001/$nodes' not in broker._clients[client]
+    assert 'homie/device00001/#' in broker._clients[client]
+    # The retained message sent again for the new subscription only goes to it
+    assert nodes == [('homie/device00001/$nodes', 'node0,node1')]
+    assert ('homie/device00001/$nodes', 'node0,node1') in received
+    assert cached.skipped_resends == 1
+
+    remove()
+    assert list(broker._clients[client]) == ['homie/device00001/$nodes']
+    broker.publish('homie/device00001/$nodes', 'node0', 1, True)
+    assert nodes[-1] == ('homie/device00001/$nodes', 'node0')
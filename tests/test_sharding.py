@@ -0,0 +1,97 @@
+"""Tests of discovery sharded across worker threads and processes"""
+
+import time
+
+import pytest
+
+from benchmarks.fleet import Fleet
+from homie.local_broker import (LocalBroker, LocalClient)
+from homie.sharding import (ShardCoordinator, MODE_PROCESS, MODE_THREAD, shard_of)
+from homie.tools import STAGE_2
+
+DISCOVERY_TIMEOUT = 5  # seconds
+SHARDS = 2
+
+
+@pytest.fixture
+def coordinator(broker):
+    coordinator = ShardCoordinator(SHARDS, lambda shard: LocalClient(broker, f'shard-{shard}'), mode=MODE_THREAD)
+    coordinator.start()
+    yield coordinator
+    coordinator.stop()
+
+
+def _fleet_client(shard: int) -> LocalClient:
+    # Runs in the worker process, with a broker of its own
+    broker = LocalBroker()
+    for topic, payload in Fleet(devices=4, nodes=1, properties=2).retained_messages():
+        broker.publish(topic, payload, 1, True)
+    return LocalClient(broker, f'shard-{shard}')
+
+
+def _wait_for_devices(coordinator, count: int) -> list:
+    deadline = time.monotonic() + DISCOVERY_TIMEOUT
+    while True:
+        homie_devices = coordinator.devices()
+        if len(homie_devices) == count and all(homie_device.stage_of_discovery == STAGE_2 for homie_device in homie_devices):
+            return homie_devices
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+def test_shards_discover_the_fleet(coordinator, fleet):
+    homie_devices = _wait_for_devices(coordinator, fleet.devices)
+    assert sorted(homie_device.device_id for homie_device in homie_devices) == sorted(fleet.device_ids())
+
+    for shard in range(SHARDS):
+        owned = [device_id for device_id in fleet.device_ids() if shard_of(device_id, SHARDS) == shard]
+        assert sorted(device_snapshot['device']['id'] for device_snapshot in coordinator._request(shard, 'devices')) == owned
+
+
+def test_round_trip(coordinator, broker, fleet):
+    _wait_for_devices(coordinator, fleet.devices)
+    published = []
+    observer = LocalClient(broker)
+    observer.on_message = lambda client, userdata, message: published.append((message.topic, message.payload))
+    observer.connect()
+    observer.subscribe('homie/+/+/+/set')
+
+    homie_device = coordinator.get_device('device00002')
+    homie_property = homie_device.get_node('node0').get_property('property1')
+    assert homie_property.state == '1'
+    homie_property.set_state('on')
+    coordinator.set_state('device00001', 'node1', 'property1', 'off')
+    assert published == [
+        ('homie/device00002/node0/property1/set', b'on'),
+        ('homie/device00001/node1/property1/set', b'off'),
+    ]
+    # Both ways publish without the retain flag
+    assert not [topic for topic in broker.retained if topic.endswith('/set')]
+
+    broker.publish('homie/device00002/node0/property1', '5', 1, True)
+    assert coordinator.get_device('device00002').get_node('node0').get_property('property1').state == '5'
+    assert coordinator.get_device('unknown') is None
+    observer.disconnect()
+
+
+def test_stop(broker):
+    coordinator = ShardCoordinator(SHARDS, lambda shard: LocalClient(broker), mode=MODE_THREAD)
+    coordinator.start()
+    coordinator.stop()
+    assert not any(worker.is_alive() for worker in coordinator._workers)
+    assert not broker._clients
+
+
+def test_process_mode():
+    coordinator = ShardCoordinator(SHARDS, _fleet_client, mode=MODE_PROCESS)
+    coordinator.start()
+    try:
+        homie_devices = _wait_for_devices(coordinator, 4)
+        assert sorted(homie_device.device_id for homie_device in homie_devices) == sorted(Fleet(4, 1, 2).device_ids())
+        assert coordinator.get_device('device00003').get_node('node0').get_property('property1').state == '1'
+        coordinator.set_state('device00003', 'node0', 'property1', 'on')
+        with pytest.raises(Exception, match='failed set_state'):
+            coordinator.set_state('unknown', 'node0', 'property1', 'on')
+    finally:
+        coordinator.stop()
+    assert not any(worker.is_alive() for worker in coordinator._workers)
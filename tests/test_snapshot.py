@@ -0,0 +1,73 @@
+"""Tests of saving and loading discovery snapshots"""
+
+import json
+
+import pytest
+
+from homie import Homie
+from homie.local_broker import (LocalBroker, LocalClient)
+from homie.paho_mqtt_client_manager import MQTTWrapper
+from homie.tools import STAGE_2
+from homie.tools.snapshot import (load_snapshot, save_snapshot)
+from homie.tools.state_store import NumericStateStore
+
+
+@pytest.mark.parametrize('file_name', ['snapshot.json', 'snapshot.json.gz'])
+def test_round_trip(mqtt, broker, fleet, tmp_path, file_name):
+    homie = Homie(mqtt)
+    homie.start()
+    broker.publish('homie/device00001/node0/property1', '42', 1, True)
+    path = str(tmp_path / file_name)
+    homie.save_snapshot(path)
+    assert not (tmp_path / f'{file_name}.tmp').exists()
+
+    # Loaded without any broker messages
+    loaded = Homie(MQTTWrapper(LocalClient(LocalBroker())))
+    events = []
+    loaded.set_on_device_discovery(lambda homie_device, stage: events.append((homie_device.device_id, stage)))
+    loaded.load_snapshot(path)
+
+    assert sorted(homie_device.device_id for homie_device in loaded.devices) == sorted(fleet.device_ids())
+    assert sorted(event for event in events if event[1] == STAGE_2) == [(device_id, STAGE_2) for device_id in sorted(fleet.device_ids())]
+    for homie_device in loaded.devices:
+        original = homie.get_device(homie_device.device_id)
+        assert homie_device.stage_of_discovery == STAGE_2
+        assert homie_device.name == original.name
+        assert [homie_node.node_id for homie_node in homie_device.nodes] == ['node0', 'node1']
+        for homie_node in homie_device.nodes:
+            for homie_property in homie_node.properties:
+                original_property = original.get_node(homie_node.node_id).get_property(homie_property.property_id)
+                assert homie_property.state == original_property.state
+                assert homie_property.settable == original_property.settable
+    assert loaded.get_device('device00001').get_node('node0').get_property('property1').state == '42'
+
+
+def test_other_versions_load_no_devices(tmp_path):
+    path = str(tmp_path / 'snapshot.json')
+    save_snapshot(path, [{'id': 'device'}])
+    assert load_snapshot(path) == [{'id': 'device'}]
+
+    with open(path, 'w') as snapshot_file:
+        json.dump({'version': 0, 'devices': [{'id': 'device'}]}, snapshot_file)
+    assert load_snapshot(path) == []
+
+
+def test_restored_states_are_not_recorded(mqtt, tmp_path):
+    path = str(tmp_path / 'snapshot.json')
+    homie = Homie(mqtt)
+    homie.start()
+    homie.save_snapshot(path)
+
+    store = NumericStateStore()
+    broker = LocalBroker()
+    client = LocalClient(broker)
+    loaded = Homie(MQTTWrapper(client), state_store=store)
+    loaded.load_snapshot(path)
+    assert store.properties() == []
+
+    client.connect()
+    loaded.start()
+    broker.publish('homie/device00001/node0/property1', '42', 1, True)
+    homie_property = loaded.get_device('device00001').get_node('node0').get_property('property1')
+    assert store.properties() == [homie_property]
+    assert list(store.history_of(homie_property)[0]) == [42.0]
@@ -0,0 +1,89 @@
+"""Tests of the numeric state store, with and without NumPy"""
+
+import importlib.util
+import math
+
+import attr
+import pytest
+
+from homie import Homie
+from homie.tools.state_store import NumericStateStore
+
+BACKENDS = pytest.mark.parametrize('use_numpy', [
+    pytest.param(False, id='array'),
+    pytest.param(True, id='numpy', marks=pytest.mark.skipif(importlib.util.find_spec('numpy') is None, reason="NumPy is not installed")),
+])
+
+
+@attr.s(frozen=True)
+class _Property(object):
+    property_id = attr.ib(type=str)
+    device_id = attr.ib(type=str)
+
+
+@BACKENDS
+def test_ring_wraps_around(use_numpy):
+    store = NumericStateStore(history=4, capacity=2, use_numpy=use_numpy)
+    temperature = _Property('temperature', 'device')
+    for index in range(6):
+        store.record(temperature, str(index), timestamp=100.0 + index)
+
+    values, timestamps = store.history_of(temperature)
+    assert list(values) == [2.0, 3.0, 4.0, 5.0]
+    assert list(timestamps) == [102.0, 103.0, 104.0, 105.0]
+    assert list(store.latest()) == [5.0]
+    assert [list(vector) for vector in store.window(seconds=1.5, now=105.0)] == [[4.0], [5.0], [4.5]]
+
+
+@BACKENDS
+def test_history_before_the_ring_is_full(use_numpy):
+    store = NumericStateStore(history=4, capacity=1, use_numpy=use_numpy)
+    switch = _Property('switch', 'device')
+    store.record(switch, 'true', timestamp=1.0)
+    store.record(switch, 'false', timestamp=2.0)
+    store.record(switch, 'unknown', timestamp=3.0)
+
+    values, timestamps = store.history_of(switch)
+    assert list(values) == [1.0, 0.0]
+    assert list(timestamps) == [1.0, 2.0]
+    assert store.parse_failures == 1
+
+
+@BACKENDS
+def test_rows_grow_and_are_reused(use_numpy):
+    store = NumericStateStore(history=2, capacity=1, use_numpy=use_numpy)
+    properties = [_Property('level', f'device{index}') for index in range(3)]
+    for index, homie_property in enumerate(properties):
+        store.record(homie_property, str(index), timestamp=1.0)
+    assert list(store.latest('level')) == [0.0, 1.0, 2.0]
+
+    store.remove(properties[:1])
+    assert store.properties() == properties[1:]
+    replacement = _Property('level', 'device3')
+    store.record(replacement, '3', timestamp=2.0)
+    assert store.properties('level') == [properties[1], properties[2], replacement]
+    assert store.properties()[0] is replacement
+    assert list(store.history_of(replacement)[0]) == [3.0]
+    minimums, _, _ = store.window([properties[1]], seconds=0.5, now=2.0)
+    assert math.isnan(minimums[0])
+
+
+def test_homie_records_property_states(mqtt, broker):
+    store = NumericStateStore(history=4)
+    homie = Homie(mqtt, state_store=store)
+    homie.start()
+    homie_property = homie.get_device('device00001').get_node('node0').get_property('property1')
+
+    broker.publish('homie/device00001/node0/property1', '42', 1, True)
+    assert list(store.history_of(homie_property)[0]) == [1.0, 42.0]
+
+
+@BACKENDS
+def test_records_converted_values(use_numpy):
+    store = NumericStateStore(history=4, use_numpy=use_numpy)
+    level = _Property('level', 'device')
+    for timestamp, value in enumerate((True, 3, 2.5, (1, 2, 3), None)):
+        store.record(level, value, timestamp=float(timestamp))
+
+    assert list(store.history_of(level)[0]) == [1.0, 3.0, 2.5]
+    assert store.parse_failures == 2
@@ -0,0 +1,98 @@
+"""Tests of the topic filter trie of MQTTWrapper"""
+
+import pytest
+
+from homie.local_broker import (LocalBroker, LocalClient)
+from homie.paho_mqtt_client_manager import (MQTTWrapper, Subscription, SubscriptionTrie)
+
+
+def _trie(*topics, qos: int=0) -> SubscriptionTrie:
+    trie = SubscriptionTrie()
+    for topic in topics:
+        trie.add(Subscription(topic, None, qos))
+    return trie
+
+
+def _topics(subscriptions) -> list:
+    return sorted(subscription.topic for subscription in subscriptions)
+
+
+@pytest.mark.parametrize('topic, expected', [
+    ('homie/device/$homie', ['homie/#', 'homie/+/$homie', 'homie/device/$homie']),
+    ('homie/device/node/property', ['homie/#', 'homie/device/+/property']),
+    ('homie/device', ['homie/#']),
+    ('homie', ['homie/#']),
+    ('other/device/$homie', []),
+])
+def test_match(topic, expected):
+    trie = _trie('homie/#', 'homie/+/$homie', 'homie/device/$homie', 'homie/device/+/property')
+    assert _topics(trie.match(topic)) == expected
+
+
+def test_match_skips_wildcards_on_dollar_topics():
+    trie = _trie('#', '+/status', '$SYS/#')
+    assert _topics(trie.match('$SYS/status')) == ['$SYS/#']
+    assert _topics(trie.match('broker/status')) == ['#', '+/status']
+
+
+def test_remove_prunes_empty_branches():
+    trie = _trie('homie/device/$homie', 'homie/device/$nodes')
+    subscription = Subscription('homie/device/$homie', None)
+    trie.remove(subscription)
+    assert not trie.has_topic('homie/device/$homie')
+    assert trie.has_topic('homie/device/$nodes')
+
+    trie.remove(Subscription('homie/device/$nodes', None))
+    assert trie.children == {}
+
+
+def test_wrapper_dispatches_through_the_trie():
+    client = LocalClient(LocalBroker())
+    mqtt = MQTTWrapper(client)
+    client.connect()
+    received = []
+    remove_all, _ = mqtt.subscribe('homie/#', lambda topic, payload, qos: received.append(('all', topic, payload)), 0)
+    remove_one, _ = mqtt.subscribe('homie/+/$homie', lambda topic, payload, qos: received.append(('one', topic, payload)), 0)
+
+    client.publish('homie/device/$homie', '2.0.1')
+    client.publish('homie/device/$name', 'Device')
+    assert sorted(received) == [('all', 'homie/device/$homie', '2.0.1'), ('all', 'homie/device/$name', 'Device'),
+                                ('one', 'homie/device/$homie', '2.0.1')]
+
+    received.clear()
+    remove_all()
+    client.publish('homie/device/$homie', '2.0.1')
+    assert received == [('one', 'homie/device/$homie', '2.0.1')]
+    with pytest.raises(Exception):
+        remove_all()
+    remove_one()
+    assert mqtt.subscriptions == []
+
+
+@pytest.mark.parametrize('topic, covered', [
+    ('homie/device/$nodes', True),
+    ('homie/device/+/$properties', True),
+    ('homie/device/#', True),
+    ('homie/other/$nodes', False),
+    ('homie/#', False),
+])
+def test_covers(topic, covered):
+    assert _trie('homie/device/#').covers(topic) == covered
+
+
+def test_covers_needs_the_qos():
+    trie = _trie('homie/device/#', qos=0)
+    assert not trie.covers('homie/device/$nodes', 1)
+    assert trie.covers('homie/device/$nodes', 0)
+
+
+def test_covers_without_exact_ignores_the_same_filter():
+    trie = _trie('homie/device/#')
+    assert trie.covers('homie/device/#')
+    assert not trie.covers('homie/device/#', exact=False)
+
+
+def test_covered_by():
+    trie = _trie('homie/+/$homie', 'homie/device/$nodes', 'homie/device/node/$properties', 'homie/other/$nodes')
+    assert _topics(trie.covered_by('homie/device/#')) == ['homie/device/$nodes', 'homie/device/node/$properties']
+    assert _topics(trie.covered_by('homie/+/$nodes')) == ['homie/device/$nodes', 'homie/other/$nodes']